@@ -0,0 +1,82 @@
+"""Benchmark writing a journal session's temporary copy back to the journal directory
+
+Compares clerk's `write_back` (rename when on the same filesystem, kernel copy
+otherwise) against the previous behaviour of two unconditional `shutil.copy`
+calls per session.
+
+    $ python benchmarks/bench_write_back.py --size-mb 8 --repeat 20
+"""
+import argparse
+import pathlib
+import shutil
+import tempfile
+import time
+
+from clerk.files import write_back
+
+
+def legacy_write_back(source: pathlib.Path, destination: pathlib.Path) -> None:
+    """Copy back the way open_journal used to: after saving, then after closing"""
+    shutil.copy(source, destination)
+    shutil.copy(source, destination)
+    source.unlink()
+
+
+def move_write_back(source: pathlib.Path, destination: pathlib.Path) -> None:
+    """Rename the temporary copy into place"""
+    write_back(source, destination, move=True)
+
+
+def copy_write_back(source: pathlib.Path, destination: pathlib.Path) -> None:
+    """Copy into a sibling file and rename it into place"""
+    write_back(source, destination)
+    source.unlink()
+
+
+STRATEGIES = {
+    "legacy (2x shutil.copy)": legacy_write_back,
+    "write_back(move=True)": move_write_back,
+    "write_back(move=False)": copy_write_back,
+}
+
+
+def run(size_mb: int, repeat: int, journal_directory: str, temp_directory: str):
+    """Time each strategy over `repeat` sessions, returning the mean in seconds"""
+    payload = b"lorem ipsum dolor sit amet\n" * (size_mb * (1 << 20) // 27)
+    results = {}
+    for name, strategy in STRATEGIES.items():
+        destination = pathlib.Path(journal_directory, "2021-01-04.md")
+        destination.write_bytes(payload)
+        elapsed = 0.0
+        for _ in range(repeat):
+            source = pathlib.Path(temp_directory, "2021-01-04.md")
+            source.write_bytes(payload)
+            start = time.perf_counter()
+            strategy(source, destination)
+            elapsed += time.perf_counter() - start
+        results[name] = elapsed / repeat
+    return results
+
+
+def main() -> int:
+    """Benchmark entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--journal-directory", help="e.g. a network mount")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temp_directory:
+        with tempfile.TemporaryDirectory() as journal_directory:
+            results = run(
+                args.size_mb,
+                args.repeat,
+                args.journal_directory or journal_directory,
+                temp_directory,
+            )
+    for name, seconds in results.items():
+        print(f"{name:<26} {seconds * 1000:8.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
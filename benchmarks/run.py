@@ -0,0 +1,287 @@
+"""Benchmark suite for clerk
+
+Measures startup, date parsing, `open_journal` end to end (with a no-op
+editor), hook chains and large journal directories over synthetic data, and
+compares the results against a saved baseline. Nothing touches the network or
+your real journals.
+
+    $ python -m benchmarks.run --output results.json
+    $ python -m benchmarks.run --save-baseline baseline.json
+    $ python -m benchmarks.run --baseline baseline.json --threshold 1.25
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+
+from benchmarks import synthetic
+
+
+KB = 1024
+MB = 1024 * KB
+PROFILES = {
+    "quick": {
+        "directory_sizes": [1000, 10000],
+        "journal_sizes": [KB, MB],
+        "chain_lengths": [1, 5, 20],
+        "repeat": 5,
+    },
+    "full": {
+        "directory_sizes": [1000, 10000, 100000],
+        "journal_sizes": [KB, MB, 10 * MB, 100 * MB],
+        "chain_lengths": [1, 2, 5, 10, 20],
+        "repeat": 10,
+    },
+}
+REPOSITORY = pathlib.Path(__file__).parents[1]
+
+
+def measure(function: Callable, repeat: int, setup: Callable = None) -> Dict:
+    """Time a function over several runs, returning the median and spread in seconds"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "seconds": statistics.median(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "runs": repeat,
+    }
+
+
+def bench_startup(profile: Dict, results: Dict) -> None:
+    """Cold (empty user data directory) and warm runs of `journal` in a fresh interpreter"""
+    with tempfile.TemporaryDirectory() as home:
+        journals = pathlib.Path(home, "journals")
+        journals.mkdir()
+        pathlib.Path(home, ".clerkrc").write_text(
+            f"[DEFAULT]\njournal_directory={journals}\npreferred_editor=true\n"
+            "date_format=%%Y-%%m-%%d\nfile_extension=md\n"
+        )
+        data = pathlib.Path(home, "data")
+        env = dict(
+            os.environ,
+            HOME=home,
+            XDG_DATA_HOME=str(data),
+            PYTHONPATH=str(REPOSITORY),
+        )
+        command = [sys.executable, "-c", "from clerk.app import main; main()"]
+
+        def run():
+            """Open today's journal with a no-op editor"""
+            subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+
+        def clear_caches():
+            """Empty the user data directory (plugin registry, catalog and so on)"""
+            import shutil
+
+            shutil.rmtree(data, ignore_errors=True)
+            pathlib.Path(data, "clerk").mkdir(parents=True)
+
+        results["startup/cold"] = measure(run, profile["repeat"], clear_caches)
+        results["startup/warm"] = measure(run, profile["repeat"])
+
+
+def bench_parse(profile: Dict, results: Dict) -> None:
+    """Date expression parsing, one at a time (uncached) and in bulk"""
+    from clerk import parse
+
+    phrases = ["today", "last monday", "three weeks ago", "twenty one days from now"]
+    expressions = [f"{n} days ago" for n in range(1000)] + phrases * 2500
+
+    def one_at_a_time():
+        """Parse each phrase with a cold cache"""
+        for phrase in phrases:
+            parse.resolve_offset.cache_clear()
+            parse.parse_english_to_date(phrase)
+
+    results["parse/single"] = measure(one_at_a_time, profile["repeat"])
+    results["parse/many-11000"] = measure(
+        lambda: parse.parse_many(expressions),
+        profile["repeat"],
+        parse.resolve_offset.cache_clear,
+    )
+
+
+def bench_open_journal(profile: Dict, results: Dict) -> None:
+    """`open_journal` end to end with a no-op editor, over journals of several sizes"""
+    from clerk.app import Application
+
+    for size in profile["journal_sizes"]:
+        with tempfile.TemporaryDirectory() as journals:
+            with tempfile.TemporaryDirectory() as data:
+                pathlib.Path(journals, "2021-01-04.md").write_text(
+                    synthetic.journal_text(size)
+                )
+                app = Application(synthetic.make_config(journals), data, {})
+                results[f"open_journal/{size // KB}KB"] = measure(
+                    lambda: app.open_journal("2021-01-04.md"), profile["repeat"]
+                )
+
+
+def bench_hook_chains(profile: Dict, results: Dict) -> None:
+    """Chains of synthetic plugins over a 1MB journal"""
+    from clerk.app import Application
+
+    for length in profile["chain_lengths"]:
+        extensions = synthetic.synthetic_extensions(length)
+        config = synthetic.make_config("", {"JOURNAL_OPENED": list(extensions)})
+        with tempfile.TemporaryDirectory() as journals:
+            with tempfile.TemporaryDirectory() as data:
+                config["DEFAULT"]["journal_directory"] = journals
+                app = Application(config, data, extensions)
+                journal = pathlib.Path(journals, "2021-01-04.md")
+                text = synthetic.journal_text(MB)
+                results[f"hooks/chain-{length}"] = measure(
+                    lambda: app._apply_callbacks_for_hook("JOURNAL_OPENED", journal),
+                    profile["repeat"],
+                    lambda: journal.write_text(text),
+                )
+
+
+def bench_journal_directories(profile: Dict, results: Dict) -> None:
+    """Cataloging, search indexing and statistics of large journal directories"""
+    from clerk.app import Application
+    from clerk.catalog import Catalog
+    from clerk.catalog import catalog_path
+    from clerk.search import SearchIndex
+    from clerk.stats import StatsCache
+    from clerk.stats import stats_path
+
+    for count in profile["directory_sizes"]:
+        with tempfile.TemporaryDirectory() as journals:
+            with tempfile.TemporaryDirectory() as data:
+                synthetic.make_journal_directory(pathlib.Path(journals), count)
+                app = Application(synthetic.make_config(journals), data, {})
+                results[f"catalog/cold-{count}"] = measure(
+                    lambda: Catalog(app).close(),
+                    profile["repeat"],
+                    lambda: catalog_path(data).unlink(missing_ok=True),
+                )
+                results[f"catalog/warm-{count}"] = measure(
+                    lambda: Catalog(app).close(), profile["repeat"]
+                )
+                catalog = Catalog(app)
+                first = synthetic.FIRST_DAY + datetime.timedelta(days=count // 4)
+                last = synthetic.FIRST_DAY + datetime.timedelta(days=count // 2)
+                results[f"catalog/range-{count}"] = measure(
+                    lambda: catalog.between(first, last), profile["repeat"]
+                )
+                with SearchIndex(app) as index:
+                    start = time.perf_counter()
+                    index.rescan()
+                    results[f"search/build-{count}"] = {
+                        "seconds": time.perf_counter() - start,
+                        "runs": 1,
+                    }
+                    results[f"search/rescan-{count}"] = measure(
+                        index.rescan, profile["repeat"]
+                    )
+                    results[f"search/query-{count}"] = measure(
+                        lambda: index.search("walk book"), profile["repeat"]
+                    )
+
+                def report():
+                    """Refresh the statistics cache and build a report"""
+                    with StatsCache(app) as cache:
+                        cache.refresh()
+                        cache.report()
+
+                results[f"stats/cold-{count}"] = measure(
+                    report,
+                    min(3, profile["repeat"]),
+                    lambda: stats_path(data).unlink(missing_ok=True),
+                )
+                results[f"stats/warm-{count}"] = measure(report, profile["repeat"])
+
+
+def bench_write_back(profile: Dict, results: Dict) -> None:
+    """Writing a session's temporary copy back, against the previous behaviour"""
+    from benchmarks.bench_write_back import run
+
+    with tempfile.TemporaryDirectory() as journals:
+        with tempfile.TemporaryDirectory() as data:
+            timings = run(8, profile["repeat"], journals, data)
+    for name, seconds in timings.items():
+        results[f"write_back/{name}"] = {"seconds": seconds, "runs": profile["repeat"]}
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "parse": bench_parse,
+    "open_journal": bench_open_journal,
+    "hooks": bench_hook_chains,
+    "directories": bench_journal_directories,
+    "write_back": bench_write_back,
+}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Names of benchmarks more than `threshold` times slower than the baseline"""
+    return [
+        name
+        for name, result in results.items()
+        if name in baseline
+        and result["seconds"] > baseline[name]["seconds"] * threshold
+    ]
+
+
+def main() -> int:
+    """Benchmark suite entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=PROFILES, default="quick")
+    parser.add_argument("--only", choices=BENCHMARKS, action="append")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--save-baseline", help="write results as a new baseline")
+    parser.add_argument("--baseline", help="compare against this baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=1.25, help="allowed slowdown factor"
+    )
+    args = parser.parse_args()
+
+    profile = PROFILES[args.profile]
+    results: Dict[str, Dict] = {}
+    for name in args.only or BENCHMARKS:
+        print(f"running {name} benchmarks...", file=sys.stderr)
+        with contextlib.redirect_stdout(io.StringIO()):  # plugins report each run
+            BENCHMARKS[name](profile, results)
+    for name, result in results.items():
+        print(f"{name:<48} {result['seconds'] * 1000:10.3f} ms")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "profile": args.profile,
+        "results": results,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+        regressed = compare(results, baseline, args.threshold)
+        for name in regressed:
+            print(f"REGRESSION: {name} is over {args.threshold}x its baseline")
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,61 @@
+"""Synthetic journals, journal directories and plugins for benchmarking clerk"""
+import datetime
+import pathlib
+from typing import Dict
+from typing import List
+
+from clerk.extensions import Extension
+
+
+LINE = "Went for a walk, wrote some code, read a chapter of a book. #daily\n"
+FIRST_DAY = datetime.date(1990, 1, 1)
+
+
+def journal_text(size: int) -> str:
+    """A journal of roughly `size` bytes"""
+    return "# Journal\n" + LINE * max(size // len(LINE), 1)
+
+
+def make_journal_directory(directory: pathlib.Path, count: int, size: int = 1024):
+    """Fill a directory with `count` consecutive daily journals of `size` bytes"""
+    text = journal_text(size)
+    for day in range(count):
+        name = f"{(FIRST_DAY + datetime.timedelta(days=day)).isoformat()}.md"
+        pathlib.Path(directory, name).write_text(text)
+
+
+def make_config(journal_directory: pathlib.Path, hooks: Dict[str, List[str]] = None):
+    """A clerk config for benchmarking, using a no-op editor"""
+    config = {
+        "DEFAULT": {
+            "journal_directory": str(journal_directory),
+            "preferred_editor": "true",
+            "date_format": "%Y-%m-%d",
+            "file_extension": "md",
+        }
+    }
+    if hooks:
+        config["hooks"] = {
+            hook_name: "\n" + "\n".join(names) for hook_name, names in hooks.items()
+        }
+    return config
+
+
+def append_line(lines: List[str], conf) -> List[str]:
+    """A plugin that appends a line, like clerk-timestamp"""
+    return lines + ["appended by a synthetic plugin\n"]
+
+
+def noop(lines: List[str], conf) -> None:
+    """A plugin that makes no changes"""
+    return None
+
+
+def synthetic_extensions(count: int, callback: str = "append_line") -> Dict:
+    """`count` installed plugins, each pointing at one of this module's callbacks"""
+    return {
+        f"synthetic-{i}": Extension(
+            f"synthetic-{i}", f"benchmarks.synthetic:{callback}"
+        )
+        for i in range(count)
+    }
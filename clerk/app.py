@@ -1,46 +1,114 @@
 """Main application logic"""
 import datetime
 import os
-import hashlib
-import importlib.metadata
 import pathlib
-import shutil
-import subprocess
 import sys
+import threading
 from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
 from typing import Sequence
 from typing import Mapping
+from typing import NamedTuple
+from typing import Tuple
 
+from clerk.cache import DEFAULT_SIZE_MB
+from clerk.cache import DEFAULT_TTL
+from clerk.cache import ResultCache
+from clerk.cache import cache_path
 from clerk.config import config_file_path
 from clerk.config import temp_directory_path
+from clerk.config import get_boolean
 from clerk.config import get_config
+from clerk.config import get_float
+from clerk.config import hook_plugin_names
+from clerk.edits import Document
+from clerk.extensions import load_extensions
+from clerk.files import FileSnapshot
+from clerk.files import has_changed
+from clerk.files import sibling_path
+from clerk.files import take_snapshot
+from clerk.files import write_back
+from clerk.hooks import is_deferred
+from clerk.hooks import run_document
+from clerk.layout import layout_filename
+from clerk.layout import normalize_layout
 from clerk.parse import parse_english_to_date
+from clerk import profiling
+from clerk.profiling import span
+
+
+def create_application() -> "Application":
+    """Create an Application from the user's config and installed plugins"""
+    with span("config"):
+        config = get_config()
+    user_data_directory = temp_directory_path()
+    with span("plugin discovery"):
+        # only the plugins named in the [hooks] section are resolved
+        _extensions = load_extensions(config, user_data_directory)
+    return Application(config, user_data_directory, _extensions)
 
 
 def main() -> int:
     """Main application entrypoint"""
+    args = sys.argv[1:]
+    profile_format = None
+    for arg in [arg for arg in args if arg.startswith("--profile")]:
+        args.remove(arg)  # --profile or --profile=trace
+        profile_format = arg.partition("=")[2] or "json"
+    profiling.start(profile_format)  # with no --profile, honours CLERK_PROFILE
     try:
-        eps = importlib.metadata.entry_points()["clerk.extensions"]
-        # https://youtu.be/fY3Y_xPKWNA?t=717
-        _extensions = {entrypoint.name: entrypoint for entrypoint in eps}
-    except KeyError:
-        # no plugins installed
-        _extensions = {}
-
-    config = get_config()
-    user_data_directory = temp_directory_path()
-    app = Application(config, user_data_directory, _extensions)
+        with span("session"):
+            return open_journals(args)
+    finally:
+        profiling.stop(temp_directory_path())
+
+
+def open_journals(args: Sequence[str]) -> int:
+    """Open the journal(s) described by the command line arguments"""
+    from clerk.daemon import run_client
+
+    batch = "--batch" in args  # open every selected journal in one editor
+    args = [arg for arg in args if arg != "--batch"]
+
+    with span("daemon"):
+        status = run_client(args, temp_directory_path(), batch)
+    if status is not None:
+        return status
+    app = create_application()
 
     # main loop
-    day = "today"  # default to today's journal
-    if len(sys.argv) > 1:
-        day = " ".join(sys.argv[1:])  # parse date and open that journal
-    target_date = parse_english_to_date(day)
-    date_as_filename = app.convert_to_filename(target_date)
-    app.open_journal(date_as_filename)
+    filenames = app.select_journals(args)
+    if not filenames:
+        print(f"No journals found for '{' '.join(args)}'")
+        return 1
+    if batch and len(filenames) > 1:
+        app.open_batch(filenames)
+        return 0
+    for i, filename in enumerate(filenames):
+        app.may_hand_off = (
+            i == len(filenames) - 1
+        )  # nothing's left to do after the last
+        app.open_journal(filename)
     return 0
 
 
+def report_editor_error(error: OSError) -> None:
+    """Tell the user their editor couldn't be started"""
+    print(
+        f"Couldn't start your editor ({error}); please check preferred_editor in your configuration at {config_file_path()}"
+    )
+
+
+class JournalSession(NamedTuple):
+    """A journal prepared for editing, as of when the editor was started"""
+
+    filename: str
+    snapshot: FileSnapshot
+    modified: bool
+
+
 class Application:
     """Application class"""
 
@@ -57,94 +125,351 @@ class Application:
         self.preferred_editor = self.config["DEFAULT"]["preferred_editor"]
         self.date_format = self.config["DEFAULT"]["date_format"]
         self.file_extension = self.config["DEFAULT"]["file_extension"]
+        self.layout = normalize_layout(self.config["DEFAULT"].get("layout", ""))
+        self.fsync = get_boolean(self.config["DEFAULT"], "fsync")
+        self.live_sync = get_boolean(self.config["DEFAULT"], "live_sync")
+        self.live_sync_debounce = get_float(
+            self.config["DEFAULT"], "live_sync_debounce", 0.5
+        )
+        self.locks: Dict = {}  # filename -> JournalLock, while a journal is open
+        # live syncs swap sys.stdout (process-wide) while plugins run, so take turns
+        self._sync_lock = threading.Lock()
+        # exec the editor when there's nothing to do after it (see clerk.handoff)
+        self.may_hand_off = False
         self.hooks = {
-            "NEW_JOURNAL_CREATED": self._get_callbacks_for_hook("NEW_JOURNAL_CREATED"),
-            "JOURNAL_OPENED": self._get_callbacks_for_hook("JOURNAL_OPENED"),
-            "JOURNAL_SAVED": self._get_callbacks_for_hook("JOURNAL_SAVED"),
-            "JOURNAL_CLOSED": self._get_callbacks_for_hook("JOURNAL_CLOSED"),
+            hook_name: self._get_callbacks_for_hook(plugin_names)
+            for hook_name, plugin_names in hook_plugin_names(self.config).items()
         }
         if not pathlib.Path(self.journal_directory).is_dir():
             raise FileNotFoundError(
                 f"Your journal_directory ({self.journal_directory}) doesn't exist. Please create this directory and try again"
             )
+        cache_ttl = get_float(self.config["DEFAULT"], "hook_cache_ttl", DEFAULT_TTL)
+        cache_mb = get_float(self.config["DEFAULT"], "hook_cache_size", DEFAULT_SIZE_MB)
+        self.result_cache = ResultCache(
+            cache_path(user_data_directory), cache_ttl, int(cache_mb * 1024 * 1024)
+        )
 
-    def _get_callbacks_for_hook(self, hook_name: str) -> Sequence[Callable]:
-        """Gather callback functions for a specified hook"""
-        if "hooks" not in self.config:
-            return []
-        if hook_name not in self.config["hooks"]:
-            return []
+    def _get_callbacks_for_hook(
+        self, plugin_names: Sequence[str]
+    ) -> Sequence[Callable]:
+        """Gather callback functions for the plugins configured on a hook"""
         try:
-            return [
-                self.extensions[ext_name]
-                for ext_name in self.config["hooks"][hook_name].split("\n")
-                if ext_name != ""
-            ]
+            return [self.extensions[ext_name] for ext_name in plugin_names]
         except KeyError as e:
             print(
                 f"Couldn't find plugin '{e.args[0]}' installed; please check your configuration at {config_file_path()}"
             )
             exit(1)
 
-    def _apply_callbacks_for_hook(self, hook_name: str, filename: pathlib.Path):
-        """Apply the callbacks for a specified hook to a specified file"""
-        with open(filename, "r+") as f:
-            for callback in self.hooks[hook_name]:
-                f.seek(0)
-                data = f.readlines()
-                conf = (
-                    self.config[callback.name] if callback.name in self.config else {}
+    def _apply_callbacks_for_hook(
+        self,
+        hook_name: str,
+        filename: pathlib.Path,
+        deferred: Optional[List[Tuple[str, str]]] = None,
+    ) -> bool:
+        """Apply the callbacks for a specified hook to a specified file, returning whether it changed
+
+        If a `deferred` list is passed, callbacks configured with `hook_deferred`
+        are skipped and recorded there as (hook name, plugin name) instead.
+        """
+        extensions = self.hooks[hook_name]
+        if deferred is not None:
+            postponed = [
+                e for e in extensions if is_deferred(hook_name, e, self.config)
+            ]
+            deferred.extend((hook_name, e.name) for e in postponed)
+            extensions = [e for e in extensions if e not in postponed]
+        if not extensions:
+            return False
+        with span(hook_name, "hook"):
+            with Document(filename) as document:
+                changed = run_document(
+                    extensions, document, self.config, self.result_cache
                 )
-                results = callback.load()(data, conf)
-                if results:
-                    f.seek(0)
-                    f.writelines(results)
-                    print(f"{callback.name} ran; changes applied!")
-                else:
-                    print(f"{callback.name} ran; no changes made")
-                f.truncate()
+                document.save()
+        return changed
+
+    def prepare_journal(self, filename: str) -> "JournalSession":
+        """Copy a journal into the user data directory for editing, running the NEW_JOURNAL_CREATED and JOURNAL_OPENED hooks"""
+        import shutil  # imported here to keep `journal` startup fast
+
+        from clerk.locks import JournalLock
+        from clerk.locks import JournalLocked
 
-    def open_journal(self, filename: str):
-        """Opens the specified journal for writing, calling appropriate Hooks along the way, and handles eventual write or discard."""
         file_to_open: pathlib.Path = pathlib.Path(self.journal_directory, filename)
         temporary_copy: pathlib.Path = pathlib.Path(self.temp_directory, filename)
-        if temporary_copy.exists():
-            print("File already open!")
+        lock = JournalLock(self.temp_directory, filename)
+        try:
+            lock.acquire(wait=1.0)  # in case a session is just finishing up
+        except JournalLocked as e:
+            print(f"File already open! ({e})" if e.owner else "File already open!")
             exit(1)
         else:
+            if lock.recovered is not None:
+                print(
+                    f"{filename} was left open by a session that didn't finish; its unsaved copy was moved to {lock.recovered}"
+                )
+            self.locks[filename] = lock
+            if "/" in filename:  # filed in a shard (see clerk.layout)
+                temporary_copy.parent.mkdir(parents=True, exist_ok=True)
+                file_to_open.parent.mkdir(parents=True, exist_ok=True)
             f = open(temporary_copy, "a")
             f.write("")
             f.close()
-        if not pathlib.Path(file_to_open).exists():
+        # the journal is written back at most once, and only if something changed
+        modified = not file_to_open.exists()
+        if modified and self._extract_archived(filename, temporary_copy):
+            modified = False  # if it's edited, it's written back as a loose file
+        elif modified:
             self._apply_callbacks_for_hook("NEW_JOURNAL_CREATED", temporary_copy)
         else:
             shutil.copy(file_to_open, temporary_copy)
 
-        self._apply_callbacks_for_hook("JOURNAL_OPENED", temporary_copy)
+        modified |= self._apply_callbacks_for_hook("JOURNAL_OPENED", temporary_copy)
+
+        with span("change detection"):
+            snapshot = take_snapshot(temporary_copy)
+        return JournalSession(filename, snapshot, modified)
+
+    def _extract_archived(self, filename: str, temporary_copy: pathlib.Path) -> bool:
+        """Copy a journal out of the archive, if it's there"""
+        from clerk.archive import extract_journal
+
+        return extract_journal(self.journal_directory, filename, temporary_copy)
+
+    def editor_command(self, *filenames: str) -> List[str]:
+        """The command line that opens prepared journals in the user's editor"""
+        import shlex
+
+        editor = [os.path.expandvars(arg) for arg in shlex.split(self.preferred_editor)]
+        return editor + [
+            str(pathlib.Path(self.temp_directory, filename)) for filename in filenames
+        ]
+
+    def run_editor(self, command: List[str]) -> None:
+        """Run the editor (without a shell), waiting for it to exit"""
+        import subprocess
+
+        try:
+            subprocess.run(command)
+        except OSError as e:
+            report_editor_error(e)
 
-        old_hash = get_file_hash(temporary_copy)
-        run_str = f"{self.preferred_editor} " + str(temporary_copy).replace(" ", "\\ ")
-        subprocess.run(run_str, shell=True)
-        new_hash = get_file_hash(temporary_copy)
+    def can_hand_off(self, session: "JournalSession") -> bool:
+        """Whether `journal` can exec the editor, leaving only the copy-back to do afterwards"""
+        from clerk.handoff import can_hand_off
 
-        if old_hash != new_hash:
-            self._apply_callbacks_for_hook("JOURNAL_SAVED", temporary_copy)
-            shutil.copy(temporary_copy, file_to_open)
+        journal = pathlib.Path(self.journal_directory, session.filename)
+        return (
+            self.may_hand_off
+            and not self.hooks.get("JOURNAL_SAVED")
+            and not self.hooks.get("JOURNAL_CLOSED")
+            and not self.live_sync
+            and not self.fsync
+            and not profiling.is_profiling()
+            # an untouched archived journal mustn't be written back as a loose file
+            and (session.modified or journal.exists())
+            and can_hand_off()
+        )
 
-        self._apply_callbacks_for_hook("JOURNAL_CLOSED", temporary_copy)
-        shutil.copy(temporary_copy, file_to_open)
-        temporary_copy.unlink()  # delete temp copy
+    def hand_off(self, session: "JournalSession") -> None:
+        """Replace this process with the editor; only returns if it couldn't be started"""
+        from clerk.handoff import hand_off
+
+        filename = session.filename
+        try:
+            hand_off(
+                self.editor_command(filename),
+                pathlib.Path(self.temp_directory, filename),
+                pathlib.Path(self.journal_directory, filename),
+                session.modified,
+                self.locks[filename],
+            )
+        except OSError as e:
+            report_editor_error(e)
+            exit(1)  # the finisher cleans up after us
+
+    def watch_journal(self, session: "JournalSession"):
+        """Start syncing saves back to the journal directory, if live_sync is on"""
+        if not self.live_sync:
+            return None
+        from clerk.watch import Watcher
+
+        temporary_copy = pathlib.Path(self.temp_directory, session.filename)
+        return Watcher(
+            temporary_copy,
+            lambda: self._sync(temporary_copy, session.filename),
+            self.live_sync_debounce,
+            snapshot=session.snapshot,
+        ).start()
+
+    def finish_journal(self, session: "JournalSession", watcher=None) -> None:
+        """Run the JOURNAL_SAVED and JOURNAL_CLOSED hooks once the editor exits, and write the journal back if it changed"""
+        import shutil
+
+        filename = session.filename
+        file_to_open = pathlib.Path(self.journal_directory, filename)
+        temporary_copy = pathlib.Path(self.temp_directory, filename)
+        modified = session.modified
+        snapshot = session.snapshot
+        if watcher is not None:
+            watcher.stop()
+            if watcher.error is None:
+                snapshot = watcher.snapshot  # as of the last live sync
+
+        deferred: List[Tuple[str, str]] = []
+        with span("change detection"):
+            saved = has_changed(snapshot, temporary_copy)
+        if watcher is not None and watcher.error is not None:
+            print(f"Live sync failed ({watcher.error}); writing the journal back now")
+            saved = True  # whatever was synced, the editor's copy is the latest
+        if saved:
+            modified = True
+            self._apply_callbacks_for_hook("JOURNAL_SAVED", temporary_copy, deferred)
+        elif watcher is not None and watcher.saves:
+            # the journal already holds the last save, with JOURNAL_SAVED applied
+            shutil.copy(file_to_open, temporary_copy)
+
+        modified |= self._apply_callbacks_for_hook(
+            "JOURNAL_CLOSED", temporary_copy, deferred
+        )
+        # deferred jobs need a loose journal to work on
+        modified |= bool(deferred) and not file_to_open.exists()
+        if modified:
+            with span("write back"):
+                write_back(temporary_copy, file_to_open, fsync=self.fsync, move=True)
+            # keep `clerk search` current, if the user has built an index
+            from clerk.search import refresh_entry
+
+            refresh_entry(self, filename)
+        temporary_copy.unlink(missing_ok=True)  # delete temp copy
+        self._release(filename)
+        from clerk.jobs import enqueue_job
+        from clerk.jobs import pending_jobs
+        from clerk.jobs import start_worker
+
+        if deferred:
+            enqueue_job(self, filename, deferred)
+        # also picks up jobs left behind by a crashed worker
+        if pending_jobs(self.temp_directory):
+            start_worker()
+
+    def abandon_journal(self, session: "JournalSession") -> None:
+        """Discard a prepared journal without writing it back"""
+        pathlib.Path(self.temp_directory, session.filename).unlink(missing_ok=True)
+        self._release(session.filename)
+
+    def _release(self, filename: str) -> None:
+        """Release the lock on a journal, if this process holds it"""
+        lock = self.locks.pop(filename, None)
+        if lock is not None:
+            lock.release()
+
+    def open_journal(self, filename: str):
+        """Opens the specified journal for writing, calling appropriate Hooks along the way, and handles eventual write or discard."""
+        session = self.prepare_journal(filename)
+        if self.can_hand_off(session):
+            self.hand_off(session)  # doesn't return
+        watcher = self.watch_journal(session)
+        with span("editor"):
+            try:
+                self.run_editor(self.editor_command(filename))
+            finally:
+                if watcher is not None:
+                    watcher.stop()
+        self.finish_journal(session, watcher)
         return True
 
-    def convert_to_filename(self, target_date: datetime.datetime) -> str:
-        """Convert a datetime.datetime object to a string 'YYYY-MM-DD'"""
-        return f"{target_date.strftime(self.date_format)}.{self.file_extension}"
+    def open_batch(self, filenames: Sequence[str]) -> None:
+        """Open several journals in a single editor invocation, running their hooks concurrently"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(thread_name_prefix="clerk-batch") as pool:
+            futures = [pool.submit(self.prepare_journal, f) for f in filenames]
+            sessions = []
+            failure = None
+            for future in futures:
+                try:
+                    sessions.append(future.result())
+                except BaseException as e:  # including exit(1) for an open journal
+                    failure = failure or e
+            if failure is not None:
+                for session in sessions:
+                    self.abandon_journal(session)
+                raise failure
+            watchers = [self.watch_journal(session) for session in sessions]
+            with span("editor"):
+                try:
+                    self.run_editor(self.editor_command(*filenames))
+                finally:
+                    for watcher in watchers:
+                        if watcher is not None:
+                            watcher.stop()
+            list(pool.map(self.finish_journal, sessions, watchers))
+
+    def _sync(self, temporary_copy: pathlib.Path, filename: str) -> None:
+        """Write a save made while the editor is open back to the journal directory
+
+        The save is staged next to the journal, where JOURNAL_SAVED is applied
+        (leaving the editor's file alone), then renamed into place.
+        """
+        import contextlib
+        import io
+
+        file_to_open = pathlib.Path(self.journal_directory, filename)
+        staging = sibling_path(file_to_open, "sync")
+        try:
+            with span("live sync"):
+                write_back(temporary_copy, staging)
+                # don't draw over the editor
+                with self._sync_lock, contextlib.redirect_stdout(io.StringIO()):
+                    self._apply_callbacks_for_hook("JOURNAL_SAVED", staging)
+                write_back(staging, file_to_open, fsync=self.fsync, move=True)
+        finally:
+            staging.unlink(missing_ok=True)
+        from clerk.search import refresh_entry
+
+        refresh_entry(self, filename)
+
+    def select_journals(self, args: Sequence[str]) -> Sequence[str]:
+        """The journals described by command line arguments: a date (default today), 'previous', 'next' or a range"""
+        day = "today"  # default to today's journal
+        if len(args) > 0:
+            day = " ".join(args)  # parse date and open that journal
+        if day in ("previous", "next") or ".." in day:
+            return self.find_journals(day)
+        target_date = parse_english_to_date(day)
+        return [self.convert_to_filename(target_date)]
+
+    def find_journals(self, selector: str) -> Sequence[str]:
+        """Find existing journals: 'previous', 'next' (relative to today) or a '<date>..<date>' range"""
+        from clerk.catalog import Catalog
 
+        today = datetime.datetime.now()
+        with Catalog(self) as catalog:
+            if selector in ("previous", "next"):
+                entry = getattr(catalog, selector)(today)
+                return [entry.filename] if entry else []
+            first, _, last = selector.partition("..")
+            first_day = parse_english_to_date(first.strip(" \"'") or "today")
+            last_day = parse_english_to_date(last.strip(" \"'") or "today")
+            return [entry.filename for entry in catalog.between(first_day, last_day)]
 
-def get_file_hash(filename: str):
-    """Return the md5 hash of a file's contents"""
-    with open(filename, "r") as f:
-        return hashlib.md5(f.read().encode("utf-8")).hexdigest()
+    def convert_to_filename(self, target_date: datetime.datetime) -> str:
+        """Convert a datetime.datetime object to a string 'YYYY-MM-DD' (under its shard, with a layout)"""
+        name = f"{target_date.strftime(self.date_format)}.{self.file_extension}"
+        return layout_filename(self.layout, target_date, name)
+
+    def convert_from_filename(self, filename: str) -> Optional[datetime.datetime]:
+        """Convert a journal filename back to a datetime.datetime, or None if it isn't one"""
+        stem, dot, extension = filename.rpartition("/")[2].rpartition(".")
+        if not dot or extension != self.file_extension:
+            return None
+        try:
+            return datetime.datetime.strptime(stem, self.date_format)
+        except ValueError:
+            return None
 
 
 if __name__ == "__main__":
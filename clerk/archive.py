@@ -0,0 +1,300 @@
+"""A compressed, random-access archive for old journals
+
+`clerk archive` packs journals older than some number of days into a single
+`.archive.clerk` file in the journal directory, so years of journals don't
+cost tens of thousands of inodes. Each journal is compressed separately with
+zlib, and the archive ends with an index of fixed-width records sorted by
+filename, so any one journal can be found by binary search over the
+memory-mapped index and decompressed without touching the others.
+
+A loose journal always takes precedence over an archived copy of it: opening
+an archived journal extracts it, and if it's edited it's written back as a
+loose file (which the next `clerk archive` packs again).
+
+    header:  magic, version, entry count, index offset
+    data:    zlib-compressed journals, one after another
+    index:   (filename, offset, compressed length, size, mtime_ns) per journal
+"""
+import datetime
+import mmap
+import os
+import pathlib
+import struct
+import zlib
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Union
+
+from clerk.files import fsync_directory
+from clerk.files import sibling_path
+
+
+ARCHIVE_FILENAME = ".archive.clerk"
+ARCHIVE_MAGIC = b"CLERKARC"
+ARCHIVE_VERSION = 1
+HEADER = struct.Struct("<8sIIQ")
+RECORD = struct.Struct("<64sQIIq")
+MAX_NAME_LENGTH = 64
+
+
+class ArchiveEntry(NamedTuple):
+    """A journal stored in an archive"""
+
+    name: str
+    offset: int
+    length: int
+    size: int
+    mtime_ns: int
+
+    # so an entry can stand in for an os.stat_result
+    @property
+    def st_size(self) -> int:
+        """The journal's uncompressed size"""
+        return self.size
+
+    @property
+    def st_mtime_ns(self) -> int:
+        """The journal's modification time when it was archived"""
+        return self.mtime_ns
+
+
+def archive_path(journal_directory: Union[str, pathlib.Path]) -> pathlib.Path:
+    """Returns the path to the archive in a journal directory"""
+    return pathlib.Path(journal_directory, ARCHIVE_FILENAME)
+
+
+class Archive:
+    """A read-only, memory-mapped journal archive"""
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        """Open an archive"""
+        self.path = pathlib.Path(path)
+        with open(self.path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{self.path} is empty") from None
+        try:
+            magic, version, self._count, self._index = HEADER.unpack_from(self._map)
+        except struct.error:
+            magic = version = None  # too short to even hold a header
+        if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+            self._map.close()
+            raise ValueError(f"{self.path} isn't a clerk archive")
+        if self._index + self._count * RECORD.size > len(self._map):
+            self._map.close()
+            raise ValueError(f"{self.path} is truncated")
+
+    def __enter__(self) -> "Archive":
+        """Use the archive as a context manager"""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the archive"""
+        self.close()
+
+    def close(self) -> None:
+        """Unmap the archive"""
+        self._map.close()
+
+    def __len__(self) -> int:
+        """The number of archived journals"""
+        return self._count
+
+    def _record(self, i: int) -> ArchiveEntry:
+        """The i'th index record"""
+        name, offset, length, size, mtime_ns = RECORD.unpack_from(
+            self._map, self._index + i * RECORD.size
+        )
+        return ArchiveEntry(name.rstrip(b"\0").decode(), offset, length, size, mtime_ns)
+
+    def __iter__(self) -> Iterator[ArchiveEntry]:
+        """Every archived journal, by filename"""
+        return (self._record(i) for i in range(self._count))
+
+    def entry(self, name: str) -> Optional[ArchiveEntry]:
+        """Look up a journal by filename (a binary search of the index)"""
+        key = name.encode().ljust(MAX_NAME_LENGTH, b"\0")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            start = self._index + middle * RECORD.size
+            if self._map[start : start + MAX_NAME_LENGTH] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count:
+            found = self._record(low)
+            if found.name == name:
+                return found
+        return None
+
+    def __contains__(self, name: str) -> bool:
+        """Whether a journal is archived"""
+        return self.entry(name) is not None
+
+    def compressed(self, entry: ArchiveEntry) -> bytes:
+        """An archived journal's compressed bytes"""
+        return self._map[entry.offset : entry.offset + entry.length]
+
+    def stream(self, entry: ArchiveEntry, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+        """An archived journal's contents, decompressed a chunk at a time"""
+        decompressor = zlib.decompressobj()
+        end = entry.offset + entry.length
+        for start in range(entry.offset, end, chunk_size):
+            data = decompressor.decompress(
+                self._map[start : min(start + chunk_size, end)], chunk_size
+            )
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+        data = decompressor.flush()
+        if data:
+            yield data
+
+    def read(self, name: str) -> bytes:
+        """An archived journal's contents"""
+        entry = self.entry(name)
+        if entry is None:
+            raise FileNotFoundError(f"{name} isn't in {self.path}")
+        return zlib.decompress(self.compressed(entry))
+
+
+def load_archive(journal_directory: Union[str, pathlib.Path]) -> Optional[Archive]:
+    """Open the journal directory's archive, if it has one (and it can be read)"""
+    try:
+        return Archive(archive_path(journal_directory))
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        print(f"Ignoring a corrupt journal archive: {e}")
+        return None
+
+
+def stat_journal(journal_directory: str, filename: str, archive: Optional[Archive]):
+    """Stat a journal, loose or archived (raising FileNotFoundError if it's neither)"""
+    try:
+        return os.stat(pathlib.Path(journal_directory, filename))
+    except FileNotFoundError:
+        entry = archive.entry(filename) if archive is not None else None
+        if entry is None:
+            raise
+        return entry
+
+
+def read_journal(
+    journal_directory: str, filename: str, archive: Optional[Archive]
+) -> str:
+    """Read a journal's text, loose or archived"""
+    try:
+        with open(
+            pathlib.Path(journal_directory, filename), "r", errors="replace"
+        ) as f:
+            return f.read()
+    except FileNotFoundError:
+        if archive is None:
+            raise
+        return archive.read(filename).decode(errors="replace")
+
+
+def extract_journal(
+    journal_directory: str, filename: str, destination: pathlib.Path
+) -> bool:
+    """Copy an archived journal to `destination`, returning False if it isn't archived"""
+    archive = load_archive(journal_directory)
+    if archive is None:
+        return False
+    with archive:
+        if filename not in archive:
+            return False
+        destination.write_bytes(archive.read(filename))
+    return True
+
+
+def write_archive(
+    path: pathlib.Path, entries: Iterable[tuple], fsync: bool = True
+) -> int:
+    """Write (name, compressed bytes, size, mtime_ns) entries as a new archive, atomically"""
+    entries = sorted(entries, key=lambda entry: entry[0].encode())
+    temporary = sibling_path(path)
+    try:
+        with open(temporary, "wb") as f:
+            f.write(HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, 0, 0))
+            records = []
+            for name, compressed, size, mtime_ns in entries:
+                records.append(
+                    RECORD.pack(
+                        name.encode(), f.tell(), len(compressed), size, mtime_ns
+                    )
+                )
+                f.write(compressed)
+            index = f.tell()
+            f.writelines(records)
+            f.seek(0)
+            f.write(HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, len(records), index))
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+    if fsync:
+        fsync_directory(path.parent)
+    return len(records)
+
+
+def archive_journals(app, older_than: int) -> List[str]:
+    """Pack loose journals dated more than `older_than` days ago into the archive
+
+    Returns the filenames archived. Journals already in the archive are
+    carried over without being recompressed, unless a loose copy replaces them.
+    Journals that are open, or queued for a deferred hook, are left loose.
+    """
+    from clerk.catalog import Catalog
+    from clerk.layout import queued_journals
+    from clerk.locks import is_open
+
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=older_than)
+    journal_directory = app.journal_directory
+    queued = queued_journals(app.temp_directory)
+    last_day = cutoff.date() - datetime.timedelta(days=1)
+    with Catalog(app) as catalog:
+        old = catalog.between(datetime.date.min, last_day)
+    packing = []
+    for _, filename in old:
+        if filename in queued or is_open(app.temp_directory, filename):
+            continue
+        path = pathlib.Path(journal_directory, filename)
+        if len(filename.encode()) <= MAX_NAME_LENGTH and path.exists():
+            packing.append((filename, path))
+    if not packing:
+        return []
+    entries = []
+    for filename, path in packing:
+        st = os.stat(path)
+        compressed = zlib.compress(path.read_bytes(), 9)
+        entries.append((filename, compressed, st.st_size, st.st_mtime_ns))
+    archive = load_archive(journal_directory)
+    if archive is None and archive_path(journal_directory).exists():
+        # writing a new archive would lose whatever is left in the corrupt one
+        print("Not archiving until the corrupt archive is moved aside")
+        exit(1)
+    if archive is not None:
+        with archive:
+            packed = {filename for filename, _ in packing}
+            entries.extend(
+                (entry.name, archive.compressed(entry), entry.size, entry.mtime_ns)
+                for entry in archive
+                if entry.name not in packed
+            )
+            write_archive(archive_path(journal_directory), entries)
+    else:
+        write_archive(archive_path(journal_directory), entries)
+    # the archive is safely on disk, so the loose copies can go
+    for _, path in packing:
+        path.unlink()
+    return [filename for filename, _ in packing]
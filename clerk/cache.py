@@ -0,0 +1,181 @@
+"""A content-addressed cache of plugin callback results
+
+Plugins whose output depends only on their input (templates, say, or the
+weather for a given day) can declare themselves cacheable. When they are,
+clerk looks up each run by a hash of the plugin's name, its distribution's
+version, its config section, the lines it's given and (for `per_day` plugins)
+today's date, and a hit skips the callback entirely. Results are kept in
+SQLite in the user data directory, expire after `hook_cache_ttl` seconds, and
+the least recently used are evicted once they take up more than
+`hook_cache_size` megabytes.
+
+A user can turn caching on for any plugin, or off for one that declared
+itself cacheable, with `hook_cache = yes|no` in its config section (or off
+for every plugin, in the DEFAULT section).
+"""
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Callable
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from clerk.config import get_boolean
+
+
+CACHE_FILENAME = "hook-cache.sqlite3"
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_SIZE_MB = 32
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    lines TEXT,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_by_use ON results (used);
+"""
+
+
+def cacheable(callback: Optional[Callable] = None, *, per_day: bool = False):
+    """Mark a callback as safe to cache: its output depends only on its input lines and config
+
+    Use `@cacheable(per_day=True)` for callbacks that also depend on the date
+    they run (today's weather), so they're cached for a day at most.
+    """
+
+    def mark(callback: Callable) -> Callable:
+        """Record the declaration on the callback"""
+        callback.cacheable = "per_day" if per_day else True
+        return callback
+
+    return mark(callback) if callback is not None else mark
+
+
+def is_cacheable(callback: Callable, conf: Mapping) -> bool:
+    """Whether a callback's results may be cached, by its declaration or the user's say-so"""
+    declared = getattr(callback, "cacheable", False) in (True, "per_day")
+    return get_boolean(conf, "hook_cache", declared)
+
+
+def cache_path(user_data_directory: pathlib.Path) -> pathlib.Path:
+    """Returns the path to the hook result cache"""
+    return pathlib.Path(user_data_directory, CACHE_FILENAME)
+
+
+class ResultCache:
+    """Callback results, keyed by a hash of everything that could change them"""
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        ttl: float = DEFAULT_TTL,
+        max_bytes: int = DEFAULT_SIZE_MB * 1024 * 1024,
+    ):
+        """Prepare a cache at `path`; it isn't opened until it's first used"""
+        self.path = pathlib.Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._connection = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()  # hooks may run on several threads
+
+    def _connect(self):
+        """The connection to the cache, opened in this process if need be"""
+        # a connection inherited across fork() (by a rehook worker) isn't safe to use
+        if self._connection is None or self._pid != os.getpid():
+            import sqlite3
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self) -> None:
+        """Close the connection to the cache, if it's open"""
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+    def step_key(self, name: str, version: str, conf: Mapping, per_day: bool) -> str:
+        """The part of a key that's the same for every run of a configured plugin"""
+        settings = {key: conf[key] for key in conf}
+        parts = [name, version, settings]
+        if per_day:
+            import datetime
+
+            parts.append(datetime.date.today().isoformat())
+        return json.dumps(parts, sort_keys=True)
+
+    def key(self, step_key: str, lines: Sequence[str]) -> str:
+        """The key for one run of a plugin over a document"""
+        import hashlib
+
+        digest = hashlib.blake2b(step_key.encode(), digest_size=20)
+        for line in lines:
+            encoded = line.encode(errors="surrogatepass")
+            digest.update(len(encoded).to_bytes(8, "little"))
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Tuple[bool, Optional[List[str]]]:
+        """Look up a run's result, returning (whether it was cached, its new lines)"""
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT lines FROM results WHERE key = ? AND created > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return False, None
+            connection.execute("UPDATE results SET used = ? WHERE key = ?", (now, key))
+        return True, json.loads(row[0])
+
+    def put(self, key: str, lines: Optional[Sequence[str]]) -> None:
+        """Remember a run's result (None meaning it changed nothing)"""
+        value = json.dumps(list(lines) if lines else None)
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value), now, now),
+                )
+                self._evict(connection, now)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def _evict(self, connection, now: float) -> None:
+        """Drop expired results, then the least recently used until under max_bytes"""
+        connection.execute("DELETE FROM results WHERE created <= ?", (now - self.ttl,))
+        (total,) = connection.execute("SELECT TOTAL(size) FROM results").fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in connection.execute(
+            "SELECT key, size FROM results ORDER BY used"
+        ):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM results WHERE key = ?", evicted)
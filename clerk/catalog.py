@@ -0,0 +1,276 @@
+"""A sorted, persisted catalog of the journals that exist, by date"""
+import datetime
+import json
+import os
+import pathlib
+import sqlite3
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from clerk.archive import ARCHIVE_FILENAME
+from clerk.archive import archive_path
+from clerk.archive import load_archive
+from clerk.layout import layout_depth
+from clerk.layout import layout_filename
+
+
+CATALOG_FILENAME = "catalog.sqlite3"
+CATALOG_VERSION = 3
+# archived journals are cataloged as if the archive were one more directory
+ARCHIVED = ARCHIVE_FILENAME
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS journals (
+    key TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    PRIMARY KEY (key, filename, directory)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS journals_by_directory ON journals (directory);
+"""
+# a journal both loose and archived is listed once
+SELECT = "SELECT DISTINCT key, filename FROM journals"
+
+
+class CatalogEntry(NamedTuple):
+    """A journal that exists in the journal directory"""
+
+    date: datetime.datetime
+    filename: str
+
+
+def catalog_path(user_data_directory: pathlib.Path) -> pathlib.Path:
+    """Returns the path to the persisted journal catalog"""
+    return pathlib.Path(user_data_directory, CATALOG_FILENAME)
+
+
+def day_key(day: datetime.date) -> str:
+    """The catalog key sorting before every journal on the specified day"""
+    if isinstance(day, datetime.datetime):
+        day = day.date()
+    return day.isoformat()
+
+
+class Catalog:
+    """The journals in an Application's journal_directory (or its archive), sorted by date
+
+    Journal filenames are parsed back into dates using the configured
+    `date_format` and `file_extension`. With a sharded `layout`, journals are
+    found in the shard directories the layout files them in, and their
+    filenames are paths relative to the journal directory. The catalog is kept
+    in SQLite in the user data directory along with each directory's mtime
+    (and the archive's), and only directories whose mtime changed are listed
+    again; lookups are then a stat per shard and an indexed range query, with
+    nothing read that the query doesn't return.
+    """
+
+    def __init__(self, app):
+        """Open the catalog for an Application's journals, refreshing it if stale"""
+        self.app = app
+        self.path = catalog_path(app.temp_directory)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path)
+            self.connection.executescript(SCHEMA)
+        except (OSError, sqlite3.Error):
+            # a read-only data directory only costs us the cache
+            self.connection = sqlite3.connect(":memory:")
+            self.connection.executescript(SCHEMA)
+        self.refresh()
+
+    def __enter__(self) -> "Catalog":
+        """Use the catalog as a context manager"""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the catalog"""
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection to the catalog"""
+        self.connection.close()
+
+    def _signature(self) -> str:
+        """What the persisted catalog must match to still be valid"""
+        return json.dumps(
+            [
+                CATALOG_VERSION,
+                str(self.app.journal_directory),
+                self.app.date_format,
+                self.app.file_extension,
+                self.app.layout,
+            ]
+        )
+
+    def refresh(self) -> bool:
+        """Re-list the directories (and archive) that changed since the catalog was built; returns whether any did"""
+        with self.connection:
+            return self._refresh()
+
+    def _refresh(self) -> bool:
+        """Bring the catalog up to date, within a transaction"""
+        execute = self.connection.execute
+        signature = self._signature()
+        row = execute("SELECT value FROM settings WHERE name = 'signature'").fetchone()
+        changed = row is None or row[0] != signature
+        if changed:
+            execute("DELETE FROM directories")
+            execute("DELETE FROM journals")
+            execute(
+                "INSERT OR REPLACE INTO settings VALUES ('signature', ?)", (signature,)
+            )
+        known: Dict[str, int] = {}
+        children: Dict[str, List[str]] = {}
+        for path, parent, mtime_ns in execute("SELECT * FROM directories"):
+            known[path] = mtime_ns
+            if parent is not None:
+                children.setdefault(parent, []).append(path)
+        depth = layout_depth(self.app.layout)
+        seen = {ARCHIVED}
+        pending: List[Tuple[str, Optional[str], int]] = [("", None, 0)]
+        while pending:
+            relative, parent, level = pending.pop()
+            directory = os.path.join(self.app.journal_directory, relative)
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except (FileNotFoundError, NotADirectoryError):
+                if not relative:
+                    raise
+                continue  # removed since its parent was listed
+            seen.add(relative)
+            if known.get(relative) == mtime_ns:
+                shards = children.get(relative, [])
+            else:
+                # stat before listing, so a change made meanwhile is seen next time
+                journals, shards = self._list(directory, level < depth)
+                self._replace(relative, parent, mtime_ns, journals)
+                changed = True
+            pending.extend((shard, relative, level + 1) for shard in shards)
+        for relative in known.keys() - seen:
+            self._forget(relative)
+            changed = True
+        return self._refresh_archive(known.get(ARCHIVED)) or changed
+
+    def _replace(
+        self,
+        relative: str,
+        parent: Optional[str],
+        mtime_ns: int,
+        journals: List[Tuple[str, str]],
+    ) -> None:
+        """Record the journals listed in one directory (or the archive)"""
+        self._forget(relative)
+        self.connection.execute(
+            "INSERT INTO directories VALUES (?, ?, ?)", (relative, parent, mtime_ns)
+        )
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO journals VALUES (?, ?, ?)",
+            ((key, filename, relative) for key, filename in journals),
+        )
+
+    def _forget(self, relative: str) -> None:
+        """Drop a directory (or the archive) and the journals listed in it"""
+        self.connection.execute("DELETE FROM directories WHERE path = ?", (relative,))
+        self.connection.execute("DELETE FROM journals WHERE directory = ?", (relative,))
+
+    def _refresh_archive(self, known_mtime_ns: Optional[int]) -> bool:
+        """Re-read the archive's index if it changed; returns whether it did"""
+        try:
+            mtime_ns = os.stat(archive_path(self.app.journal_directory)).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if mtime_ns == known_mtime_ns:
+            return False
+        self._forget(ARCHIVED)
+        archive = load_archive(self.app.journal_directory)
+        if archive is None:
+            return True
+        journals = []
+        with archive:
+            for archived in archive:
+                date = self.app.convert_from_filename(archived.name)
+                if date is not None:
+                    journals.append((date.isoformat(), archived.name))
+        self._replace(ARCHIVED, None, mtime_ns, journals)
+        return True
+
+    def _list(self, directory: str, shards: bool) -> Tuple[List, List[str]]:
+        """The (key, filename) journals, and shard directories, in one directory (slow)"""
+        relative = os.path.relpath(directory, self.app.journal_directory)
+        prefix = "" if relative == "." else relative.replace(os.sep, "/") + "/"
+        journals = []
+        subdirectories = []
+        for entry in os.scandir(directory):
+            if entry.name.startswith("."):
+                continue  # the archive, write-back temporaries, .git and the like
+            date = self.app.convert_from_filename(entry.name)
+            if (
+                date is not None
+                and entry.is_file()
+                # only where the layout files it (not in some other folder)
+                and layout_filename(self.app.layout, date, entry.name)
+                == prefix + entry.name
+            ):
+                journals.append((date.isoformat(), prefix + entry.name))
+            elif shards and entry.is_dir():
+                subdirectories.append(prefix + entry.name)
+        return journals, subdirectories
+
+    def _select(self, query: str, parameters: tuple = ()) -> List[CatalogEntry]:
+        """The journals a query over the catalog returns"""
+        return [
+            CatalogEntry(datetime.datetime.fromisoformat(key), filename)
+            for key, filename in self.connection.execute(query, parameters)
+        ]
+
+    @property
+    def filenames(self) -> List[str]:
+        """Every journal's filename, oldest first"""
+        return [entry.filename for entry in self]
+
+    def __len__(self) -> int:
+        """The number of journals"""
+        return self.connection.execute(f"SELECT COUNT(*) FROM ({SELECT})").fetchone()[0]
+
+    def __iter__(self) -> Iterator[CatalogEntry]:
+        """Every journal, oldest first"""
+        return iter(self._select(f"{SELECT} ORDER BY key, filename"))
+
+    def between(
+        self, first_day: datetime.date, last_day: datetime.date
+    ) -> List[CatalogEntry]:
+        """The journals from first_day through last_day (inclusive), oldest first"""
+        return self._select(
+            f"{SELECT} WHERE key >= ? AND key < ? ORDER BY key, filename",
+            (day_key(first_day), day_key(last_day + datetime.timedelta(days=1))),
+        )
+
+    def previous(self, day: datetime.date) -> Optional[CatalogEntry]:
+        """The most recent journal from before the specified day"""
+        found = self._select(
+            f"{SELECT} WHERE key < ? ORDER BY key DESC, filename DESC LIMIT 1",
+            (day_key(day),),
+        )
+        return found[0] if found else None
+
+    def next(self, day: datetime.date) -> Optional[CatalogEntry]:
+        """The earliest journal from after the specified day"""
+        found = self._select(
+            f"{SELECT} WHERE key >= ? ORDER BY key, filename LIMIT 1",
+            (day_key(day + datetime.timedelta(days=1)),),
+        )
+        return found[0] if found else None
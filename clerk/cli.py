@@ -0,0 +1,341 @@
+"""The `clerk` command line interface"""
+import argparse
+import datetime
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from clerk import profiling
+from clerk.app import create_application
+from clerk.config import HOOK_NAMES
+from clerk.config import temp_directory_path
+from clerk.export import RENDERERS
+
+
+def search(args: argparse.Namespace) -> int:
+    """Search journals for entries containing every word of a query"""
+    from clerk.archive import load_archive
+    from clerk.archive import read_journal
+    from clerk.search import SearchIndex
+
+    app = create_application()
+    with SearchIndex(app) as index:
+        index.rescan()
+        results = index.search(" ".join(args.query), args.limit, args.by_date)
+    archive = load_archive(app.journal_directory)
+    for result in results:
+        print(f"{result.filename}")
+        text = read_journal(app.journal_directory, result.filename, archive)
+        lines = text.splitlines()
+        for number in result.line_numbers[: args.context]:
+            if number < len(lines):
+                print(f"    {number + 1}: {lines[number].rstrip()}")
+    return 0 if results else 1
+
+
+def profile(args: argparse.Namespace) -> int:
+    """Compare the latest profiled session with the profiling history"""
+    history = profiling.read_history(temp_directory_path())
+    if not history:
+        print("No profiles recorded yet; run `journal --profile` first")
+        return 1
+    report = profiling.regressions(history, args.threshold)
+    regressed = False
+    for phase in report:
+        median = phase["median_ms"]
+        baseline = f"{median:10.2f} ms" if median is not None else "         -   "
+        flag = "  <- slower" if phase["regressed"] else ""
+        regressed |= phase["regressed"]
+        print(f"{phase['name']:<32} {phase['latest_ms']:10.2f} ms {baseline}{flag}")
+    return 1 if regressed else 0
+
+
+def archive(args: argparse.Namespace) -> int:
+    """Pack old journals into a compressed archive in the journal directory"""
+    from clerk.archive import archive_journals
+    from clerk.archive import archive_path
+
+    app = create_application()
+    archived = archive_journals(app, args.older_than)
+    print(
+        f"Archived {len(archived)} journals into {archive_path(app.journal_directory)}"
+    )
+    return 0
+
+
+def parse_day(text: str) -> datetime.date:
+    """Parse a date given on the command line, as YYYY-MM-DD or in english ("last monday")"""
+    try:
+        return datetime.date.fromisoformat(text)
+    except ValueError:
+        pass
+    from clerk.parse import parse_english_to_date
+
+    try:
+        return parse_english_to_date(text).date()
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def rehook(args: argparse.Namespace) -> int:
+    """Re-run a hook's callbacks over existing journals"""
+    import time
+
+    from clerk.rehook import rehook as run_rehook
+
+    app = create_application()
+    start = time.perf_counter()
+    outcomes = run_rehook(
+        app, args.hook, args.since, args.until, args.dry_run, args.jobs
+    )
+    elapsed = time.perf_counter() - start
+    counts: Dict[str, int] = {}
+    for outcome in outcomes:
+        counts[outcome.status] = counts.get(outcome.status, 0) + 1
+        if outcome.status == "changed" and args.dry_run:
+            print(f"{outcome.filename}: +{outcome.added} -{outcome.removed}")
+        elif outcome.status == "failed":
+            print(f"{outcome.filename}: failed ({outcome.error})")
+        elif outcome.status in ("busy", "conflict"):
+            print(f"{outcome.filename}: skipped ({outcome.status})")
+    verb = "would change" if args.dry_run else "changed"
+    summary = ", ".join(
+        f"{counts[status]} {status}"
+        for status in ("unchanged", "busy", "conflict", "failed")
+        if status in counts
+    )
+    rate = len(outcomes) / elapsed if elapsed else 0
+    print(
+        f"{args.hook}: {verb} {counts.get('changed', 0)} of {len(outcomes)} journals"
+        + (f" ({summary})" if summary else "")
+        + f" in {elapsed:.2f}s ({rate:.0f}/s)"
+    )
+    return 1 if counts.get("failed") else 0
+
+
+def export(args: argparse.Namespace) -> int:
+    """Export a range of journals to a single Markdown, JSON Lines or HTML document"""
+    import sys
+
+    from clerk.export import export as run_export
+    from clerk.files import atomic_write_lines
+
+    app = create_application()
+    output_format = args.format or (
+        args.output.rpartition(".")[2] if args.output else "md"
+    )
+    if output_format not in RENDERERS:
+        print(f"Can't export to '{args.output}'; choose a --format")
+        return 1
+    chunks = run_export(app, args.since, args.until, output_format, args.transform)
+    if args.output is None or args.output == "-":
+        sys.stdout.writelines(chunks)
+    else:
+        atomic_write_lines(args.output, chunks, fsync=app.fsync)
+    return 0
+
+
+def stats(args: argparse.Namespace) -> int:
+    """Summarize journals: words, streaks, entries per month and most-used tags"""
+    from clerk.stats import StatsCache
+
+    app = create_application()
+    with StatsCache(app) as cache:
+        cache.refresh(args.jobs)
+        report = cache.report(args.since, args.until, args.tags)
+    if not report.journals:
+        print("No journals in that range")
+        return 1
+    longest, started = report.longest_streak
+    print(f"Journals: {report.journals} ({report.first} to {report.last})")
+    print(f"Words:    {report.words} ({report.words // report.journals} per journal)")
+    print(f"Lines:    {report.lines}")
+    print(f"Longest streak: {longest} days, from {started}")
+    print(f"Current streak: {report.current_streak} days")
+    if report.months and args.months:
+        print("\nMonth      Journals    Words")
+        for month, journals, words in report.months[: args.months]:
+            print(f"{month}  {journals:>10} {words:>8}")
+    if report.tags:
+        print("\nTag" + " " * 21 + "Uses")
+        for tag, uses in report.tags:
+            print(f"#{tag:<22} {uses:>5}")
+    return 0
+
+
+def migrate_layout(args: argparse.Namespace) -> int:
+    """Move journals into the directory layout configured in .clerkrc"""
+    from clerk.layout import migrate_layout as run_migration
+
+    app = create_application()
+    moves = run_migration(app, args.previous, args.dry_run)
+    counts: Dict[str, int] = {}
+    for move in moves:
+        counts[move.status] = counts.get(move.status, 0) + 1
+        if move.status != "moved":
+            print(f"{move.source}: skipped ({move.status})")
+        elif args.dry_run:
+            print(f"{move.source} -> {move.destination}")
+    verb = "Would move" if args.dry_run else "Moved"
+    where = f"the layout '{app.layout}'" if app.layout else "the journal directory"
+    skipped = ", ".join(
+        f"{counts[status]} {status}"
+        for status in ("busy", "conflict")
+        if status in counts
+    )
+    print(
+        f"{verb} {counts.get('moved', 0)} journals into {where}"
+        + (
+            f" ({skipped} left where they are; run it again once they're resolved)"
+            if skipped
+            else ""
+        )
+    )
+    return 1 if skipped else 0
+
+
+def daemon(args: argparse.Namespace) -> int:
+    """Start, stop or check on the resident clerk daemon"""
+    from clerk import daemon
+
+    return getattr(daemon, args.action)()
+
+
+def parser() -> argparse.ArgumentParser:
+    """Build the `clerk` argument parser"""
+    clerk = argparse.ArgumentParser(
+        prog="clerk", description="A CLI to manage daily journal entries"
+    )
+    clerk.add_argument(
+        "--profile",
+        nargs="?",
+        const="json",
+        choices=profiling.FORMATS,
+        help="record a profile of this command (see `clerk profile`)",
+    )
+    subparsers = clerk.add_subparsers(dest="command", required=True)
+
+    search_parser = subparsers.add_parser("search", help=search.__doc__)
+    search_parser.add_argument("query", nargs="+")
+    search_parser.add_argument(
+        "--limit", type=int, default=20, help="maximum number of journals to list"
+    )
+    search_parser.add_argument(
+        "--by-date", action="store_true", help="list newest first, rather than by rank"
+    )
+    search_parser.add_argument(
+        "--context", type=int, default=3, help="matching lines to show per journal"
+    )
+    search_parser.set_defaults(func=search)
+
+    profile_parser = subparsers.add_parser("profile", help=profile.__doc__)
+    profile_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.5,
+        help="flag phases slower than this multiple of their median",
+    )
+    profile_parser.set_defaults(func=profile)
+
+    archive_parser = subparsers.add_parser("archive", help=archive.__doc__)
+    archive_parser.add_argument(
+        "--older-than",
+        type=int,
+        required=True,
+        metavar="DAYS",
+        help="archive journals dated more than this many days ago",
+    )
+    archive_parser.set_defaults(func=archive)
+
+    rehook_parser = subparsers.add_parser("rehook", help=rehook.__doc__)
+    rehook_parser.add_argument("hook", choices=HOOK_NAMES)
+    rehook_parser.add_argument(
+        "--since", type=parse_day, help="first journal date (default: the earliest)"
+    )
+    rehook_parser.add_argument(
+        "--until", type=parse_day, help="last journal date (default: the latest)"
+    )
+    rehook_parser.add_argument(
+        "--dry-run", action="store_true", help="report what would change, per journal"
+    )
+    rehook_parser.add_argument(
+        "--jobs", type=int, help="worker processes (default: one per CPU)"
+    )
+    rehook_parser.set_defaults(func=rehook)
+
+    export_parser = subparsers.add_parser("export", help=export.__doc__)
+    export_parser.add_argument(
+        "--since", type=parse_day, help="first journal date (default: the earliest)"
+    )
+    export_parser.add_argument(
+        "--until", type=parse_day, help="last journal date (default: the latest)"
+    )
+    export_parser.add_argument(
+        "--format",
+        choices=list(RENDERERS),
+        help="document format (default: from the output file's extension, or md)",
+    )
+    export_parser.add_argument(
+        "--transform",
+        choices=HOOK_NAMES,
+        metavar="HOOK",
+        help="pass each journal through this hook's callbacks first",
+    )
+    export_parser.add_argument(
+        "-o", "--output", help="file to write (default: standard output)"
+    )
+    export_parser.set_defaults(func=export)
+
+    stats_parser = subparsers.add_parser("stats", help=stats.__doc__)
+    stats_parser.add_argument(
+        "--since", type=parse_day, help="first journal date (default: the earliest)"
+    )
+    stats_parser.add_argument(
+        "--until", type=parse_day, help="last journal date (default: the latest)"
+    )
+    stats_parser.add_argument(
+        "--months", type=int, default=12, help="most recent months to break down"
+    )
+    stats_parser.add_argument(
+        "--tags", type=int, default=10, help="number of most-used tags to list"
+    )
+    stats_parser.add_argument(
+        "--jobs", type=int, help="worker processes (default: one per CPU)"
+    )
+    stats_parser.set_defaults(func=stats)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate-layout", help=migrate_layout.__doc__
+    )
+    migrate_parser.add_argument(
+        "--from",
+        dest="previous",
+        default="",
+        metavar="LAYOUT",
+        help="the layout journals are filed in now (default: all in the journal directory)",
+    )
+    migrate_parser.add_argument(
+        "--dry-run", action="store_true", help="list the moves, without making them"
+    )
+    migrate_parser.set_defaults(func=migrate_layout)
+
+    daemon_parser = subparsers.add_parser("daemon", help=daemon.__doc__)
+    daemon_parser.add_argument("action", choices=["start", "stop", "status"])
+    daemon_parser.set_defaults(func=daemon)
+
+    return clerk
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """`clerk` console script entrypoint"""
+    args = parser().parse_args(argv)
+    profiling.start(args.profile)  # with no --profile, honours CLERK_PROFILE
+    try:
+        with profiling.span(args.command):
+            return args.func(args)
+    finally:
+        profiling.stop(temp_directory_path())
+
+
+if __name__ == "__main__":
+    exit(main())
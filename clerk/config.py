@@ -1,11 +1,53 @@
 """Utility functions for managing clerk's configuration"""
 from pathlib import Path
+from typing import Dict
+from typing import List
 from typing import Mapping
+from typing import Optional
+from typing import Tuple
 
 from appdirs import AppDirs
 from configparser import ConfigParser
 
 
+HOOK_NAMES = (
+    "NEW_JOURNAL_CREATED",
+    "JOURNAL_OPENED",
+    "JOURNAL_SAVED",
+    "JOURNAL_CLOSED",
+)
+
+
+class ClerkConfig(ConfigParser):
+    """A validated clerk configuration, with the [hooks] section pre-parsed"""
+
+    hook_table: Optional[Dict[str, List[str]]] = None
+
+    @property
+    def journal_directory(self) -> str:
+        """Where journals are kept (with `~` expanded)"""
+        return self["DEFAULT"]["journal_directory"]
+
+    @property
+    def preferred_editor(self) -> str:
+        """The command used to edit journals"""
+        return self["DEFAULT"]["preferred_editor"]
+
+    @property
+    def date_format(self) -> str:
+        """The strftime format used to name journals"""
+        return self["DEFAULT"]["date_format"]
+
+    @property
+    def file_extension(self) -> str:
+        """The file extension of journals"""
+        return self["DEFAULT"]["file_extension"]
+
+
+# config file path -> ((mtime_ns, size, inode), parsed config)
+_parsed_configs: Dict[Path, Tuple[Tuple[int, int, int], ClerkConfig]] = {}
+
+
 def dirs() -> AppDirs:
     """Returns clerk's application directories"""
     return AppDirs("clerk", "K Street Labs")
@@ -22,12 +64,24 @@ def temp_directory_path() -> Path:
 
 
 def get_config() -> Mapping:
-    """Returns the configuration for the clerk application"""
+    """Returns the configuration for the clerk application
+
+    The parsed configuration is memoized until the config file changes, so
+    callers share one ClerkConfig and shouldn't modify it (use write_config).
+    """
     config_file = config_file_path()
-    config_directory = config_file.parents[0]
-    config_directory.mkdir(parents=True, exist_ok=True)
-    config_file.touch(exist_ok=True)
-    conf = ConfigParser()
+    try:
+        st = config_file.stat()
+    except FileNotFoundError:
+        config_directory = config_file.parents[0]
+        config_directory.mkdir(parents=True, exist_ok=True)
+        config_file.touch(exist_ok=True)
+        st = config_file.stat()
+    signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+    cached = _parsed_configs.get(config_file)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    conf = ClerkConfig()
     conf.read(config_file)
     try:
         conf["DEFAULT"]["journal_directory"] = str(
@@ -41,12 +95,64 @@ def get_config() -> Mapping:
             f"Your configuration at {config_file_path()} is missing a key '{e.args[0]}'"
         )
         exit(1)
+    conf.hook_table = hook_plugin_names(conf)
+    _parsed_configs[config_file] = (signature, conf)
     return conf
 
 
+def clear_config_cache() -> None:
+    """Forget any memoized configuration"""
+    _parsed_configs.clear()
+
+
+def get_boolean(section: Mapping, key: str, default: bool = False) -> bool:
+    """Read an optional yes/no setting from a config section"""
+    value = section.get(key)
+    if value is None:
+        return default
+    try:
+        return ConfigParser.BOOLEAN_STATES[str(value).lower()]
+    except KeyError:
+        print(
+            f"Your configuration at {config_file_path()} has an invalid value for '{key}' (expected yes or no)"
+        )
+        exit(1)
+
+
+def get_float(
+    section: Mapping, key: str, default: Optional[float] = None
+) -> Optional[float]:
+    """Read an optional numeric setting from a config section"""
+    value = section.get(key)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(
+            f"Your configuration at {config_file_path()} has an invalid value for '{key}' (expected a number)"
+        )
+        exit(1)
+
+
 def write_config(conf_map: Mapping) -> None:
     """Update the clerk configuration"""
     conf_file_path = config_file_path()
     print(f"Writing to config: {conf_file_path}")
     with open(conf_file_path, "w") as configfile:
         conf_map.write(configfile)
+    clear_config_cache()
+
+
+def hook_plugin_names(conf: Mapping) -> Dict[str, List[str]]:
+    """Returns the plugin names configured for each hook, in configured order"""
+    table = getattr(conf, "hook_table", None)
+    if table is not None:
+        return table
+    hooks = conf["hooks"] if "hooks" in conf else {}
+    return {
+        hook_name: [name for name in hooks[hook_name].split("\n") if name != ""]
+        if hook_name in hooks
+        else []
+        for hook_name in HOOK_NAMES
+    }
@@ -0,0 +1,424 @@
+"""A resident clerk process that keeps the Application warm between `journal` runs
+
+`clerk daemon start` runs a daemon listening on a Unix socket in the user data
+directory. While it's running, `journal` is a thin client: the daemon, with
+config parsed and plugins already imported, resolves which journals to open,
+prepares each temporary copy and runs its hooks, while `journal` runs the
+editor itself. Plugin output is relayed back to the client, along with the
+descriptor holding each journal's lock, so a lock lasts only as long as the
+client holding it.
+
+The daemon reloads its Application when `.clerkrc` changes, and restarts
+itself (so plugin modules are imported afresh) when installed packages change.
+If the daemon can't be reached, `journal` simply does everything in-process.
+"""
+import contextlib
+import io
+import json
+import os
+import pathlib
+import sys
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+from clerk.config import config_file_path
+from clerk.config import temp_directory_path
+from clerk.files import FileSnapshot
+
+
+SOCKET_FILENAME = "daemon.sock"
+LOCK_FILENAME = "daemon.lock"
+# failures meaning the daemon never got (or went away before acting on) a request
+DAEMON_GONE = (
+    ConnectionRefusedError,
+    ConnectionResetError,
+    BrokenPipeError,
+    FileNotFoundError,
+)
+
+
+def socket_path(user_data_directory: pathlib.Path) -> pathlib.Path:
+    """Returns the path to the daemon's socket"""
+    return pathlib.Path(user_data_directory, SOCKET_FILENAME)
+
+
+def session_to_json(session) -> List:
+    """A JournalSession as plain JSON"""
+    snapshot = session.snapshot
+    return [
+        session.filename,
+        [snapshot.size, snapshot.mtime_ns, snapshot.inode, snapshot.digest.hex()],
+        session.modified,
+    ]
+
+
+def session_from_json(data: Sequence):
+    """A JournalSession from its JSON form"""
+    from clerk.app import JournalSession
+
+    filename, (size, mtime_ns, inode, digest), modified = data
+    return JournalSession(
+        filename, FileSnapshot(size, mtime_ns, inode, bytes.fromhex(digest)), modified
+    )
+
+
+def request(path: pathlib.Path, message: Dict, timeout: Optional[float] = 30) -> Dict:
+    """Send a request to the daemon and wait for its response (forever, if timeout is None)"""
+    import socket  # imported here to keep `journal` startup fast
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(str(path))
+        client.sendall(json.dumps(message).encode() + b"\n")
+        # a prepared journal's lock arrives with the start of the response
+        line, fds, _, _ = socket.recv_fds(client, 1 << 16, 1)
+        try:
+            if line and not line.endswith(b"\n"):
+                with client.makefile("rb") as f:
+                    line += f.readline()
+            if not line:
+                raise ConnectionError("the daemon closed the connection")
+            response = json.loads(line)
+        except BaseException:
+            for fd in fds:
+                os.close(fd)
+            raise
+    if fds:
+        response["lock"] = fds[0]
+    return response
+
+
+class Daemon:
+    """Serves `journal` clients from one long-lived Application"""
+
+    def __init__(self, user_data_directory: pathlib.Path):
+        """Initialize a daemon serving from the specified user data directory"""
+        self.user_data_directory = user_data_directory
+        self.running = True
+        self.restart = False
+        self.sessions: Dict = {}  # filename -> live sync Watcher (or None)
+        self.handover = None  # a prepared journal's lock, to pass to its client
+        self.load()
+
+    def signature(self) -> List:
+        """Changes when the config file or the installed packages do"""
+        from clerk.extensions import environment_fingerprint
+
+        try:
+            st = config_file_path().stat()
+            config = [st.st_mtime_ns, st.st_size, st.st_ino]
+        except FileNotFoundError:
+            config = None
+        return [config, environment_fingerprint()]
+
+    def load(self) -> None:
+        """(Re)build the Application from the current config and plugins"""
+        from clerk.app import create_application
+
+        self.loaded = self.signature()
+        self.app = create_application()
+
+    def handle(self, message: Dict) -> Dict:
+        """Handle one request, returning the response"""
+        command = message.get("command")
+        if command == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        if command == "stop":
+            self.running = False
+            return {"ok": True}
+        self.reap()
+        current = self.signature()
+        # reload between editing sessions, so open journals keep their Application
+        if current != self.loaded and not self.sessions:
+            if current[1] != self.loaded[1]:
+                # plugins may have changed; only a fresh process can re-import them
+                self.running = False
+                self.restart = True
+                return {"ok": False, "error": "restarting"}
+            self.load()
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                response = self.run_command(command, message)
+        except SystemExit as e:
+            response = {"ok": False, "exit": e.code}
+        except Exception as e:
+            response = {"ok": False, "error": repr(e)}
+        response["output"] = output.getvalue()
+        return response
+
+    def reap(self) -> None:
+        """Forget sessions whose client went away (releasing its lock) without finishing"""
+        from clerk.locks import is_open
+
+        for filename in list(self.sessions):
+            if not is_open(self.user_data_directory, filename):
+                watcher = self.sessions.pop(filename)
+                if watcher is not None:
+                    watcher.stop()
+
+    def run_command(self, command: str, message: Dict) -> Dict:
+        """Run a `journal` command on the Application"""
+        app = self.app
+        if command == "select":
+            return {"ok": True, "filenames": list(app.select_journals(message["args"]))}
+        if command == "prepare":
+            session = app.prepare_journal(message["filename"])
+            self.sessions[session.filename] = app.watch_journal(session)
+            # the client holds the lock from here on, so it's freed if the client dies
+            self.handover = app.locks.pop(session.filename)
+            return {
+                "ok": True,
+                "session": session_to_json(session),
+                "editor": app.editor_command(session.filename),
+            }
+        if command == "finish":
+            session = session_from_json(message["session"])
+            watcher = self.sessions.pop(session.filename, None)
+            app.finish_journal(session, watcher)
+            return {"ok": True}
+        if command == "abandon":
+            session = session_from_json(message["session"])
+            watcher = self.sessions.pop(session.filename, None)
+            if watcher is not None:
+                watcher.stop()
+            app.abandon_journal(session)
+            return {"ok": True}
+        if command == "editor":
+            return {"ok": True, "editor": app.editor_command(*message["filenames"])}
+        return {"ok": False, "error": f"unknown command: {command}"}
+
+    def serve(self, listener) -> None:
+        """Answer requests, one at a time, until asked to stop"""
+        import socket
+
+        while self.running:
+            connection, _ = listener.accept()
+            with connection:
+                try:
+                    with connection.makefile("rb") as f:
+                        message = json.loads(f.readline())
+                    response = self.handle(message)
+                    data = json.dumps(response).encode() + b"\n"
+                    handover, self.handover = self.handover, None
+                    if handover is None:
+                        connection.sendall(data)
+                        continue
+                    try:
+                        sent = socket.send_fds(connection, [data], [handover.fileno()])
+                        connection.sendall(data[sent:])
+                    finally:
+                        # if the client is already gone, so is the lock
+                        handover.hand_over()
+                except (OSError, ValueError):
+                    continue  # a client went away, or sent nonsense
+
+
+def run_client(
+    args: Sequence[str], user_data_directory: pathlib.Path, batch: bool = False
+) -> Optional[int]:
+    """Open journals through a running daemon, returning None if there isn't one"""
+    path = socket_path(user_data_directory)
+    if not path.exists():
+        return None
+    try:
+        response = request(path, {"command": "select", "args": list(args)})
+    except (OSError, ValueError):
+        return None  # a stale socket, or a daemon that's restarting
+    if not response["ok"]:
+        if "exit" not in response:
+            return None
+        print(response["output"], end="")
+        return response["exit"]
+    print(response["output"], end="")
+    filenames = response["filenames"]
+    if not filenames:
+        print(f"No journals found for '{' '.join(args)}'")
+        return 1
+    if batch and len(filenames) > 1:
+        return run_batch(path, filenames)
+    for filename in filenames:
+        response = send(path, {"command": "prepare", "filename": filename})
+        if not response["ok"]:
+            if "exit" in response:
+                return response["exit"]
+            # the daemon is restarting (or went away); open this one here
+            from clerk.app import create_application
+
+            create_application().open_journal(filename)
+            continue
+        lock = take_lock(path, response)
+        run_editor(response["editor"])
+        finish_session(path, response["session"], lock)
+    return 0
+
+
+def send(path: pathlib.Path, message: Dict) -> Dict:
+    """Send a request, relaying its output; a daemon that's gone away answers not ok"""
+    try:
+        # hooks may legitimately take a while, so wait for as long as they do
+        response = request(path, message, timeout=None)
+    except DAEMON_GONE:
+        response = {"ok": False, "output": ""}
+    except (OSError, ValueError) as e:
+        # the daemon may have acted on the request, so it isn't safe to redo it here
+        response = {
+            "ok": False,
+            "exit": 1,
+            "output": f"Lost touch with the clerk daemon ({e!r})\n",
+        }
+    print(response["output"], end="")
+    return response
+
+
+def run_editor(command: List[str]) -> None:
+    """Run the editor, in the client, so it has the terminal"""
+    import subprocess
+
+    try:
+        subprocess.run(command)
+    except OSError as e:
+        from clerk.app import report_editor_error
+
+        report_editor_error(e)
+
+
+def take_lock(path: pathlib.Path, response: Dict):
+    """Take over the lock on a journal the daemon prepared, if it passed one along"""
+    if "lock" not in response:
+        return None
+    from clerk.locks import JournalLock
+
+    return JournalLock.adopt(path.parent, response["session"][0], response["lock"])
+
+
+def let_go(lock, response: Dict) -> None:
+    """Release a session's lock once the daemon is done with it
+
+    If the daemon failed partway, the lock file is left behind, so the next
+    session recovers whatever the temporary copy holds.
+    """
+    if lock is None:
+        return
+    if response["ok"] or "exit" not in response:
+        lock.release()
+    else:
+        lock.hand_over()
+
+
+def finish_session(path: pathlib.Path, session: List, lock=None) -> None:
+    """Have the daemon finish a session, or finish it here if the daemon's gone"""
+    response = send(path, {"command": "finish", "session": session})
+    if not response["ok"] and "exit" not in response:
+        # the daemon went away while the editor was open; finish up here
+        from clerk.app import create_application
+
+        create_application().finish_journal(session_from_json(session))
+    let_go(lock, response)
+
+
+def run_batch(path: pathlib.Path, filenames: Sequence[str]) -> int:
+    """Open several journals through the daemon in a single editor invocation"""
+    sessions = []
+    for filename in filenames:
+        response = send(path, {"command": "prepare", "filename": filename})
+        if not response["ok"]:
+            for session, lock in sessions:
+                let_go(lock, send(path, {"command": "abandon", "session": session}))
+            if "exit" in response:
+                return response["exit"]
+            # the daemon is restarting (or went away); open them all here
+            from clerk.app import create_application
+
+            create_application().open_batch(filenames)
+            return 0
+        sessions.append((response["session"], take_lock(path, response)))
+    response = send(path, {"command": "editor", "filenames": list(filenames)})
+    if response["ok"]:
+        run_editor(response["editor"])
+    for session, lock in sessions:
+        finish_session(path, session, lock)
+    return 0
+
+
+def start() -> int:
+    """Start a detached daemon, unless one is already running"""
+    import subprocess
+
+    path = socket_path(temp_directory_path())
+    if path.exists():
+        try:
+            pid = request(path, {"command": "ping"}, timeout=5)["pid"]
+            print(f"clerk daemon is already running (pid {pid})")
+            return 0
+        except (OSError, ValueError):
+            pass
+    subprocess.Popen(
+        [sys.executable, "-m", "clerk.daemon"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    print("clerk daemon started")
+    return 0
+
+
+def stop() -> int:
+    """Stop the running daemon"""
+    try:
+        request(socket_path(temp_directory_path()), {"command": "stop"}, timeout=5)
+    except (OSError, ValueError):
+        print("clerk daemon isn't running")
+        return 1
+    print("clerk daemon stopped")
+    return 0
+
+
+def status() -> int:
+    """Report whether a daemon is running"""
+    try:
+        response = request(socket_path(temp_directory_path()), {"command": "ping"})
+    except (OSError, ValueError):
+        print("clerk daemon isn't running")
+        return 1
+    print(f"clerk daemon is running (pid {response['pid']})")
+    return 0
+
+
+def main() -> int:
+    """Daemon entrypoint: serve until stopped, restarting when plugins change"""
+    import fcntl
+    import socket
+
+    user_data_directory = temp_directory_path()
+    user_data_directory.mkdir(parents=True, exist_ok=True)
+    lock = open(pathlib.Path(user_data_directory, LOCK_FILENAME), "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return 0  # another daemon is already serving
+    path = socket_path(user_data_directory)
+    path.unlink(missing_ok=True)
+    daemon = Daemon(user_data_directory)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        previous_umask = os.umask(0o077)  # only this user may connect
+        try:
+            listener.bind(str(path))
+        finally:
+            os.umask(previous_umask)
+        listener.listen()
+        try:
+            daemon.serve(listener)
+        finally:
+            path.unlink(missing_ok=True)
+    if daemon.restart:
+        lock.close()
+        os.execv(sys.executable, [sys.executable, "-m", "clerk.daemon"])
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,244 @@
+"""Edit operations, and documents that apply them without rewriting whole journals
+
+Besides returning a whole new document, a callback may return a list of edit
+operations. Callbacks decorated with `returns_edits` receive a lazy view of
+the document instead of a list, so one that only appends (say, a timestamp)
+never reads a large journal into memory, and its lines are appended to the
+file rather than rewriting it.
+
+Generator function callbacks are streamed: they receive an iterator over the
+document's lines and yield the new document, which is written out as it's
+produced.
+"""
+import os
+import pathlib
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Union
+
+from clerk.files import atomic_write_lines
+from clerk.files import sibling_path
+
+
+class Append(NamedTuple):
+    """Add lines to the end of the document"""
+
+    lines: Sequence[str]
+
+    def apply_to(self, document: List[str]) -> None:
+        """Apply this edit to a list of lines, in place"""
+        document.extend(self.lines)
+
+
+class Prepend(NamedTuple):
+    """Add lines to the start of the document"""
+
+    lines: Sequence[str]
+
+    def apply_to(self, document: List[str]) -> None:
+        """Apply this edit to a list of lines, in place"""
+        document[:0] = self.lines
+
+
+class Insert(NamedTuple):
+    """Add lines before the line at `index`"""
+
+    index: int
+    lines: Sequence[str]
+
+    def apply_to(self, document: List[str]) -> None:
+        """Apply this edit to a list of lines, in place"""
+        document[self.index : self.index] = self.lines
+
+
+class Replace(NamedTuple):
+    """Replace the lines from `start` up to (but not including) `stop`"""
+
+    start: int
+    stop: int
+    lines: Sequence[str]
+
+    def apply_to(self, document: List[str]) -> None:
+        """Apply this edit to a list of lines, in place"""
+        document[self.start : self.stop] = self.lines
+
+
+Edit = Union[Append, Prepend, Insert, Replace]
+EDIT_TYPES = (Append, Prepend, Insert, Replace)
+
+
+def returns_edits(callback: Callable) -> Callable:
+    """Mark a callback as taking a lazy view of the document and returning edits"""
+    callback.returns_edits = True
+    return callback
+
+
+def is_edits(results: Sequence) -> bool:
+    """Whether a callback's results are edit operations, rather than lines"""
+    return (
+        isinstance(results, (list, tuple))
+        and bool(results)
+        and isinstance(results[0], EDIT_TYPES)
+    )
+
+
+def apply_edits(lines: Sequence[str], edits: Sequence[Edit]) -> List[str]:
+    """Apply edits in order (each to the result of the last), returning new lines"""
+    document = list(lines)
+    for edit in edits:
+        edit.apply_to(document)
+    return document
+
+
+class LinesView(Sequence):
+    """A read-only view of a document's lines, read from disk as they're needed
+
+    Iterating streams the document; indexing or taking its length reads it
+    into memory.
+    """
+
+    def __init__(self, document: "Document"):
+        """Initialize a view of the specified document"""
+        self._document = document
+
+    def __iter__(self) -> Iterator[str]:
+        """Stream the document's lines"""
+        return iter(self._document)
+
+    def __len__(self) -> int:
+        """The number of lines in the document"""
+        return len(self._document.lines())
+
+    def __getitem__(self, index):
+        """A line (or slice of lines) of the document"""
+        return self._document.lines()[index]
+
+
+class Document:
+    """A journal being passed through a hook, kept on disk for as long as possible
+
+    The document is only read into memory when a callback needs a list of
+    lines. Until then, appended lines are held as pending, and streamed
+    output is written to a temporary file alongside the journal.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        """Initialize a document backed by the specified file"""
+        self.target = pathlib.Path(path)
+        self.changed = False
+        self._source = self.target  # file holding the current contents
+        self._lines: Optional[List[str]] = None
+        self._appended: List[str] = []
+        self._streams = 0
+
+    def lines(self) -> List[str]:
+        """The document's current lines, read into memory"""
+        if self._lines is None:
+            with open(self._source, "r") as f:
+                self._lines = f.readlines()
+            self._lines.extend(self._appended)
+            self._appended = []
+        return self._lines
+
+    def __iter__(self) -> Iterator[str]:
+        """Stream the document's current lines"""
+        if self._lines is not None:
+            yield from list(self._lines)
+            return
+        appended = list(self._appended)
+        with open(self._source, "r") as f:
+            yield from f
+        yield from appended
+
+    def view(self) -> LinesView:
+        """A lazy, read-only view of the document"""
+        return LinesView(self)
+
+    def apply(self, edits: Sequence[Edit]) -> bool:
+        """Apply edit operations, returning whether they changed the document"""
+        if self._lines is None and all(isinstance(e, Append) for e in edits):
+            appended = [line for edit in edits for line in edit.lines]
+            self._appended.extend(appended)
+            self.changed |= bool(appended)
+            return bool(appended)
+        return self.replace(apply_edits(self.lines(), edits))
+
+    def replace(self, lines: Sequence[str]) -> bool:
+        """Replace the document's lines, returning whether they changed"""
+        if list(lines) == self.lines():
+            return False
+        self._lines = list(lines)
+        self.changed = True
+        return True
+
+    def stream(self, callback: Callable, conf: Mapping) -> bool:
+        """Pass the document through a generator callback, returning whether it changed"""
+        self._streams += 1
+        output = sibling_path(self.target, f"stream{self._streams}")
+        reference = iter(self)  # compared line by line as the output is written
+        same = True
+        try:
+            with open(output, "w") as f:
+                for line in callback(iter(self), conf):
+                    f.write(line)
+                    if same and next(reference, None) != line:
+                        same = False
+            if same and next(reference, None) is not None:
+                same = False
+        except BaseException:
+            output.unlink(missing_ok=True)
+            raise
+        if same:
+            output.unlink()
+            return False
+        self._discard_stream()
+        self._source = output
+        self._lines = None
+        self._appended = []
+        self.changed = True
+        return True
+
+    def _discard_stream(self) -> None:
+        """Remove the temporary file holding earlier streamed output, if any"""
+        if self._source != self.target:
+            self._source.unlink(missing_ok=True)
+            self._source = self.target
+
+    def save(self, fsync: bool = False) -> None:
+        """Write any changes back to the file the document was read from
+
+        Lines appended to an unmodified document are appended to the file, so
+        the write is proportional to what was added rather than to the journal.
+        """
+        if not self.changed:
+            return
+        if self._lines is not None:
+            atomic_write_lines(self.target, self._lines, fsync=fsync)
+            self._discard_stream()
+            return
+        with open(self._source, "a") as f:
+            f.writelines(self._appended)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self._appended = []
+        if self._source != self.target:
+            os.replace(self._source, self.target)
+            self._source = self.target
+
+    def close(self) -> None:
+        """Discard any unsaved temporary output"""
+        self._discard_stream()
+
+    def __enter__(self) -> "Document":
+        """Use the document as a context manager, cleaning up on exit"""
+        return self
+
+    def __exit__(self, *exc) -> None:
+        """Discard any unsaved temporary output"""
+        self.close()
@@ -0,0 +1,169 @@
+"""Exporting a range of journals to a single Markdown, JSON Lines or HTML document
+
+`clerk export` is a pipeline of generators: the catalog picks the journals in
+the date range, oldest first; each is read in large chunks (archived journals
+are decompressed a chunk at a time from the memory-mapped archive); entries
+are optionally passed through a hook's callbacks; and the document is written
+as it's rendered. Only one journal is held in memory at a time (and only when
+transforming it), however many are exported.
+"""
+import codecs
+import contextlib
+import datetime
+import html
+import json
+import os
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+
+from clerk.archive import Archive
+
+
+READ_SIZE = 1 << 20
+
+
+class Entry(NamedTuple):
+    """A journal being exported"""
+
+    date: datetime.datetime
+    filename: str
+    chunks: Iterable[str]  # its text, a piece at a time; read before the next entry
+
+
+def read_chunks(
+    journal_directory: str, filename: str, archive: Optional[Archive]
+) -> Iterator[str]:
+    """A journal's text, loose or archived, in chunks of about READ_SIZE"""
+    try:
+        f = open(
+            os.path.join(journal_directory, filename),
+            "r",
+            errors="replace",
+            buffering=READ_SIZE,
+        )
+    except FileNotFoundError:
+        entry = archive.entry(filename) if archive is not None else None
+        if entry is None:
+            raise
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for data in archive.stream(entry, READ_SIZE):
+            text = decoder.decode(data)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+        return
+    with f:
+        yield from iter(lambda: f.read(READ_SIZE), "")
+
+
+def read_entries(app, since: datetime.date, until: datetime.date) -> Iterator[Entry]:
+    """The journals from `since` through `until` (inclusive), oldest first"""
+    from clerk.archive import load_archive
+    from clerk.catalog import Catalog
+
+    directory = str(app.journal_directory)
+    with Catalog(app) as catalog:
+        entries = catalog.between(since, until)
+    archive = load_archive(directory)
+    try:
+        for date, filename in entries:
+            yield Entry(date, filename, read_chunks(directory, filename, archive))
+    finally:
+        if archive is not None:
+            archive.close()
+
+
+def transform_entries(
+    entries: Iterable[Entry], extensions: Sequence, config: Mapping
+) -> Iterator[Entry]:
+    """Pass each entry through a chain of plugin callbacks (without saving the result)"""
+    from clerk.hooks import run_pipeline
+
+    for entry in entries:
+        lines = "".join(entry.chunks).splitlines(keepends=True)
+        # plugins report every run, which would end up in an export to stdout
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            lines, _ = run_pipeline(extensions, lines, config)
+        yield entry._replace(chunks=lines)
+
+
+def with_final_newline(chunks: Iterable[str]) -> Iterator[str]:
+    """The chunks, followed by a newline if they don't already end with one"""
+    last = "\n"
+    for chunk in chunks:
+        if chunk:
+            yield chunk
+            last = chunk
+    if not last.endswith("\n"):
+        yield "\n"
+
+
+def render_markdown(entries: Iterable[Entry]) -> Iterator[str]:
+    """Entries as one Markdown document, each under a heading with its date"""
+    separator = ""
+    for entry in entries:
+        yield f"{separator}# {entry.date.date().isoformat()}\n\n"
+        yield from with_final_newline(entry.chunks)
+        separator = "\n"
+
+
+def render_jsonl(entries: Iterable[Entry]) -> Iterator[str]:
+    """Entries as JSON Lines, one {"date", "filename", "text"} object per journal"""
+    for entry in entries:
+        date = json.dumps(entry.date.date().isoformat())
+        yield f'{{"date": {date}, "filename": {json.dumps(entry.filename)}, "text": "'
+        # JSON escapes character by character, so the text can be encoded in pieces
+        for chunk in entry.chunks:
+            yield json.dumps(chunk)[1:-1]
+        yield '"}\n'
+
+
+def render_html(entries: Iterable[Entry]) -> Iterator[str]:
+    """Entries as a standalone HTML page, one <article> per journal"""
+    yield (
+        "<!DOCTYPE html>\n<html>\n<head>\n"
+        '<meta charset="utf-8">\n<title>Journal</title>\n'
+        "</head>\n<body>\n"
+    )
+    for entry in entries:
+        day = entry.date.date().isoformat()
+        yield f'<article id="{day}">\n<h2>{day}</h2>\n<pre>'
+        for chunk in entry.chunks:
+            yield html.escape(chunk)
+        yield "</pre>\n</article>\n"
+    yield "</body>\n</html>\n"
+
+
+RENDERERS: Dict[str, Callable[[Iterable[Entry]], Iterator[str]]] = {
+    "md": render_markdown,
+    "jsonl": render_jsonl,
+    "html": render_html,
+}
+
+
+def export(
+    app,
+    since: Optional[datetime.date] = None,
+    until: Optional[datetime.date] = None,
+    output_format: str = "md",
+    hook_name: Optional[str] = None,
+) -> Iterator[str]:
+    """The journals from `since` through `until` as a document, a chunk at a time
+
+    If `hook_name` is given, each journal is passed through that hook's
+    callbacks first, just as if it had been opened (or saved, or closed).
+    """
+    first = since or datetime.date.min
+    last = until or datetime.date.max - datetime.timedelta(days=1)
+    entries = read_entries(app, first, last)
+    if hook_name is not None:
+        entries = transform_entries(entries, app.hooks[hook_name], app.config)
+    return RENDERERS[output_format](entries)
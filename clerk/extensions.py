@@ -0,0 +1,148 @@
+"""Discovery of installed clerk plugins, backed by a persisted registry"""
+import importlib
+import json
+import os
+import pathlib
+import sys
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import NamedTuple
+from typing import Tuple
+
+from clerk.config import hook_plugin_names
+from clerk.files import atomic_write_lines
+
+
+ENTRY_POINT_GROUP = "clerk.extensions"
+REGISTRY_FILENAME = "extensions.json"
+REGISTRY_VERSION = 2
+
+
+class Extension(NamedTuple):
+    """A plugin registered under the `clerk.extensions` entry point group"""
+
+    name: str
+    value: str
+    version: str = ""  # of the distribution that provides it, if known
+
+    def load(self) -> Callable:
+        """Import and return the object this extension points to"""
+        module_name, _, attrs = self.value.split("[")[0].partition(":")
+        obj = importlib.import_module(module_name.strip())
+        for attr in attrs.strip().split("."):
+            if attr:
+                obj = getattr(obj, attr)
+        return obj
+
+
+def registry_path(user_data_directory: pathlib.Path) -> pathlib.Path:
+    """Returns the path to the persisted plugin registry"""
+    return pathlib.Path(user_data_directory, REGISTRY_FILENAME)
+
+
+def package_directories() -> List[str]:
+    """The `sys.path` directories distributions are installed into
+
+    The script's directory (or the working directory, for `python -m`) is left
+    out: it changes with wherever clerk was started, not with what's installed.
+    """
+    import site
+
+    installed = site.getsitepackages() + [site.getusersitepackages()]
+    installed = {os.path.realpath(directory) for directory in installed}
+    return [
+        entry for entry in sys.path if entry and os.path.realpath(entry) in installed
+    ]
+
+
+def environment_fingerprint() -> List:
+    """Returns a cheap fingerprint of the installed distributions
+
+    Installing, upgrading or removing a distribution adds or removes its
+    `.dist-info` directory, which bumps the mtime of the containing
+    site-packages directory; so the mtimes of those directories are enough to
+    tell whether the plugin registry is stale.
+    """
+    fingerprint: List = [sys.executable]
+    for entry in package_directories():
+        try:
+            fingerprint.append([entry, os.stat(entry).st_mtime_ns])
+        except OSError:
+            continue
+    return fingerprint
+
+
+def scan_entry_points() -> Dict[str, Tuple[str, str]]:
+    """Scan installed distributions for clerk plugins, and their versions (slow)"""
+    from importlib.metadata import distributions
+
+    found: Dict[str, Tuple[str, str]] = {}
+    for distribution in distributions():
+        for entrypoint in distribution.entry_points:
+            if entrypoint.group == ENTRY_POINT_GROUP:
+                # like entry_points(), the first distribution on sys.path wins
+                found.setdefault(
+                    entrypoint.name, (entrypoint.value, distribution.version)
+                )
+    return found
+
+
+def read_registry(user_data_directory: pathlib.Path) -> Dict[str, Tuple[str, str]]:
+    """Return the persisted registry, or an empty one if it is missing or stale"""
+    try:
+        with open(registry_path(user_data_directory), "r") as f:
+            registry = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if registry.get("version") != REGISTRY_VERSION:
+        return {}
+    if registry.get("fingerprint") != environment_fingerprint():
+        return {}
+    return registry.get("extensions", {})
+
+
+def write_registry(user_data_directory: pathlib.Path, extensions: Mapping) -> None:
+    """Persist the registry of installed plugins to the user data directory"""
+    path = registry_path(user_data_directory)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    registry = {
+        "version": REGISTRY_VERSION,
+        "fingerprint": environment_fingerprint(),
+        "extensions": dict(extensions),
+    }
+    atomic_write_lines(path, [json.dumps(registry)])
+
+
+def refresh_registry(
+    user_data_directory: pathlib.Path,
+) -> Dict[str, Tuple[str, str]]:
+    """Rebuild the persisted registry from the installed distributions"""
+    extensions = scan_entry_points()
+    try:
+        write_registry(user_data_directory, extensions)
+    except OSError:
+        pass  # a read-only data directory only costs us the cache
+    return extensions
+
+
+def load_extensions(
+    config: Mapping, user_data_directory: pathlib.Path
+) -> Dict[str, Extension]:
+    """Resolve the plugins named in the `[hooks]` config section
+
+    Installed plugins are looked up in the persisted registry, and the
+    distributions are only rescanned when the registry is stale or is missing
+    a configured plugin. Plugins that can't be found are left out, so
+    `Application` can report them.
+    """
+    wanted = {name for names in hook_plugin_names(config).values() for name in names}
+    if not wanted:
+        return {}
+    registry = read_registry(user_data_directory)
+    if not wanted.issubset(registry):
+        registry = refresh_registry(user_data_directory)
+    return {
+        name: Extension(name, *registry[name]) for name in wanted if name in registry
+    }
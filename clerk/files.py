@@ -0,0 +1,177 @@
+"""Utility functions for reading and writing journal files"""
+import os
+import pathlib
+from typing import Iterable
+from typing import NamedTuple
+from typing import Optional
+from typing import Union
+
+
+def sibling_path(path: pathlib.Path, suffix: str = "tmp") -> pathlib.Path:
+    """Returns a hidden, process-unique path next to the specified path"""
+    return path.with_name(f".{path.name}.{os.getpid()}.{suffix}")
+
+
+def atomic_write_lines(
+    path: Union[str, pathlib.Path], lines: Iterable[str], fsync: bool = False
+) -> None:
+    """Replace a file's contents with the specified lines in a single atomic step"""
+    path = pathlib.Path(path)
+    temporary = sibling_path(path)
+    try:
+        with open(temporary, "w") as f:
+            f.writelines(lines)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+
+
+CHUNK_SIZE = 1 << 20
+
+
+class FileSnapshot(NamedTuple):
+    """A file's stat signature and content digest at a point in time"""
+
+    size: int
+    mtime_ns: int
+    inode: int
+    digest: bytes
+
+
+def file_digest(path: Union[str, pathlib.Path]) -> bytes:
+    """Return the BLAKE2 digest of a file's raw bytes, read in fixed-size chunks"""
+    import hashlib
+
+    digest = hashlib.blake2b()
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+    return digest.digest()
+
+
+def take_snapshot(
+    path: Union[str, pathlib.Path], previous: Optional[FileSnapshot] = None
+) -> FileSnapshot:
+    """Record a file's current state, reusing `previous` if the file wasn't touched"""
+    st = os.stat(path)
+    if previous is not None and has_same_signature(previous, st):
+        return previous
+    return FileSnapshot(st.st_size, st.st_mtime_ns, st.st_ino, file_digest(path))
+
+
+def has_same_signature(snapshot: FileSnapshot, st: os.stat_result) -> bool:
+    """Whether a stat result matches the snapshot's size, mtime and inode"""
+    return (st.st_size, st.st_mtime_ns, st.st_ino) == snapshot[:3]
+
+
+def has_changed(snapshot: FileSnapshot, path: Union[str, pathlib.Path]) -> bool:
+    """Whether a file's contents differ from a snapshot
+
+    A different size or an identical (size, mtime, inode) signature settles it
+    without reading the file; otherwise the contents are hashed, since editors
+    commonly rewrite files they haven't changed.
+    """
+    st = os.stat(path)
+    if st.st_size != snapshot.size:
+        return True
+    if has_same_signature(snapshot, st):
+        return False
+    return file_digest(path) != snapshot.digest
+
+
+def copy_file_contents(source_fd: int, destination_fd: int, size: int) -> None:
+    """Copy bytes between file descriptors in the kernel where possible"""
+    copied = 0
+    try:
+        while copied < size:
+            n = os.copy_file_range(source_fd, destination_fd, size - copied)
+            if n == 0:
+                break
+            copied += n
+        return
+    except (AttributeError, OSError):
+        pass  # unsupported by this platform or filesystem pair
+    try:
+        while copied < size:
+            n = os.sendfile(destination_fd, source_fd, copied, size - copied)
+            if n == 0:
+                break
+            copied += n
+        return
+    except (AttributeError, OSError):
+        pass
+    os.lseek(source_fd, copied, os.SEEK_SET)
+    os.lseek(destination_fd, copied, os.SEEK_SET)
+    while True:
+        chunk = os.read(source_fd, CHUNK_SIZE)
+        if not chunk:
+            break
+        os.write(destination_fd, chunk)
+
+
+def fsync_directory(directory: pathlib.Path) -> None:
+    """Flush a directory entry change (e.g. a rename) to disk"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # directories can't be opened on some platforms
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_back(
+    source: Union[str, pathlib.Path],
+    destination: Union[str, pathlib.Path],
+    fsync: bool = False,
+    move: bool = False,
+) -> None:
+    """Atomically replace `destination` with the contents of `source`
+
+    With `move`, a source on the destination's filesystem is simply renamed
+    into place; otherwise its bytes are copied into a sibling of the
+    destination (using `copy_file_range`/`sendfile` where available), which is
+    then renamed over it. Either way, readers never see a partial file, and an
+    existing destination keeps its permissions.
+    """
+    source = pathlib.Path(source)
+    destination = pathlib.Path(destination)
+    try:
+        mode = os.stat(destination).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = None
+    same_filesystem = os.stat(source).st_dev == os.stat(destination.parent).st_dev
+    if move and same_filesystem:
+        if fsync:
+            with open(source, "rb+") as f:
+                os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(source, mode)
+        os.replace(source, destination)
+    else:
+        temporary = sibling_path(destination)
+        try:
+            with open(source, "rb") as src, open(temporary, "wb") as dst:
+                copy_file_contents(
+                    src.fileno(), dst.fileno(), os.fstat(src.fileno()).st_size
+                )
+                if fsync:
+                    os.fsync(dst.fileno())
+            if mode is not None:
+                os.chmod(temporary, mode)
+            os.replace(temporary, destination)
+        except BaseException:
+            temporary.unlink(missing_ok=True)
+            raise
+    if fsync:
+        fsync_directory(destination.parent)
@@ -0,0 +1,84 @@
+"""Handing the terminal over to the editor, leaving no Python process behind
+
+When nothing needs to run after the editor exits (no JOURNAL_SAVED or
+JOURNAL_CLOSED plugins, no live sync), `journal` doesn't wait for it: it forks
+a tiny detached `/bin/sh` finisher and then replaces itself with the editor
+via `os.execvp`. The finisher waits for the editor to exit, copies the journal
+back if it changed, and removes the temporary copy and lock file. The finisher
+holds the journal's lock, so it stays locked for as long as the editor is open.
+
+The finisher watches the editor's pid (which is `journal`'s, since exec keeps
+it), rather than anything the editor inherits: helpers an editor leaves running
+in the background (a server, a language server) would hold those open long
+after it exits. So the editor inherits nothing from clerk but the terminal.
+"""
+import os
+import pathlib
+import sys
+from typing import List
+
+
+SHELL = "/bin/sh"
+# $1 written back regardless? $2 temporary copy, $3 journal, $4 sibling of the
+# journal to copy into, $5 journal's mode, $6 lock file, $7 editor's pid
+FINISHER = """
+while kill -0 "$7" 2>/dev/null; do sleep 0.05 2>/dev/null || sleep 1; done
+if [ "$1" = 1 ] || ! cmp -s "$2" "$3"; then
+    cp "$2" "$4" && chmod "$5" "$4" && mv -f "$4" "$3" || exit 1
+fi
+rm -f "$2" "$6"
+"""
+
+
+def can_hand_off() -> bool:
+    """Whether this platform can exec the editor and finish up from a shell"""
+    return os.name == "posix" and hasattr(os, "fork") and os.path.exists(SHELL)
+
+
+def start_finisher(arguments: List[str], lock_fd: int) -> None:
+    """Fork the detached shell that waits for the editor to exit, then finishes up"""
+    if os.fork() != 0:
+        return
+    try:
+        os.setsid()  # out of the terminal's process group, so ^C or a hangup won't kill it
+        os.set_inheritable(lock_fd, True)  # hold the lock until we're done with it
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        os.execv(SHELL, [SHELL, "-c", FINISHER, "clerk-finish"] + arguments)
+    finally:
+        os._exit(127)
+
+
+def hand_off(
+    command: List[str],
+    temporary_copy: pathlib.Path,
+    journal: pathlib.Path,
+    modified: bool,
+    lock,
+) -> None:
+    """Replace this process with the editor, leaving a finisher to copy the journal back
+
+    Only returns if the editor couldn't be started, in which case the finisher
+    cleans up as if it had exited without saving.
+    """
+    from clerk.files import sibling_path
+
+    try:
+        mode = os.stat(journal).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = os.stat(temporary_copy).st_mode & 0o7777
+    arguments = [
+        "1" if modified else "0",
+        str(temporary_copy),
+        str(journal),
+        str(sibling_path(journal)),
+        f"{mode:o}",
+        str(lock.path),
+        str(os.getpid()),  # the editor's, after exec
+    ]
+    sys.stdout.flush()  # exec won't
+    sys.stderr.flush()
+    start_finisher(arguments, lock.fileno())
+    # the lock (like every descriptor Python opens) is closed on exec
+    os.execvp(command[0], command)
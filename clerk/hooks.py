@@ -0,0 +1,355 @@
+"""Running plugin callbacks over journal documents"""
+import inspect
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from clerk.cache import ResultCache
+from clerk.cache import is_cacheable
+from clerk.config import get_boolean
+from clerk.config import get_float
+from clerk.edits import Document
+from clerk.edits import apply_edits
+from clerk.edits import is_edits
+from clerk.profiling import is_profiling
+from clerk.profiling import span
+
+
+_loaded_callbacks: Dict = {}
+
+
+class Step(NamedTuple):
+    """A plugin callback, ready to run as part of a hook"""
+
+    name: str
+    callback: Callable
+    conf: Mapping
+    concurrent: bool
+    timeout: Optional[float]
+    cache: Optional[ResultCache] = None  # set if the callback's results are cached
+    cache_key: str = ""
+
+
+def load_callback(extension) -> Callable:
+    """Load a plugin's callback function, at most once per process"""
+    try:
+        return _loaded_callbacks[extension]
+    except KeyError:
+        with span(f"load {extension.name}", "plugin"):
+            callback = _loaded_callbacks[extension] = extension.load()
+        return callback
+
+
+def plugin_config(config: Mapping, name: str) -> Mapping:
+    """A plugin's config section, or the DEFAULT section for a plugin without one"""
+    if name in config:
+        return config[name]  # configparser sections inherit DEFAULT themselves
+    return config["DEFAULT"] if "DEFAULT" in config else {}
+
+
+def prepare_steps(
+    extensions: Sequence, config: Mapping, cache: Optional[ResultCache] = None
+) -> List[Step]:
+    """Load the callbacks for a hook along with their clerk-specific settings
+
+    A plugin's config section may set `hook_concurrent = yes` to run alongside
+    its concurrent neighbours, and `hook_timeout = <seconds>` to bound how long
+    clerk waits for it. Given a cache, cacheable callbacks (see clerk.cache)
+    have their results looked up there.
+    """
+    steps = []
+    for extension in extensions:
+        conf = plugin_config(config, extension.name)
+        callback = load_callback(extension)
+        step = Step(
+            extension.name,
+            callback,
+            conf,
+            get_boolean(conf, "hook_concurrent"),
+            get_float(conf, "hook_timeout"),
+        )
+        if cache is not None and is_cacheable(callback, conf):
+            per_day = getattr(callback, "cacheable", None) == "per_day"
+            version = getattr(extension, "version", "")
+            step_key = cache.step_key(extension.name, version, conf, per_day)
+            step = step._replace(cache=cache, cache_key=step_key)
+        steps.append(step)
+    return steps
+
+
+DEFERRABLE_HOOKS = ("JOURNAL_SAVED", "JOURNAL_CLOSED")
+
+
+def is_deferred(hook_name: str, extension, config: Mapping) -> bool:
+    """Whether a plugin is configured (with `hook_deferred`) to run after `journal` returns"""
+    if hook_name not in DEFERRABLE_HOOKS:
+        return False
+    conf = plugin_config(config, extension.name)
+    return get_boolean(conf, "hook_deferred")
+
+
+def count_changed_lines(before: Sequence[str], after: Sequence[str]) -> int:
+    """Roughly how many lines differ between two versions of a document"""
+    return sum(a != b for a, b in zip(before, after)) + abs(len(before) - len(after))
+
+
+def report(step: Step, results) -> None:
+    """Tell the user what a callback did"""
+    if results:
+        print(f"{step.name} ran; changes applied!")
+    else:
+        print(f"{step.name} ran; no changes made")
+
+
+def needs_event_loop(steps: Sequence[Step]) -> bool:
+    """Whether a chain has async callbacks, timeouts or concurrent callbacks"""
+    return any(
+        step.concurrent
+        or step.timeout is not None
+        or inspect.iscoroutinefunction(step.callback)
+        for step in steps
+    )
+
+
+def collect(results):
+    """A callback's results as a list, if it returned some other iterable (like a generator)"""
+    if results is None or isinstance(results, (list, tuple)):
+        return results
+    return list(results)
+
+
+def as_lines(lines: List[str], results):
+    """A callback's results as a new document, applying them if they're edits"""
+    results = collect(results)
+    if is_edits(results):
+        return apply_edits(lines, results)
+    return results
+
+
+def invoke(step: Step, lines: List[str]):
+    """Call a synchronous callback on a copy of the document, returning its new lines
+
+    Generator functions are fed an iterator over the lines and their output
+    collected; callbacks returning edits have them applied.
+    """
+    if inspect.isgeneratorfunction(step.callback):
+        results = list(step.callback(iter(list(lines)), step.conf))
+        return results if results != lines else None
+    return as_lines(lines, step.callback(list(lines), step.conf))
+
+
+def cached_invoke(step: Step, lines: List[str], details: Dict):
+    """Invoke a callback, or skip it if its result for these lines is in the cache"""
+    if step.cache is None:
+        return invoke(step, lines)
+    key = step.cache.key(step.cache_key, lines)
+    hit, results = step.cache.get(key)
+    details["cached"] = hit
+    if not hit:
+        results = invoke(step, lines)
+        step.cache.put(key, results)
+    return results
+
+
+def run_pipeline(
+    extensions: Sequence,
+    lines: List[str],
+    config: Mapping,
+    cache: Optional[ResultCache] = None,
+) -> Tuple[List[str], bool]:
+    """Pass a document through a chain of plugin callbacks, in memory
+
+    Each callback receives the output of the previous one, exactly as if the
+    document had been written back to disk in between. Returns the resulting
+    lines, and whether they differ from the input.
+
+    Chains with async callbacks, timeouts or concurrent callbacks are run on
+    an asyncio event loop (see run_pipeline_async).
+    """
+    steps = prepare_steps(extensions, config, cache)
+    if needs_event_loop(steps):
+        import asyncio
+
+        document = asyncio.run(run_pipeline_async(steps, lines))
+        return document, document != lines
+    document = lines
+    for step in steps:
+        with span(step.name, "callback") as details:
+            # callbacks get their own copy, so in-place edits are only kept if returned
+            results = cached_invoke(step, document, details)
+            if results and is_profiling():
+                details["lines_changed"] = count_changed_lines(document, results)
+        report(step, results)
+        if results:
+            document = list(results)
+    return document, document != lines
+
+
+def run_document(
+    extensions: Sequence,
+    document: Document,
+    config: Mapping,
+    cache: Optional[ResultCache] = None,
+) -> bool:
+    """Pass an on-disk document through a chain of plugin callbacks
+
+    Unlike run_pipeline, the document is only read into memory for callbacks
+    that need a list of lines: streaming (generator) callbacks are written
+    through a temporary file, and `returns_edits` callbacks that only append
+    leave the journal to be appended to. Cached callbacks are looked up by the
+    whole document, so it's read for them. Returns whether the document changed.
+    """
+    steps = prepare_steps(extensions, config, cache)
+    if needs_event_loop(steps):
+        import asyncio
+
+        lines = document.lines()
+        return document.replace(asyncio.run(run_pipeline_async(steps, lines)))
+    for step in steps:
+        with span(step.name, "callback") as details:
+            # streamed from disk, so profiling doesn't read the document into memory
+            before = list(document) if is_profiling() else None
+            if step.cache is not None:
+                results = cached_invoke(step, document.lines(), details)
+                results = results and document.replace(results)
+            elif inspect.isgeneratorfunction(step.callback):
+                results = document.stream(step.callback, step.conf)
+            else:
+                if getattr(step.callback, "returns_edits", False) is True:
+                    results = step.callback(document.view(), step.conf)
+                else:
+                    results = step.callback(list(document.lines()), step.conf)
+                results = collect(results)
+                if is_edits(results):
+                    results = document.apply(results)
+                elif results:
+                    document.replace(results)
+            if results and before is not None:
+                details["lines_changed"] = count_changed_lines(before, list(document))
+        report(step, results)
+    return document.changed
+
+
+async def run_pipeline_async(steps: Sequence[Step], lines: List[str]) -> List[str]:
+    """Run a chain of callbacks, overlapping runs of concurrent ones
+
+    Consecutive callbacks marked `hook_concurrent` all receive the same
+    document at once. Lines they append are merged in configured order; one
+    that changed existing lines is re-run afterwards on the merged document.
+    Synchronous callbacks run on daemon threads, and a callback that exceeds
+    its `hook_timeout` is cancelled (or, if it's synchronous, abandoned, without
+    keeping the process alive) and treated as making no changes.
+    """
+    document = lines
+    i = 0
+    while i < len(steps):
+        group = [steps[i]]
+        i += 1
+        while group[0].concurrent and i < len(steps) and steps[i].concurrent:
+            group.append(steps[i])
+            i += 1
+        if len(group) == 1:
+            results = await call_step(group[0], document)
+            report(group[0], results)
+            if results:
+                document = list(results)
+            continue
+        document = await run_concurrently(group, document)
+    return document
+
+
+def run_in_thread(function: Callable, *args):
+    """Run a function on a daemon thread, returning an asyncio future for its result
+
+    Unlike an executor's worker threads, a daemon thread running a callback
+    that timed out doesn't hold up interpreter exit.
+    """
+    import asyncio
+    import threading
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(result, error) -> None:
+        """Resolve the future, unless it was cancelled (by a timeout)"""
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run() -> None:
+        """Call the function, and hand its outcome back to the event loop"""
+        result = error = None
+        try:
+            result = function(*args)
+        except BaseException as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(settle, result, error)
+        except RuntimeError:
+            pass  # abandoned, and the event loop has since closed
+
+    threading.Thread(target=run, name="clerk-hook", daemon=True).start()
+    return future
+
+
+async def run_concurrently(group: Sequence[Step], document: List[str]) -> List[str]:
+    """Run a group of concurrent callbacks over one document and merge their output"""
+    import asyncio
+
+    outputs = await asyncio.gather(*(call_step(step, document) for step in group))
+    merged = list(document)
+    rerun = []
+    for step, results in zip(group, outputs):
+        if results and list(results[: len(document)]) != document:
+            rerun.append(step)
+            continue
+        report(step, results)
+        if results:
+            merged.extend(results[len(document) :])
+    for step in rerun:
+        print(f"{step.name} changed existing lines; re-running it after the others")
+        results = await call_step(step, merged)
+        report(step, results)
+        if results:
+            merged = list(results)
+    return merged
+
+
+async def call_step(step: Step, document: List[str]):
+    """Run a single callback, honouring its timeout"""
+    import asyncio
+
+    key = None
+    if step.cache is not None:
+        key = step.cache.key(step.cache_key, document)
+        hit, results = step.cache.get(key)
+        if hit:
+            with span(step.name, "callback") as details:
+                details["cached"] = True
+            return results
+    if inspect.iscoroutinefunction(step.callback):
+        pending = step.callback(list(document), step.conf)
+    else:
+        pending = run_in_thread(invoke, step, document)
+    with span(step.name, "callback") as details:
+        try:
+            results = await asyncio.wait_for(pending, step.timeout)
+        except asyncio.TimeoutError:
+            details["timed_out"] = True
+            print(f"{step.name} timed out after {step.timeout:g}s; skipping it")
+            return None
+        results = as_lines(document, results)
+        if results and is_profiling():
+            details["lines_changed"] = count_changed_lines(document, results)
+    results = list(results) if results else results
+    if key is not None:
+        step.cache.put(key, results)
+    return results
@@ -0,0 +1,182 @@
+"""A durable queue of deferred hooks, drained by a detached worker process
+
+Callbacks configured with `hook_deferred` on the JOURNAL_SAVED or
+JOURNAL_CLOSED hooks don't hold up `journal`: once the journal has been
+written back, a job holding a snapshot of it is written to the queue in the
+user data directory, and a detached worker (`python -m clerk.jobs`) runs it.
+
+Jobs are only removed from the queue once they've finished, so a worker that
+crashes (or a machine that reboots) leaves them to be picked up by the next
+worker: every job runs at least once. A job is never written back over a
+journal that was edited after it was queued.
+"""
+import json
+import os
+import pathlib
+import sys
+import time
+import traceback
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+from clerk.files import FileSnapshot
+from clerk.files import atomic_write_lines
+from clerk.files import has_changed
+from clerk.files import sibling_path
+from clerk.files import take_snapshot
+from clerk.files import write_back
+from clerk.locks import is_open
+
+
+JOBS_DIRECTORY = "jobs"
+JOB_VERSION = 1
+
+
+def queue_directory(user_data_directory: pathlib.Path) -> pathlib.Path:
+    """Returns the directory holding queued jobs"""
+    return pathlib.Path(user_data_directory, JOBS_DIRECTORY, "queue")
+
+
+def failed_directory(user_data_directory: pathlib.Path) -> pathlib.Path:
+    """Returns the directory holding jobs that failed or conflicted"""
+    return pathlib.Path(user_data_directory, JOBS_DIRECTORY, "failed")
+
+
+def enqueue_job(app, filename: str, steps: Sequence[Tuple[str, str]]) -> pathlib.Path:
+    """Queue deferred (hook name, plugin name) steps to run over a journal"""
+    journal = pathlib.Path(app.journal_directory, filename)
+    base = take_snapshot(journal)
+    with open(journal, "r") as f:
+        lines = f.readlines()
+    job = {
+        "version": JOB_VERSION,
+        "journal": str(journal),
+        "filename": filename,
+        "steps": [list(step) for step in steps],
+        "base": [base.size, base.mtime_ns, base.inode, base.digest.hex()],
+        "lines": lines,
+    }
+    directory = queue_directory(app.temp_directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = pathlib.Path(directory, f"{time.time_ns():020d}-{os.getpid()}.json")
+    atomic_write_lines(path, [json.dumps(job)], fsync=True)
+    return path
+
+
+def pending_jobs(user_data_directory: pathlib.Path) -> List[pathlib.Path]:
+    """The queued jobs, oldest first"""
+    try:
+        names = os.listdir(queue_directory(user_data_directory))
+    except FileNotFoundError:
+        return []
+    return [
+        pathlib.Path(queue_directory(user_data_directory), name)
+        for name in sorted(names)
+        if name.endswith(".json") and not name.startswith(".")
+    ]
+
+
+def start_worker() -> None:
+    """Start a detached worker to drain the queue (it exits if one is already running)"""
+    import subprocess
+
+    subprocess.Popen(
+        [sys.executable, "-m", "clerk.jobs"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def fail_job(path: pathlib.Path, job: dict, reason: str) -> None:
+    """Move a job out of the queue, recording why it didn't complete"""
+    directory = failed_directory(path.parents[2])
+    directory.mkdir(parents=True, exist_ok=True)
+    job["reason"] = reason
+    atomic_write_lines(pathlib.Path(directory, path.name), [json.dumps(job)])
+    path.unlink()
+
+
+def run_job(app, path: pathlib.Path) -> str:
+    """Run a queued job, returning "done", "busy" (try later), "conflict" or "failed" """
+    with open(path, "r", errors="replace") as f:
+        text = f.read()
+    try:
+        job = json.loads(text)
+        journal = pathlib.Path(job["journal"])
+        size, mtime_ns, inode, digest = job["base"]
+        base = FileSnapshot(size, mtime_ns, inode, bytes.fromhex(digest))
+        filename = job["filename"]
+    except (ValueError, KeyError, TypeError) as e:
+        # a corrupt job would otherwise crash every worker that reached it
+        fail_job(path, {"contents": text}, f"unreadable job ({type(e).__name__}: {e})")
+        return "failed"
+    if is_open(app.temp_directory, filename):
+        return "busy"  # the journal is open again; its session will write it back
+    if not journal.exists() or has_changed(base, journal):
+        fail_job(path, job, "the journal was edited after this job was queued")
+        return "conflict"
+    try:
+        extensions = [app.extensions[name] for _, name in job["steps"]]
+        from clerk.hooks import run_pipeline
+
+        results, changed = run_pipeline(
+            extensions, job["lines"], app.config, app.result_cache
+        )
+    except Exception:
+        fail_job(path, job, traceback.format_exc())
+        return "failed"
+    if changed:
+        if has_changed(base, journal):
+            fail_job(path, job, "the journal was edited while this job ran")
+            return "conflict"
+        # staged next to the journal, then moved over it keeping its permissions
+        staging = sibling_path(journal, "job")
+        try:
+            with open(staging, "w") as f:
+                f.writelines(results)
+            write_back(staging, journal, fsync=app.fsync, move=True)
+        finally:
+            staging.unlink(missing_ok=True)
+        from clerk.search import refresh_entry
+
+        refresh_entry(app, filename)
+    path.unlink()
+    return "done"
+
+
+def drain(app) -> int:
+    """Run every queued job once, returning how many completed"""
+    return sum(
+        run_job(app, path) == "done" for path in pending_jobs(app.temp_directory)
+    )
+
+
+def main() -> int:
+    """Worker entrypoint: drain the queue, unless another worker is already on it"""
+    import fcntl
+
+    from clerk.app import create_application
+
+    app = create_application()
+    lock_path = pathlib.Path(app.temp_directory, JOBS_DIRECTORY, "worker.lock")
+    attempted = set()
+    while True:
+        with open(lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0  # the running worker will pick up our jobs
+            for path in pending_jobs(app.temp_directory):
+                if path not in attempted:
+                    attempted.add(path)
+                    run_job(app, path)
+        # a worker started while we held the lock left its jobs to us
+        if set(pending_jobs(app.temp_directory)) <= attempted:
+            return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,170 @@
+"""Sharded journal directory layouts
+
+By default every journal lives directly in the journal directory. Setting
+`layout` in .clerkrc to a strftime path template, like `%%Y/%%m`, files each
+journal in a shard directory for its date instead (`2021/01/2021-01-04.md`),
+so no one directory grows without bound. Journal filenames throughout clerk
+are then paths relative to the journal directory, separated by `/`.
+
+`clerk migrate-layout` moves existing journals to wherever the current layout
+puts them. Each journal is moved with a single atomic rename, so an
+interrupted migration leaves every journal either where it was or where it
+belongs, and running it again picks up where it left off.
+"""
+import datetime
+import os
+import pathlib
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Set
+from typing import Tuple
+
+
+class Move(NamedTuple):
+    """What happened to one journal filed in the previous layout"""
+
+    source: str
+    destination: str
+    status: str  # "moved", "busy" (open, or queued for a deferred hook) or "conflict"
+
+
+def normalize_layout(layout: str) -> str:
+    """A layout template without empty, leading or trailing path components"""
+    return "/".join(part for part in layout.split("/") if part)
+
+
+def layout_depth(layout: str) -> int:
+    """How many directories deep a (normalized) layout files journals"""
+    return layout.count("/") + 1 if layout else 0
+
+
+def layout_filename(layout: str, date: datetime.date, name: str) -> str:
+    """Where a layout files the journal named `name`, relative to the journal directory"""
+    return f"{date.strftime(layout)}/{name}" if layout else name
+
+
+def journals_in_layout(app, layout: str) -> Iterator[Tuple[str, datetime.datetime]]:
+    """The loose journals filed where `layout` puts them, as (filename, date)"""
+    depth = layout_depth(layout)
+    pending = [("", 0)]
+    while pending:
+        relative, level = pending.pop()
+        try:
+            entries = list(os.scandir(os.path.join(app.journal_directory, relative)))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            filename = f"{relative}/{entry.name}" if relative else entry.name
+            if level < depth:
+                if entry.is_dir():
+                    pending.append((filename, level + 1))
+                continue
+            date = app.convert_from_filename(entry.name)
+            if (
+                date is not None
+                and entry.is_file()
+                and layout_filename(layout, date, entry.name) == filename
+            ):
+                yield filename, date
+
+
+def queued_journals(user_data_directory: pathlib.Path) -> Set[str]:
+    """The journals that deferred jobs are waiting to run over"""
+    import json
+
+    from clerk.jobs import pending_jobs
+
+    queued = set()
+    for path in pending_jobs(user_data_directory):
+        try:
+            with open(path, "r") as f:
+                queued.add(json.load(f)["filename"])
+        except (OSError, ValueError, KeyError):
+            pass  # finished (or unreadable) meanwhile
+    return queued
+
+
+def remove_empty_directories(journal_directory: str, relatives: Set[str]) -> None:
+    """Remove shard directories left empty, and any parents they leave empty"""
+    for relative in sorted(relatives, key=lambda r: r.count("/"), reverse=True):
+        while relative:
+            try:
+                os.rmdir(os.path.join(journal_directory, relative))
+            except OSError:
+                break  # not empty (or already gone)
+            relative = relative.rpartition("/")[0]
+
+
+def migrate_archive(app, previous_layout: str, dry_run: bool = False) -> List[Move]:
+    """Rename archived journals filed in the previous layout, rewriting the archive once"""
+    from clerk.archive import MAX_NAME_LENGTH
+    from clerk.archive import archive_path
+    from clerk.archive import load_archive
+    from clerk.archive import write_archive
+
+    archive = load_archive(app.journal_directory)
+    if archive is None:
+        return []
+    moves = []
+    with archive:
+        names = {entry.name for entry in archive}
+        renamed = []
+        for entry in archive:
+            name = entry.name
+            base = name.rpartition("/")[2]
+            date = app.convert_from_filename(base)
+            destination = app.convert_to_filename(date) if date is not None else name
+            if (
+                destination != name
+                and layout_filename(previous_layout, date, base) == name
+            ):
+                if destination in names or len(destination.encode()) > MAX_NAME_LENGTH:
+                    moves.append(Move(name, destination, "conflict"))
+                else:
+                    moves.append(Move(name, destination, "moved"))
+                    name = destination
+            renamed.append((name, entry))
+        if not dry_run and any(move.status == "moved" for move in moves):
+            entries = (
+                (name, archive.compressed(entry), entry.size, entry.mtime_ns)
+                for name, entry in renamed
+            )
+            write_archive(archive_path(app.journal_directory), entries, app.fsync)
+    return moves
+
+
+def migrate_layout(app, previous_layout: str = "", dry_run: bool = False) -> List[Move]:
+    """Move journals filed in `previous_layout` to where the configured layout puts them"""
+    from clerk.files import fsync_directory
+    from clerk.locks import is_open
+
+    previous_layout = normalize_layout(previous_layout)
+    queued = queued_journals(app.temp_directory)
+    moves = []
+    emptied = set()
+    for source, date in list(journals_in_layout(app, previous_layout)):
+        destination = app.convert_to_filename(date)
+        if destination == source:
+            continue
+        target = pathlib.Path(app.journal_directory, destination)
+        if is_open(app.temp_directory, source) or source in queued:
+            status = "busy"
+        elif os.path.lexists(target):
+            status = "conflict"  # e.g. a new journal was opened before migrating
+        else:
+            status = "moved"
+            if not dry_run:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.rename(pathlib.Path(app.journal_directory, source), target)
+                if app.fsync:
+                    fsync_directory(target.parent)
+                emptied.add(source.rpartition("/")[0])
+        moves.append(Move(source, destination, status))
+    if app.fsync:
+        for relative in emptied:
+            fsync_directory(pathlib.Path(app.journal_directory, relative))
+    remove_empty_directories(app.journal_directory, emptied)
+    return moves + migrate_archive(app, previous_layout, dry_run)
@@ -0,0 +1,192 @@
+"""Locks marking which journals are open in an editor
+
+Each open journal has a lock file under `locks/` in the user data directory,
+stamped with the host and process that opened it, and held with an `fcntl`
+advisory lock for as long as the session lasts. A lock file that nobody holds
+was left behind by a session that crashed: its temporary copy (which may hold
+unsaved work) is moved aside to `recovered/`, and the journal can be opened
+again.
+"""
+import datetime
+import fcntl
+import json
+import os
+import pathlib
+import socket
+import time
+from typing import Dict
+from typing import Optional
+
+
+LOCKS_DIRECTORY = "locks"
+RECOVERED_DIRECTORY = "recovered"
+
+
+class JournalLocked(Exception):
+    """The journal is open in another session"""
+
+    def __init__(self, filename: str, owner: Optional[Dict]):
+        """Record who holds the lock, if we know"""
+        self.filename = filename
+        self.owner = owner
+        if owner:
+            super().__init__(
+                f"{filename} is open (process {owner['pid']} on {owner['host']})"
+            )
+        else:
+            super().__init__(f"{filename} is open")
+
+
+def lock_path(user_data_directory: pathlib.Path, filename: str) -> pathlib.Path:
+    """Returns the path to a journal's lock file"""
+    return pathlib.Path(user_data_directory, LOCKS_DIRECTORY, f"{filename}.lock")
+
+
+def read_owner(f) -> Optional[Dict]:
+    """The host and process recorded in an open lock file, if any"""
+    f.seek(0)
+    try:
+        owner = json.loads(f.read())
+    except ValueError:
+        return None
+    return owner if isinstance(owner, dict) and "pid" in owner else None
+
+
+def recover(
+    user_data_directory: pathlib.Path, temporary_copy: pathlib.Path
+) -> pathlib.Path:
+    """Move a crashed session's temporary copy aside, returning where it went"""
+    directory = pathlib.Path(user_data_directory, RECOVERED_DIRECTORY)
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    destination = pathlib.Path(directory, f"{temporary_copy.name}.{stamp}")
+    os.replace(temporary_copy, destination)
+    return destination
+
+
+class JournalLock:
+    """An exclusive lock on one journal, held for an editing session"""
+
+    def __init__(self, user_data_directory: pathlib.Path, filename: str):
+        """Prepare (but don't take) the lock on a journal"""
+        self.user_data_directory = pathlib.Path(user_data_directory)
+        self.filename = filename
+        self.path = lock_path(user_data_directory, filename)
+        self.recovered: Optional[pathlib.Path] = None
+        self._file = None
+
+    def acquire(self, wait: float = 0) -> "JournalLock":
+        """Take the lock, raising JournalLocked if the journal is open elsewhere
+
+        If another session holds the lock, wait up to `wait` seconds for it to
+        finish. A temporary copy left by a crashed session is moved aside (see
+        `recovered`). One with no lock file at all is assumed to be open, since
+        there's no telling who made it.
+        """
+        temporary_copy = pathlib.Path(self.user_data_directory, self.filename)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        deadline = time.monotonic() + wait
+        while True:
+            f = open(self.path, "a+")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                owner = read_owner(f)
+                f.close()
+                if time.monotonic() < deadline:
+                    time.sleep(0.02)
+                    continue
+                raise JournalLocked(self.filename, owner) from None
+            # the previous holder may have removed the file as we opened it
+            try:
+                if os.stat(self.path).st_ino == os.fstat(f.fileno()).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()
+        owner = read_owner(f)
+        if temporary_copy.exists():
+            if owner is None or owner["host"] != socket.gethostname():
+                if owner is None:
+                    self.path.unlink()  # an empty lock file tells us nothing
+                f.close()
+                raise JournalLocked(self.filename, owner)
+            # nobody holds the lock, so the session that wrote it is gone
+            self.recovered = recover(self.user_data_directory, temporary_copy)
+        self._file = f
+        self._stamp()
+        return self
+
+    def _stamp(self) -> None:
+        """Record this process as the lock's owner"""
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(
+            json.dumps(
+                {
+                    "pid": os.getpid(),
+                    "host": socket.gethostname(),
+                    "started": datetime.datetime.now().isoformat(),
+                }
+            )
+        )
+        self._file.flush()
+
+    @classmethod
+    def adopt(
+        cls, user_data_directory: pathlib.Path, filename: str, fd: int
+    ) -> "JournalLock":
+        """Take over a lock held by a descriptor passed from another process"""
+        lock = cls(user_data_directory, filename)
+        os.set_inheritable(fd, False)
+        lock._file = os.fdopen(fd, "a+")
+        lock._stamp()
+        return lock
+
+    def fileno(self) -> int:
+        """The descriptor holding the lock (a process inheriting it shares the lock)"""
+        return self._file.fileno()
+
+    def hand_over(self) -> None:
+        """Close this process's descriptor, leaving the lock to whoever else holds it
+
+        If nobody else does (say, the process it was passed to has died), the
+        lock file is left for the next session to find, as if this one crashed.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def release(self) -> None:
+        """Release the lock, removing its lock file"""
+        if self._file is None:
+            return
+        self.path.unlink(missing_ok=True)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> "JournalLock":
+        """Hold the lock for the duration of a with block"""
+        return self.acquire()
+
+    def __exit__(self, *exc_info) -> None:
+        """Release the lock"""
+        self.release()
+
+
+def is_open(user_data_directory: pathlib.Path, filename: str) -> bool:
+    """Whether a journal is open in an editing session (without waiting on its lock)"""
+    try:
+        f = open(lock_path(user_data_directory, filename), "r")
+    except FileNotFoundError:
+        # sessions that predate lock files only left a temporary copy
+        return pathlib.Path(user_data_directory, filename).exists()
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        owner = read_owner(f)
+        if owner is None:
+            return pathlib.Path(user_data_directory, filename).exists()
+        return owner["host"] != socket.gethostname()
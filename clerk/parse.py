@@ -1,10 +1,12 @@
 """Utility functions for resolving user input to dates"""
 import datetime
-import operator
+import functools
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
 from typing import Union
 
-from word2number import w2n
-
 
 SCALES = {
     "days": 1,
@@ -27,62 +29,132 @@ DAYS_OF_WEEK = {
     "sunday": 6,
 }
 
+NUMBER_WORDS = {
+    "a": 1,
+    "an": 1,
+    "zero": 0,
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+    "eleven": 11,
+    "twelve": 12,
+    "thirteen": 13,
+    "fourteen": 14,
+    "fifteen": 15,
+    "sixteen": 16,
+    "seventeen": 17,
+    "eighteen": 18,
+    "nineteen": 19,
+    "twenty": 20,
+    "thirty": 30,
+    "forty": 40,
+    "fifty": 50,
+    "sixty": 60,
+    "seventy": 70,
+    "eighty": 80,
+    "ninety": 90,
+}
+
+NUMBER_SCALES = {
+    "thousand": 1000,
+    "million": 1000000,
+}
+
+# days from the reference date
+FIXED_DAYS = {
+    "today": 0,
+    "yesterday": -1,
+    "tomorrow": 1,
+}
+
+# days from the reference date, given (target weekday - reference weekday)
+RELATIVE_WEEKDAYS = {
+    "last": lambda difference: difference - 7,
+    "this": lambda difference: difference,
+    "next": lambda difference: difference + 7,
+}
+
 
 def parse_number(number: Union[str, int]) -> int:
     """Parse a number to an integer"""
     try:
-        num = int(number)
+        return int(number)
     except ValueError:
-        num = w2n.word_to_num(number)
-    return num
+        pass
+    words = str(number).lower().replace("-", " ").split()
+    total = current = 0
+    for word in words:
+        if word in NUMBER_WORDS:
+            current += NUMBER_WORDS[word]
+        elif word == "hundred" and current:
+            current *= 100
+        elif word in NUMBER_SCALES and current:
+            total += current * NUMBER_SCALES[word]
+            current = 0
+        elif word != "and":
+            raise ValueError(f"couldn't parse number: {number}")
+    if not words:
+        raise ValueError(f"couldn't parse number: {number}")
+    return total + current
+
+
+def normalize(english: str) -> Tuple[str, ...]:
+    """Split an english description of a date into lowercase tokens"""
+    return tuple(english.lower().replace("-", " ").split())
+
+
+@functools.lru_cache(maxsize=4096)
+def resolve_offset(tokens: Tuple[str, ...], reference: datetime.date) -> int:
+    """Resolve tokenized input to a number of days from the reference date
+
+    Understands `today`, `yesterday`, `tomorrow`, `<last|this|next> <weekday>`,
+    `<quantity> <unit> ago` and `<quantity> <unit> from <now|today>`.
+    """
+    if len(tokens) == 1 and tokens[0] in FIXED_DAYS:
+        return FIXED_DAYS[tokens[0]]
+    if (
+        len(tokens) == 2
+        and tokens[0] in RELATIVE_WEEKDAYS
+        and tokens[1] in DAYS_OF_WEEK
+    ):
+        difference = DAYS_OF_WEEK[tokens[1]] - reference.weekday()
+        return RELATIVE_WEEKDAYS[tokens[0]](difference)
+    if tokens[-1:] == ("ago",):
+        direction, body = -1, tokens[:-1]
+    elif tokens[-2:] in (("from", "now"), ("from", "today")):
+        direction, body = 1, tokens[:-2]
+    else:
+        raise ValueError(f"couldn't parse input: {' '.join(tokens)}")
+    if len(body) < 2 or body[-1] not in SCALES:
+        raise ValueError(f"couldn't parse input: {' '.join(tokens)}")
+    return direction * parse_number(" ".join(body[:-1])) * SCALES[body[-1]]
 
 
 def parse_english_to_date(english: str) -> datetime.datetime:
     """Parse an english description of a date to a datetime.datetime object"""
-    query = english.strip().lower()
-    today = datetime.datetime.now()
-    if query == "today":
-        return today
-    if query == "yesterday":
-        operation = operator.sub
-        days = 1
-    elif query == "tomorrow":
-        operation = operator.add
-        days = 1
-    elif " ago" in query:
-        operation = operator.sub
-        unit, *_ = [k for k in SCALES.keys() if k in query]
-        quantity = query.replace(" ago", "").replace(unit, "").strip()
-        number = parse_number(quantity)
-        days_in_unit = SCALES[unit]
-        days = number * days_in_unit
-    elif " from now" in query or " from today" in query:
-        operation = operator.add
-        unit, *_ = [k for k in SCALES.keys() if k in query]
-        quantity = (
-            query.replace(" from now", "")
-            .replace(" from today", "")
-            .replace(unit, "")
-            .strip()
-        )
-        number = parse_number(quantity)
-        days_in_unit = SCALES[unit]
-        days = number * days_in_unit
-    elif "last" in query:
-        operation = operator.sub
-        day = query.replace("last", "").strip()
-        day_of_week = DAYS_OF_WEEK[day]
-        days = 7 - (day_of_week - today.weekday())
-    elif "this" in query:
-        operation = operator.add
-        day = query.replace("this", "").strip()
-        day_of_week = DAYS_OF_WEEK[day]
-        days = day_of_week - today.weekday()
-    elif "next" in query:
-        operation = operator.add
-        day = query.replace("next", "").strip()  # tuesday
-        day_of_week = DAYS_OF_WEEK[day]  # 1
-        days = 7 + (day_of_week - today.weekday())
-    else:
-        raise ValueError(f"couldn't parse input: {english}")
-    return operation(today, datetime.timedelta(days=days))
+    (parsed,) = parse_many([english])
+    return parsed
+
+
+def parse_many(
+    expressions: Iterable[str], reference: Optional[datetime.datetime] = None
+) -> List[datetime.datetime]:
+    """Parse many english descriptions of dates, relative to one reference datetime (default now)"""
+    if reference is None:
+        reference = datetime.datetime.now()
+    reference_date = reference.date()
+    parsed = []
+    for english in expressions:
+        try:
+            days = resolve_offset(normalize(english), reference_date)
+        except ValueError:
+            raise ValueError(f"couldn't parse input: {english}") from None
+        parsed.append(reference + datetime.timedelta(days=days))
+    return parsed
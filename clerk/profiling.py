@@ -0,0 +1,250 @@
+"""Opt-in instrumentation of clerk sessions
+
+Run `journal --profile` (or `--profile=trace`), or set CLERK_PROFILE=json or
+CLERK_PROFILE=trace, to record the wall time, CPU time and I/O of each phase
+of a session: plugin discovery, config, loading and running each callback,
+change detection and write-back. The profile is saved in the user data
+directory as JSON, or in Chrome's trace event format (open it in
+chrome://tracing or Perfetto), and a summary is appended to a rolling
+history so regressions stand out (see `clerk profile`).
+"""
+import datetime
+import json
+import os
+import pathlib
+import sys
+import time
+from typing import Dict
+from typing import List
+from typing import Optional
+
+
+PROFILE_ENV = "CLERK_PROFILE"
+FORMATS = ("json", "trace")
+PROFILES_DIRECTORY = "profiles"
+HISTORY_FILENAME = "history.jsonl"
+HISTORY_LIMIT = 500
+
+
+def io_counters() -> Optional[List[int]]:
+    """Bytes read and written by this process so far (Linux only)"""
+    try:
+        with open("/proc/self/io", "rb") as f:
+            fields = dict(line.split(b":") for line in f.read().splitlines())
+        return [int(fields[b"rchar"]), int(fields[b"wchar"])]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class Span:
+    """Times a phase of a session; details can be added to its `args`"""
+
+    def __init__(self, profiler: "Profiler", name: str, category: str, args: Dict):
+        """Prepare a span (it starts timing when entered)"""
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self) -> Dict:
+        """Start timing"""
+        self.io = io_counters()
+        self.cpu = time.process_time_ns()
+        self.start = time.perf_counter_ns()
+        return self.args
+
+    def __exit__(self, *exc_info):
+        """Stop timing and record the span"""
+        end = time.perf_counter_ns()
+        cpu = time.process_time_ns() - self.cpu
+        io = io_counters()
+        if self.io is not None and io is not None:
+            self.args["bytes_read"] = io[0] - self.io[0]
+            self.args["bytes_written"] = io[1] - self.io[1]
+        self.profiler.record(
+            {
+                "name": self.name,
+                "category": self.category,
+                "start_us": (self.start - self.profiler.origin) / 1000,
+                "wall_us": (end - self.start) / 1000,
+                "cpu_us": cpu / 1000,
+                "thread": _thread_id(),
+                "args": self.args,
+            }
+        )
+
+
+class NullSpan:
+    """Stands in for Span when profiling is off"""
+
+    def __enter__(self) -> Dict:
+        """Do nothing"""
+        return {}
+
+    def __exit__(self, *exc_info):
+        """Do nothing"""
+
+
+class Profiler:
+    """Collects the spans of a session"""
+
+    def __init__(self, format: str = "json"):
+        """Start a profile, to be saved in the specified format"""
+        self.format = format
+        self.origin = time.perf_counter_ns()
+        self.started = datetime.datetime.now()
+        self.spans: List[Dict] = []
+
+    def record(self, span: Dict) -> None:
+        """Add a finished span"""
+        self.spans.append(span)
+
+    def as_json(self) -> Dict:
+        """The profile as plain JSON"""
+        return {
+            "started": self.started.isoformat(),
+            "argv": sys.argv,
+            "spans": self.spans,
+        }
+
+    def as_trace(self) -> Dict:
+        """The profile in Chrome's trace event format"""
+        return {
+            "traceEvents": [
+                {
+                    "name": span["name"],
+                    "cat": span["category"],
+                    "ph": "X",
+                    "ts": span["start_us"],
+                    "dur": span["wall_us"],
+                    "pid": os.getpid(),
+                    "tid": span["thread"],
+                    "args": dict(span["args"], cpu_us=span["cpu_us"]),
+                }
+                for span in self.spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def summary(self) -> Dict:
+        """Total wall time per span name, for the rolling history"""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span["name"]] = totals.get(span["name"], 0.0) + span["wall_us"]
+        return {"started": self.started.isoformat(), "wall_us": totals}
+
+    def save(self, user_data_directory: pathlib.Path) -> pathlib.Path:
+        """Write the profile and update the history, returning the profile's path"""
+        directory = pathlib.Path(user_data_directory, PROFILES_DIRECTORY)
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = self.started.strftime("%Y%m%dT%H%M%S%f")
+        if self.format == "trace":
+            path = pathlib.Path(directory, f"{stamp}.trace.json")
+            contents = self.as_trace()
+        else:
+            path = pathlib.Path(directory, f"{stamp}.json")
+            contents = self.as_json()
+        with open(path, "w") as f:
+            json.dump(contents, f)
+        append_history(user_data_directory, self.summary())
+        return path
+
+
+def _thread_id() -> int:
+    """The current thread's id (imported lazily; threading isn't otherwise needed)"""
+    import threading
+
+    return threading.get_ident()
+
+
+_profiler: Optional[Profiler] = None
+
+
+def start(format: Optional[str] = None) -> Optional[Profiler]:
+    """Start profiling in the specified format, or as requested by CLERK_PROFILE"""
+    global _profiler
+    if format is None:
+        format = os.environ.get(PROFILE_ENV, "").lower()
+        if format in ("", "0", "no", "false"):
+            return None
+        if format not in FORMATS:
+            format = "json"
+    _profiler = Profiler(format)
+    return _profiler
+
+
+def stop(user_data_directory: pathlib.Path) -> Optional[pathlib.Path]:
+    """Stop profiling, saving the profile (if one was being recorded)"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return None
+    path = profiler.save(user_data_directory)
+    print(f"Profile written to {path}", file=sys.stderr)
+    return path
+
+
+def span(name: str, category: str = "clerk", **args):
+    """Time a phase of the session, if profiling is on
+
+    Use as `with span("name") as details:`; keys added to `details` are
+    saved with the span.
+    """
+    if _profiler is None:
+        return NullSpan()
+    return Span(_profiler, name, category, args)
+
+
+def is_profiling() -> bool:
+    """Whether a profile is being recorded"""
+    return _profiler is not None
+
+
+def append_history(user_data_directory: pathlib.Path, summary: Dict) -> None:
+    """Append a session summary to the history, keeping the latest HISTORY_LIMIT"""
+    path = history_path(user_data_directory)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(summary) + "\n")
+    if path.stat().st_size > HISTORY_LIMIT * 1024:
+        history = read_history(user_data_directory)
+        if len(history) > HISTORY_LIMIT:
+            from clerk.files import atomic_write_lines
+
+            atomic_write_lines(
+                path, [json.dumps(s) + "\n" for s in history[-HISTORY_LIMIT:]]
+            )
+
+
+def history_path(user_data_directory: pathlib.Path) -> pathlib.Path:
+    """Returns the path to the rolling profile history"""
+    return pathlib.Path(user_data_directory, PROFILES_DIRECTORY, HISTORY_FILENAME)
+
+
+def read_history(user_data_directory: pathlib.Path) -> List[Dict]:
+    """Read the session summaries in the history, oldest first"""
+    try:
+        with open(history_path(user_data_directory), "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def regressions(history: List[Dict], threshold: float = 1.5) -> List[Dict]:
+    """Compare each phase of the latest session with its median over the history"""
+    if not history:
+        return []
+    *earlier, latest = history
+    report = []
+    for name, wall_us in sorted(latest["wall_us"].items()):
+        past = sorted(s["wall_us"][name] for s in earlier if name in s["wall_us"])
+        median = past[len(past) // 2] if past else None
+        report.append(
+            {
+                "name": name,
+                "latest_ms": wall_us / 1000,
+                "median_ms": median / 1000 if median is not None else None,
+                "regressed": median is not None and wall_us > median * threshold,
+            }
+        )
+    return report
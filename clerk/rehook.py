@@ -0,0 +1,212 @@
+"""Re-running a hook's callbacks over existing journals, in bulk
+
+`clerk rehook HOOK` runs the plugins configured for a hook over every journal
+in a date range, as if each had just been opened (or saved, or closed). The
+journals are spread across a pool of worker processes, each of which reads,
+transforms and atomically rewrites one journal at a time, so memory use
+doesn't grow with the number of journals.
+"""
+import contextlib
+import datetime
+import os
+import pathlib
+import sys
+import time
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+
+from clerk.files import sibling_path
+from clerk.files import write_back
+from clerk.hooks import run_pipeline
+from clerk.locks import is_open
+
+
+class Outcome(NamedTuple):
+    """What happened to one journal"""
+
+    filename: str
+    status: str  # "changed", "unchanged", "busy", "conflict" or "failed"
+    added: int = 0
+    removed: int = 0
+    error: str = ""
+
+
+# set in each worker process by init_worker
+_worker: Dict = {}
+
+
+def init_worker(
+    journal_directory: str,
+    temp_directory: str,
+    extensions: Sequence,
+    config: Mapping,
+    dry_run: bool,
+    fsync: bool,
+) -> None:
+    """Prepare a worker process to rehook journals"""
+    _worker.update(
+        journal_directory=journal_directory,
+        temp_directory=temp_directory,
+        extensions=extensions,
+        config=config,
+        dry_run=dry_run,
+        fsync=fsync,
+    )
+
+
+def diff_counts(before: Sequence[str], after: Sequence[str]):
+    """The number of lines added and removed between two versions of a journal"""
+    # most plugins add or change a few lines at one end; only diff the middle
+    prefix = 0
+    limit = min(len(before), len(after))
+    while prefix < limit and before[prefix] == after[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and before[-1 - suffix] == after[-1 - suffix]:
+        suffix += 1
+    before = before[prefix : len(before) - suffix]
+    after = after[prefix : len(after) - suffix]
+    if not before or not after:
+        return len(after), len(before)
+    import difflib
+
+    added = removed = 0
+    matcher = difflib.SequenceMatcher(None, before, after, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            removed += i2 - i1
+            added += j2 - j1
+    return added, removed
+
+
+def signature(path: str):
+    """A file's (size, mtime, inode), to notice it being edited while we worked"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def rehook_journal(filename: str) -> Outcome:
+    """Run the hook's callbacks over one journal, writing it back if they changed it"""
+    path = os.path.join(_worker["journal_directory"], filename)
+    if is_open(_worker["temp_directory"], filename):
+        return Outcome(filename, "busy")  # open in an editor; leave it be
+    try:
+        before = signature(path)
+        with open(path, "r") as f:
+            lines = f.readlines()
+        # plugins report every run; that's noise across thousands of journals
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results, changed = run_pipeline(
+                _worker["extensions"], lines, _worker["config"]
+            )
+        if not changed:
+            return Outcome(filename, "unchanged")
+        added, removed = diff_counts(lines, results)
+        if not _worker["dry_run"]:
+            if signature(path) != before:
+                return Outcome(filename, "conflict")
+            # staged next to the journal, then moved over it keeping its permissions
+            staging = sibling_path(pathlib.Path(path), "rehook")
+            try:
+                with open(staging, "w") as f:
+                    f.writelines(results)
+                write_back(staging, path, fsync=_worker["fsync"], move=True)
+            finally:
+                staging.unlink(missing_ok=True)
+        return Outcome(filename, "changed", added, removed)
+    except Exception as e:
+        return Outcome(filename, "failed", error=f"{type(e).__name__}: {e}")
+
+
+def plain_config(config: Mapping) -> Dict[str, Dict[str, str]]:
+    """A picklable copy of a config, to send to worker processes"""
+    return {section: dict(config[section]) for section in config}
+
+
+class Progress:
+    """Reports progress and throughput on stderr"""
+
+    def __init__(self, total: int, interval: float = 0.1):
+        """Start timing a run over `total` journals"""
+        self.total = total
+        self.done = 0
+        self.interval = interval
+        self.started = self.reported = time.perf_counter()
+
+    def step(self) -> None:
+        """Count a finished journal, reporting progress now and then"""
+        self.done += 1
+        now = time.perf_counter()
+        if now - self.reported >= self.interval or self.done == self.total:
+            self.reported = now
+            print(
+                f"\r{self.done}/{self.total} journals ({self.rate():.0f}/s)",
+                end="",
+                file=sys.stderr,
+                flush=True,
+            )
+
+    def elapsed(self) -> float:
+        """Seconds since the run started"""
+        return time.perf_counter() - self.started
+
+    def rate(self) -> float:
+        """Journals processed per second"""
+        return self.done / max(self.elapsed(), 1e-9)
+
+
+def rehook(
+    app,
+    hook_name: str,
+    since: Optional[datetime.date] = None,
+    until: Optional[datetime.date] = None,
+    dry_run: bool = False,
+    jobs: Optional[int] = None,
+) -> List[Outcome]:
+    """Run a hook's callbacks over the journals from `since` through `until` (inclusive)"""
+    from clerk.catalog import Catalog
+
+    first = since or datetime.date.min
+    last = until or datetime.date.max - datetime.timedelta(days=1)
+    with Catalog(app) as catalog:
+        entries = catalog.between(first, last)
+    directory = str(app.journal_directory)
+    filenames = [
+        filename
+        for _, filename in entries
+        if os.path.exists(os.path.join(directory, filename))  # not archived
+    ]
+    arguments = (
+        directory,
+        str(app.temp_directory),
+        list(app.hooks[hook_name]),
+        plain_config(app.config),
+        dry_run,
+        app.fsync,
+    )
+    progress = Progress(len(filenames))
+    outcomes = []
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(filenames) < 2:
+        init_worker(*arguments)
+        for filename in filenames:
+            outcomes.append(rehook_journal(filename))
+            progress.step()
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunksize = max(1, min(64, len(filenames) // (jobs * 4)))
+        with ProcessPoolExecutor(
+            jobs, initializer=init_worker, initargs=arguments
+        ) as pool:
+            for outcome in pool.map(rehook_journal, filenames, chunksize=chunksize):
+                outcomes.append(outcome)
+                progress.step()
+    if filenames:
+        print(file=sys.stderr)
+    return outcomes
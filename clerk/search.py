@@ -0,0 +1,264 @@
+"""Full-text search over journals, backed by an incremental on-disk index"""
+import datetime
+import math
+import os
+import pathlib
+import re
+import sqlite3
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from clerk.archive import Archive
+from clerk.archive import load_archive
+from clerk.archive import read_journal
+from clerk.archive import stat_journal
+from clerk.catalog import Catalog
+
+
+INDEX_FILENAME = "search.sqlite3"
+TOKEN = re.compile(r"\w+")
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    name TEXT NOT NULL,
+    lines BLOB NOT NULL,
+    PRIMARY KEY (term, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_by_name ON postings (name);
+"""
+
+
+class SearchResult(NamedTuple):
+    """A journal matching a search query"""
+
+    date: datetime.datetime
+    filename: str
+    score: float
+    line_numbers: List[int]
+
+
+def index_path(user_data_directory: pathlib.Path) -> pathlib.Path:
+    """Returns the path to the search index"""
+    return pathlib.Path(user_data_directory, INDEX_FILENAME)
+
+
+def tokenize_lines(lines: Iterable[str]) -> Dict[str, List[int]]:
+    """Map each term in a document to the (ascending) numbers of the lines it's on"""
+    postings: Dict[str, List[int]] = {}
+    for number, line in enumerate(lines):
+        for term in set(TOKEN.findall(line.lower())):
+            postings.setdefault(term, []).append(number)
+    return postings
+
+
+def encode_postings(line_numbers: List[int]) -> bytes:
+    """Encode ascending line numbers as varint deltas"""
+    encoded = bytearray()
+    previous = 0
+    for number in line_numbers:
+        delta = number - previous
+        previous = number
+        while delta >= 0x80:
+            encoded.append(delta & 0x7F | 0x80)
+            delta >>= 7
+        encoded.append(delta)
+    return bytes(encoded)
+
+
+def decode_postings(encoded: bytes) -> List[int]:
+    """Decode line numbers encoded by encode_postings"""
+    line_numbers = []
+    current = delta = shift = 0
+    for byte in encoded:
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            current += delta
+            line_numbers.append(current)
+            delta = shift = 0
+    return line_numbers
+
+
+class SearchIndex:
+    """An inverted index of term -> (journal, line numbers), stored in SQLite"""
+
+    def __init__(self, app):
+        """Open (or create) the search index for an Application's journals"""
+        self.app = app
+        self.path = index_path(app.temp_directory)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self) -> "SearchIndex":
+        """Use the index as a context manager"""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the index"""
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection to the index"""
+        self.connection.close()
+
+    def index_entry(
+        self,
+        filename: str,
+        date: datetime.datetime,
+        st: os.stat_result,
+        replace: bool = True,
+        archive: Optional[Archive] = None,
+    ) -> None:
+        """(Re-)index a single journal; `replace=False` skips clearing old postings"""
+        text = read_journal(self.app.journal_directory, filename, archive)
+        postings = tokenize_lines(text.splitlines(keepends=True))
+        if replace:
+            self.connection.execute("DELETE FROM postings WHERE name = ?", (filename,))
+        self.connection.executemany(
+            "INSERT INTO postings (term, name, lines) VALUES (?, ?, ?)",
+            (
+                (term, filename, encode_postings(line_numbers))
+                for term, line_numbers in postings.items()
+            ),
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO entries (name, date, mtime_ns, size) VALUES (?, ?, ?, ?)",
+            (filename, date.isoformat(), st.st_mtime_ns, st.st_size),
+        )
+
+    def remove_entry(self, filename: str) -> None:
+        """Drop a journal from the index"""
+        self.connection.execute("DELETE FROM postings WHERE name = ?", (filename,))
+        self.connection.execute("DELETE FROM entries WHERE name = ?", (filename,))
+
+    def refresh_entry(self, filename: str) -> None:
+        """Bring a single journal's index entry up to date"""
+        date = self.app.convert_from_filename(filename)
+        if date is None:
+            return
+        archive = load_archive(self.app.journal_directory)
+        try:
+            with self.connection:
+                try:
+                    st = stat_journal(self.app.journal_directory, filename, archive)
+                except FileNotFoundError:
+                    self.remove_entry(filename)
+                else:
+                    self.index_entry(filename, date, st, archive=archive)
+        finally:
+            if archive is not None:
+                archive.close()
+
+    def rescan(self) -> int:
+        """Re-index journals whose mtime or size changed, returning how many were"""
+        known = {
+            name: (mtime_ns, size)
+            for name, mtime_ns, size in self.connection.execute(
+                "SELECT name, mtime_ns, size FROM entries"
+            )
+        }
+        with Catalog(self.app) as catalog:
+            journals = list(catalog)
+        seen = set()
+        reindexed = 0
+        archive = load_archive(self.app.journal_directory)
+        try:
+            with self.connection:
+                for date, filename in journals:
+                    try:
+                        st = stat_journal(self.app.journal_directory, filename, archive)
+                    except FileNotFoundError:
+                        continue
+                    seen.add(filename)
+                    if known.get(filename) != (st.st_mtime_ns, st.st_size):
+                        self.index_entry(filename, date, st, filename in known, archive)
+                        reindexed += 1
+                for name in known.keys() - seen:
+                    self.remove_entry(name)
+        finally:
+            if archive is not None:
+                archive.close()
+        return reindexed
+
+    def search(
+        self, query: str, limit: int = 20, by_date: bool = False
+    ) -> List[SearchResult]:
+        """Find the journals containing every term in the query
+
+        Results are ranked by a tf-idf score (newest first among ties), or
+        ordered newest first with `by_date`.
+        """
+        terms = set(TOKEN.findall(query.lower()))
+        if not terms:
+            return []
+        (total,) = self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()
+        scores: Dict[str, float] = {}
+        line_numbers: Dict[str, set] = {}
+        for i, term in enumerate(sorted(terms)):
+            rows = self.connection.execute(
+                "SELECT name, lines FROM postings WHERE term = ?", (term,)
+            ).fetchall()
+            idf = math.log(1 + total / len(rows)) if rows else 0.0
+            matches = {}
+            for name, encoded in rows:
+                if i == 0 or name in scores:
+                    matches[name] = decode_postings(encoded)
+            scores = {
+                name: scores.get(name, 0.0) + idf * (1 + math.log(len(lines)))
+                for name, lines in matches.items()
+            }
+            for name, lines in matches.items():
+                line_numbers.setdefault(name, set()).update(lines)
+            if not scores:
+                return []
+        dates = self._dates(scores)
+        ranked = sorted(
+            scores,
+            key=(lambda n: dates[n]) if by_date else (lambda n: (scores[n], dates[n])),
+            reverse=True,
+        )
+        return [
+            SearchResult(
+                datetime.datetime.fromisoformat(dates[name]),
+                name,
+                scores[name],
+                sorted(line_numbers[name]),
+            )
+            for name in ranked[:limit]
+        ]
+
+    def _dates(self, names: Iterable[str]) -> Dict[str, str]:
+        """Look up the (ISO formatted) dates of the specified journals"""
+        names = list(names)
+        dates = {}
+        for start in range(0, len(names), 500):
+            batch = names[start : start + 500]
+            placeholders = ", ".join("?" * len(batch))
+            dates.update(
+                self.connection.execute(
+                    f"SELECT name, date FROM entries WHERE name IN ({placeholders})",
+                    batch,
+                )
+            )
+        return dates
+
+
+def refresh_entry(app, filename: str) -> None:
+    """Update a journal's search index entry, if the user has a search index"""
+    if not index_path(app.temp_directory).exists():
+        return
+    with SearchIndex(app) as index:
+        index.refresh_entry(filename)
@@ -0,0 +1,349 @@
+"""Journal statistics: words, streaks, entries per month and most-used tags
+
+`clerk stats` summarizes each journal once (its words, lines and #tags),
+spreading the work across a pool of worker processes, and keeps the
+summaries in SQLite in the user data directory keyed by path, size and mtime,
+so later runs only re-read journals that changed. Reports are computed over
+array-backed columns of dates and counts loaded straight from the cache, with
+month boundaries found by binary search rather than by visiting each entry.
+"""
+import bisect
+import datetime
+import os
+import pathlib
+import re
+import sqlite3
+from array import array
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from clerk.archive import load_archive
+from clerk.archive import read_journal
+from clerk.catalog import Catalog
+
+
+STATS_FILENAME = "stats.sqlite3"
+TAG = re.compile(r"(?<![\w#&/])#(\w[\w/-]*)")
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS directories (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    directory INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    words INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    PRIMARY KEY (directory, filename)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS summaries_by_day
+    ON summaries (directory, day, words, lines);
+CREATE TABLE IF NOT EXISTS tags (
+    directory INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (directory, filename, tag)
+) WITHOUT ROWID;
+"""
+# below this many changed journals, a process pool costs more than it saves
+POOL_THRESHOLD = 256
+
+
+class Summary(NamedTuple):
+    """What one journal contributes to the statistics"""
+
+    words: int
+    lines: int
+    tags: Dict[str, int]
+
+
+class Columns(NamedTuple):
+    """Summaries as parallel arrays, ordered by date"""
+
+    days: array  # proleptic Gregorian ordinals
+    words: array
+    lines: array
+
+
+class Report(NamedTuple):
+    """Statistics over a range of journals"""
+
+    journals: int
+    words: int
+    lines: int
+    first: Optional[datetime.date]
+    last: Optional[datetime.date]
+    longest_streak: Tuple[int, Optional[datetime.date]]  # days, and the first of them
+    current_streak: int
+    months: List[Tuple[str, int, int]]  # (YYYY-MM, journals, words), newest first
+    tags: List[Tuple[str, int]]
+
+
+def stats_path(user_data_directory: pathlib.Path) -> pathlib.Path:
+    """Returns the path to the journal statistics cache"""
+    return pathlib.Path(user_data_directory, STATS_FILENAME)
+
+
+def summarize(text: str) -> Summary:
+    """Count a journal's words, lines and tags"""
+    tags: Dict[str, int] = {}
+    for tag in TAG.findall(text):
+        tag = tag.lower()
+        tags[tag] = tags.get(tag, 0) + 1
+    lines = text.count("\n") + (bool(text) and not text.endswith("\n"))
+    return Summary(len(text.split()), lines, tags)
+
+
+# set in each worker process by init_worker
+_worker: Dict = {}
+
+
+def init_worker(journal_directory: str) -> None:
+    """Prepare a worker process to summarize journals"""
+    _worker["journal_directory"] = journal_directory
+    _worker["archive"] = load_archive(journal_directory)
+
+
+def summarize_journal(filename: str) -> Optional[Summary]:
+    """Summarize one journal, loose or archived (None if it's gone)"""
+    try:
+        text = read_journal(_worker["journal_directory"], filename, _worker["archive"])
+    except FileNotFoundError:
+        return None
+    return summarize(text)
+
+
+def summarize_journals(
+    journal_directory: str, filenames: Sequence[str], jobs: Optional[int] = None
+) -> List[Optional[Summary]]:
+    """Summarize journals, in a pool of worker processes if there are many"""
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(filenames) < POOL_THRESHOLD:
+        init_worker(journal_directory)
+        try:
+            return [summarize_journal(filename) for filename in filenames]
+        finally:
+            if _worker["archive"] is not None:
+                _worker["archive"].close()
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, min(256, len(filenames) // (jobs * 4)))
+    with ProcessPoolExecutor(
+        jobs, initializer=init_worker, initargs=(journal_directory,)
+    ) as pool:
+        return list(pool.map(summarize_journal, filenames, chunksize=chunksize))
+
+
+def find_streaks(days: Sequence[int]) -> Tuple[Tuple[int, int], int]:
+    """The longest run of consecutive days (its length and first day) in ascending ordinals, and the last run's length"""
+    longest = (0, 0)
+    start = previous = None
+    for day in days:
+        if previous is None or day > previous + 1:
+            start = day
+        elif day == previous:
+            continue  # several journals on one day
+        previous = day
+        length = day - start + 1
+        if length > longest[0]:
+            longest = (length, start)
+    last = previous - start + 1 if previous is not None else 0
+    return longest, last
+
+
+def month_starts(first: datetime.date, last: datetime.date) -> List[datetime.date]:
+    """The first day of every month from `first`'s through `last`'s, and of the month after"""
+    after = (last.year + last.month // 12, last.month % 12 + 1)
+    starts = []
+    year, month = first.year, first.month
+    while (year, month) <= after:
+        starts.append(datetime.date(year, month, 1))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return starts
+
+
+def per_month(columns: Columns) -> List[Tuple[str, int, int]]:
+    """(YYYY-MM, journals, words) for every month spanned by the columns, newest first"""
+    if not columns.days:
+        return []
+    first = datetime.date.fromordinal(columns.days[0])
+    last = datetime.date.fromordinal(columns.days[-1])
+    starts = month_starts(first, last)
+    boundaries = [
+        bisect.bisect_left(columns.days, start.toordinal()) for start in starts
+    ]
+    months = []
+    for start, lo, hi in zip(starts, boundaries, boundaries[1:]):
+        months.append((f"{start:%Y-%m}", hi - lo, sum(columns.words[lo:hi])))
+    return months[::-1]
+
+
+class StatsCache:
+    """Per-journal summaries, stored in SQLite and refreshed incrementally"""
+
+    def __init__(self, app):
+        """Open (or create) the statistics cache for an Application's journals"""
+        self.app = app
+        self.journal_directory = str(app.journal_directory)
+        self.path = stats_path(app.temp_directory)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+        with self.connection:
+            self.directory = self._directory_id()
+
+    def __enter__(self) -> "StatsCache":
+        """Use the cache as a context manager"""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the cache"""
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection to the cache"""
+        self.connection.close()
+
+    def _directory_id(self) -> int:
+        """The cache's id for this journal directory"""
+        self.connection.execute(
+            "INSERT OR IGNORE INTO directories (path) VALUES (?)",
+            (self.journal_directory,),
+        )
+        return self.connection.execute(
+            "SELECT id FROM directories WHERE path = ?", (self.journal_directory,)
+        ).fetchone()[0]
+
+    def refresh(self, jobs: Optional[int] = None) -> int:
+        """Re-summarize journals whose size or mtime changed, returning how many were"""
+        directory = self.journal_directory
+        known = {
+            filename: (size, mtime_ns)
+            for filename, size, mtime_ns in self.connection.execute(
+                "SELECT filename, size, mtime_ns FROM summaries WHERE directory = ?",
+                (self.directory,),
+            )
+        }
+        prefix = os.path.join(directory, "")
+        with Catalog(self.app) as catalog:
+            journals = list(catalog)
+        stale = []
+        archive = load_archive(directory)
+        try:
+            for date, filename in journals:
+                try:
+                    st = os.stat(prefix + filename)
+                except FileNotFoundError:
+                    st = archive.entry(filename) if archive is not None else None
+                    if st is None:
+                        continue
+                if known.pop(filename, None) != (st.st_size, st.st_mtime_ns):
+                    day = date.toordinal()
+                    stale.append((filename, day, st))
+        finally:
+            if archive is not None:
+                archive.close()
+        summaries = summarize_journals(directory, [s[0] for s in stale], jobs)
+        with self.connection:
+            # whatever is left in `known` is no longer in the journal directory
+            for filename in known:
+                self._forget(filename)
+            for (filename, day, st), summary in zip(stale, summaries):
+                self._forget(filename)
+                if summary is None:
+                    continue  # removed since we looked
+                self.connection.execute(
+                    "INSERT INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.directory, filename, day, st.st_size, st.st_mtime_ns)
+                    + summary[:2],
+                )
+                self.connection.executemany(
+                    "INSERT INTO tags VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (self.directory, filename, tag, day, count)
+                        for tag, count in summary.tags.items()
+                    ),
+                )
+        return len(stale)
+
+    def _forget(self, filename: str) -> None:
+        """Drop a journal's summary and tags"""
+        for table in ("summaries", "tags"):
+            self.connection.execute(
+                f"DELETE FROM {table} WHERE directory = ? AND filename = ?",
+                (self.directory, filename),
+            )
+
+    def _range(self, since: Optional[datetime.date], until: Optional[datetime.date]):
+        """SQL parameters selecting this journal directory's summaries between two dates"""
+        first = since.toordinal() if since else 0
+        last = until.toordinal() if until else datetime.date.max.toordinal()
+        return (self.directory, first, last)
+
+    def columns(
+        self,
+        since: Optional[datetime.date] = None,
+        until: Optional[datetime.date] = None,
+    ) -> Columns:
+        """The summaries from `since` through `until`, as columns ordered by date"""
+        rows = self.connection.execute(
+            "SELECT day, words, lines FROM summaries"
+            " WHERE directory = ? AND day BETWEEN ? AND ? ORDER BY day",
+            self._range(since, until),
+        ).fetchall()
+        days, words, lines = zip(*rows) if rows else ((), (), ())
+        return Columns(array("q", days), array("q", words), array("q", lines))
+
+    def top_tags(
+        self,
+        limit: int,
+        since: Optional[datetime.date] = None,
+        until: Optional[datetime.date] = None,
+    ) -> List[Tuple[str, int]]:
+        """The most used tags from `since` through `until`, most used first"""
+        return self.connection.execute(
+            "SELECT tag, SUM(count) AS uses FROM tags"
+            " WHERE directory = ? AND day BETWEEN ? AND ?"
+            " GROUP BY tag ORDER BY uses DESC, tag LIMIT ?",
+            self._range(since, until) + (limit,),
+        ).fetchall()
+
+    def report(
+        self,
+        since: Optional[datetime.date] = None,
+        until: Optional[datetime.date] = None,
+        tags: int = 10,
+        today: Optional[datetime.date] = None,
+    ) -> Report:
+        """Statistics over the journals from `since` through `until`"""
+        today = today or datetime.date.today()
+        columns = self.columns(since, until)
+        days = columns.days
+        (longest, start), last_run = find_streaks(days)
+        # a streak is still current if it reaches today, or yesterday
+        current = last_run if days and days[-1] >= today.toordinal() - 1 else 0
+        return Report(
+            journals=len(days),
+            words=sum(columns.words),
+            lines=sum(columns.lines),
+            first=datetime.date.fromordinal(days[0]) if days else None,
+            last=datetime.date.fromordinal(days[-1]) if days else None,
+            longest_streak=(
+                longest,
+                datetime.date.fromordinal(start) if start else None,
+            ),
+            current_streak=current,
+            months=per_month(columns),
+            tags=self.top_tags(tags, since, until),
+        )
@@ -0,0 +1,165 @@
+"""Noticing saves to a journal while it's open in the editor
+
+A Watcher waits for changes to a file on a background thread, using inotify
+where it's available (Linux) and polling the file's stat signature elsewhere.
+Bursts of writes are coalesced: the callback runs once the file has been quiet
+for the debounce period, and only if its contents really changed.
+"""
+import os
+import pathlib
+import struct
+import threading
+from typing import Callable
+from typing import Optional
+
+from clerk.files import FileSnapshot
+from clerk.files import has_changed
+from clerk.files import take_snapshot
+
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def inotify_watch(directory: pathlib.Path) -> Optional[int]:
+    """An inotify descriptor watching a directory for writes, or None if unavailable"""
+    try:
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (AttributeError, OSError):
+        return None
+    if fd < 0:
+        return None
+    # the directory is watched, since editors often save by renaming over the file
+    mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def event_names(data: bytes):
+    """The file names in a buffer of inotify events"""
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(data):
+        _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        yield data[offset : offset + length].rstrip(b"\0").decode(errors="replace")
+        offset += length
+
+
+class Watcher:
+    """Calls back, on a background thread, when a file is saved with new contents"""
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        on_save: Callable[[], None],
+        debounce: float = 0.5,
+        interval: float = 1.0,
+        snapshot: Optional[FileSnapshot] = None,
+    ):
+        """Initialize a watcher; `snapshot` is the contents to compare against"""
+        self.path = pathlib.Path(path)
+        self.on_save = on_save
+        self.debounce = debounce
+        self.interval = interval  # how often to poll, without inotify
+        self.snapshot = snapshot or take_snapshot(self.path)
+        self.saves = 0
+        self.error: Optional[BaseException] = None
+        self._stopping = threading.Event()
+        self._wake_read, self._wake_write = os.pipe()
+        self._inotify = inotify_watch(self.path.parent)
+        self._signature = tuple(self.snapshot[:3])  # last seen, when polling
+        self._thread = threading.Thread(
+            target=self._run, name="clerk-watch", daemon=True
+        )
+
+    def start(self) -> "Watcher":
+        """Start watching"""
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop watching, waiting for any save in progress to finish"""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        os.write(self._wake_write, b"\0")
+        self._thread.join()
+        for fd in (self._wake_read, self._wake_write, self._inotify):
+            if fd is not None:
+                os.close(fd)
+
+    def __enter__(self) -> "Watcher":
+        """Watch for the duration of a with block"""
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        """Stop watching"""
+        self.stop()
+
+    def _wait(self, timeout: Optional[float]) -> bool:
+        """Wait up to `timeout` seconds for the file to be written, returning whether it was"""
+        import select
+
+        if self._inotify is None:
+            if self._stopping.wait(self.interval if timeout is None else timeout):
+                return False
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return False
+            signature = (st.st_size, st.st_mtime_ns, st.st_ino)
+            written, self._signature = signature != self._signature, signature
+            return written
+        readable, _, _ = select.select(
+            [self._inotify, self._wake_read], [], [], timeout
+        )
+        if self._inotify not in readable:
+            return False
+        try:
+            data = os.read(self._inotify, 64 * 1024)
+        except BlockingIOError:
+            return False
+        return self.path.name in event_names(data)
+
+    def _run(self) -> None:
+        """Wait for writes, then check the file once they've settled"""
+        while not self._stopping.is_set():
+            if not self._wait(None):
+                continue
+            # coalesce a burst of writes into one check
+            while not self._stopping.is_set() and self._wait(self.debounce):
+                pass
+            if not self._stopping.is_set():
+                self._check()
+
+    def _check(self) -> None:
+        """Call back if the file's contents have changed since the last save"""
+        try:
+            if not has_changed(self.snapshot, self.path):
+                # remember the new stat signature, so it isn't hashed again
+                st = os.stat(self.path)
+                self.snapshot = FileSnapshot(
+                    st.st_size, st.st_mtime_ns, st.st_ino, self.snapshot.digest
+                )
+                return
+            snapshot = take_snapshot(self.path)
+            self.on_save()
+            # only once it's synced, so a failed save is still seen as unsaved
+            self.snapshot = snapshot
+            self.saves += 1
+        except FileNotFoundError:
+            pass  # mid-rename; the next event will pick it up
+        except Exception as e:
+            self.error = e
@@ -2,7 +2,10 @@
 import datetime
 import pathlib
 import pytest
+import subprocess
+import sys
 import tempfile
+import time
 from unittest.mock import patch, MagicMock
 
 from clerk.app import main
@@ -131,3 +134,243 @@ def test_journal_closed_changes_get_applied(patched_subprocess_run, example_app)
         m.assert_called_once()
         with open(t.name, "r") as f:
             assert f.readlines() == ["HELLO WORLD"]
+
+
+STARTUP_BUDGET_SECONDS = 0.25
+
+
+def test_import_stays_within_startup_budget():
+    """Ensure importing clerk.app is fast and defers its heavy imports"""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import clerk.app\n"
+        "elapsed = time.perf_counter() - start\n"
+        "heavy = ['importlib.metadata', 'word2number', 'subprocess', 'shutil', 'hashlib']\n"
+        "print(elapsed, [m for m in heavy if m in sys.modules])\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=pathlib.Path(__file__).parents[1],
+    )
+    elapsed, eagerly_imported = result.stdout.split(" ", 1)
+    assert eagerly_imported.strip() == "[]"
+    assert float(elapsed) < STARTUP_BUDGET_SECONDS
+
+
+@patch("subprocess.run")
+def test_unchanged_hook_output_skips_write(patched_subprocess_run, example_app):
+    """Ensure hooks that make no changes don't rewrite the temporary copy."""
+    inodes = []
+
+    def record_inode(lines, conf):
+        """Record the inode of the temporary copy seen by each hook"""
+        inodes.append(pathlib.Path(example_app.temp_directory, "1235.md").stat().st_ino)
+
+    custom_hook_implementation = MagicMock()
+    custom_hook_implementation.name = "custom"
+    custom_hook_implementation.load.return_value = record_inode
+    example_app.hooks["JOURNAL_OPENED"] = [custom_hook_implementation]
+    example_app.hooks["JOURNAL_CLOSED"] = [custom_hook_implementation]
+    example_app.open_journal("1235.md")
+    example_app.hooks["JOURNAL_OPENED"] = []
+    example_app.hooks["JOURNAL_CLOSED"] = []
+    assert len(inodes) == 2 and inodes[0] == inodes[1]
+
+
+@patch("subprocess.run")
+def test_unchanged_journal_is_not_written_back(patched_subprocess_run, example_app):
+    """Ensure closing a journal without changes leaves the original file untouched."""
+    with tempfile.NamedTemporaryFile(dir=example_app.journal_directory) as t:
+        t.write(b"hello\n")
+        t.flush()
+        before = pathlib.Path(t.name).stat()
+        example_app.open_journal(pathlib.Path(t.name).name)
+        after = pathlib.Path(t.name).stat()
+    assert (before.st_ino, before.st_mtime_ns) == (after.st_ino, after.st_mtime_ns)
+
+
+@patch("subprocess.run")
+def test_new_journal_is_written_back(patched_subprocess_run, example_app):
+    """Ensure opening a journal that doesn't exist yet creates it."""
+    journal = pathlib.Path(example_app.journal_directory, "1236.md")
+    example_app.open_journal(journal.name)
+    assert journal.exists()
+    assert not pathlib.Path(example_app.temp_directory, journal.name).exists()
+
+
+@pytest.mark.parametrize(
+    "phrase, expected",
+    [
+        ("previous", [YESTERDAY]),
+        ("next", [TWO_DAYS_FROM_NOW]),
+        ("four days ago..today", [FOUR_DAYS_AGO, YESTERDAY]),
+    ],
+)
+def test_main_opens_existing_journals(phrase, expected, journal_dir, user_data_dir):
+    """Ensure 'previous', 'next' and date ranges open the journals that exist"""
+    config = {"DEFAULT": dict(EXAMPLE_CONFIG["DEFAULT"], journal_directory=journal_dir)}
+    for day in [FOUR_DAYS_AGO, YESTERDAY, TWO_DAYS_FROM_NOW]:
+        pathlib.Path(journal_dir, f"{day.strftime('%Y-%m-%d')}.md").touch()
+    with patch("clerk.app.Application.open_journal") as patched_open_journal:
+        with patch("clerk.app.get_config", lambda: config):
+            with patch("clerk.app.temp_directory_path", lambda: user_data_dir):
+                with patch("sys.argv", [" "] + phrase.split(" ")):
+                    assert main() == 0
+    assert patched_open_journal.call_args_list == [
+        ((f"{day.strftime('%Y-%m-%d')}.md",),) for day in expected
+    ]
+
+
+def test_live_sync_writes_saves_back_during_session():
+    """Ensure saves made while the editor is open reach the journal directory before it exits"""
+    with tempfile.TemporaryDirectory() as journals, tempfile.TemporaryDirectory() as d:
+        config = {
+            "DEFAULT": dict(
+                EXAMPLE_CONFIG["DEFAULT"],
+                journal_directory=journals,
+                live_sync="yes",
+                live_sync_debounce="0.05",
+            )
+        }
+        app = Application(config, d, {})
+        journal = pathlib.Path(journals, "2021-01-04.md")
+        journal.write_text("# Monday\n")
+        seen_during_session = []
+
+        def edit(*args, **kwargs):
+            """Save, then wait for the save to be synced"""
+            with open(pathlib.Path(d, journal.name), "a") as f:
+                f.write("hello\n")
+            deadline = time.monotonic() + 5
+            while journal.read_text() == "# Monday\n" and time.monotonic() < deadline:
+                time.sleep(0.01)
+            seen_during_session.append(journal.read_text())
+
+        with patch("subprocess.run", side_effect=edit):
+            app.open_journal(journal.name)
+        assert seen_during_session == ["# Monday\nhello\n"]
+        assert journal.read_text() == "# Monday\nhello\n"
+        assert sorted(p.name for p in pathlib.Path(journals).iterdir()) == [
+            journal.name
+        ]
+
+
+def test_failed_live_sync_is_written_back_on_close():
+    """Ensure a save whose live sync failed isn't lost when the editor exits"""
+    with tempfile.TemporaryDirectory() as journals, tempfile.TemporaryDirectory() as d:
+        config = {
+            "DEFAULT": dict(
+                EXAMPLE_CONFIG["DEFAULT"],
+                journal_directory=journals,
+                live_sync="yes",
+                live_sync_debounce="0.05",
+            )
+        }
+        app = Application(config, d, {})
+        journal = pathlib.Path(journals, "2021-01-04.md")
+        journal.write_text("# Monday\n")
+        attempts = []
+
+        def edit(*args, **kwargs):
+            """Save, then wait for the live sync to be attempted"""
+            with open(pathlib.Path(d, journal.name), "a") as f:
+                f.write("hello\n")
+            deadline = time.monotonic() + 5
+            while not attempts and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        def sync(*args):
+            """A live sync that fails"""
+            attempts.append(args)
+            raise RuntimeError("plugin failed")
+
+        with patch("subprocess.run", side_effect=edit):
+            with patch.object(app, "_sync", side_effect=sync):
+                app.open_journal(journal.name)
+        assert attempts
+        assert journal.read_text() == "# Monday\nhello\n"
+
+
+def test_concurrent_live_syncs_restore_stdout():
+    """Ensure live syncs of a batch's journals leave sys.stdout as they found it"""
+    import threading
+
+    with tempfile.TemporaryDirectory() as journals, tempfile.TemporaryDirectory() as d:
+        config = {
+            "DEFAULT": dict(EXAMPLE_CONFIG["DEFAULT"], journal_directory=journals)
+        }
+        app = Application(config, d, {})
+        stdout = sys.stdout
+        overlap = threading.Barrier(2)
+        entered = []
+
+        def noisy_plugin(hook_name, filename, deferred=None):
+            """A JOURNAL_SAVED plugin that prints; the first sync to start finishes first"""
+            entered.append(filename)
+            print("formatting")
+            try:
+                overlap.wait(0.2)  # both at once, unless syncs take turns
+            except threading.BrokenBarrierError:
+                pass
+            if len(entered) > 1 and filename == entered[1]:
+                time.sleep(0.05)
+            return False
+
+        syncs = []
+        for name in ["2021-01-04.md", "2021-01-05.md"]:
+            pathlib.Path(d, name).write_text("hello\n")
+            syncs.append(
+                threading.Thread(target=app._sync, args=(pathlib.Path(d, name), name))
+            )
+        with patch.object(app, "_apply_callbacks_for_hook", noisy_plugin):
+            for sync in syncs:
+                sync.start()
+            for sync in syncs:
+                sync.join()
+        assert sys.stdout is stdout
+        assert pathlib.Path(journals, "2021-01-05.md").read_text() == "hello\n"
+
+
+def test_open_batch_uses_one_editor():
+    """Ensure a batch of journals opens in a single editor invocation"""
+    with tempfile.TemporaryDirectory() as journals, tempfile.TemporaryDirectory() as d:
+        config = {
+            "DEFAULT": dict(EXAMPLE_CONFIG["DEFAULT"], journal_directory=journals)
+        }
+        app = Application(config, d, {})
+        filenames = ["2021-01-04.md", "2021-01-05.md"]
+
+        def edit(command, **kwargs):
+            """Write to every journal in the batch"""
+            for filename in filenames:
+                pathlib.Path(d, filename).write_text(f"{filename}\n")
+
+        with patch("subprocess.run", side_effect=edit) as patched_subprocess_run:
+            app.open_batch(filenames)
+        patched_subprocess_run.assert_called_once()
+        command = patched_subprocess_run.call_args[0][0]
+        assert all(str(pathlib.Path(d, filename)) in command for filename in filenames)
+        for filename in filenames:
+            assert pathlib.Path(journals, filename).read_text() == f"{filename}\n"
+        assert app.locks == {}
+
+
+def test_open_batch_rolls_back_when_a_journal_is_open():
+    """Ensure no journal in a batch is opened if one of them is already open"""
+    with tempfile.TemporaryDirectory() as journals, tempfile.TemporaryDirectory() as d:
+        config = {
+            "DEFAULT": dict(EXAMPLE_CONFIG["DEFAULT"], journal_directory=journals)
+        }
+        app = Application(config, d, {})
+        pathlib.Path(d, "2021-01-05.md").write_text("open elsewhere\n")
+        with patch("subprocess.run") as patched_subprocess_run:
+            with pytest.raises(SystemExit):
+                app.open_batch(["2021-01-04.md", "2021-01-05.md"])
+        patched_subprocess_run.assert_not_called()
+        assert not pathlib.Path(d, "2021-01-04.md").exists()
+        assert pathlib.Path(d, "2021-01-05.md").read_text() == "open elsewhere\n"
+        assert app.locks == {}
@@ -0,0 +1,117 @@
+"""Tests for the compressed journal archive"""
+import datetime
+import pathlib
+import pytest
+import tempfile
+import zlib
+from unittest.mock import patch
+
+from clerk.archive import HEADER
+from clerk.archive import Archive
+from clerk.archive import archive_journals
+from clerk.archive import archive_path
+from clerk.archive import write_archive
+from clerk.catalog import Catalog
+from clerk.jobs import enqueue_job
+from clerk.locks import JournalLock
+from clerk.search import SearchIndex
+
+
+RECENT = f"{datetime.date.today():%Y-%m-%d}.md"
+
+
+@pytest.fixture
+def app(make_app):
+    """Fixture to set up an Application with a few old journals and a recent one."""
+    names = ["2021-01-04.md", "2021-01-06.md", RECENT]
+    return make_app({name: f"hiking on {name}\n" for name in names})
+
+
+def test_archive_looks_up_entries():
+    """Ensure any entry can be found and decompressed by name"""
+    with tempfile.TemporaryDirectory() as d:
+        path = pathlib.Path(d, "test.archive")
+        names = [f"2021-01-{day:02d}.md" for day in range(1, 29)]
+        entries = [(n, zlib.compress(n.encode()), len(n), 0) for n in names]
+        assert write_archive(path, reversed(entries)) == len(names)
+        with Archive(path) as archive:
+            assert len(archive) == len(names)
+            assert [entry.name for entry in archive] == names
+            for name in names:
+                assert archive.read(name) == name.encode()
+            assert "2021-02-01.md" not in archive
+            with pytest.raises(FileNotFoundError):
+                archive.read("2021-02-01.md")
+
+
+def test_archive_journals_packs_old_journals(app):
+    """Ensure old journals move into the archive, and stay cataloged and searchable"""
+    assert archive_journals(app, 30) == ["2021-01-04.md", "2021-01-06.md"]
+    assert sorted(p.name for p in pathlib.Path(app.journal_directory).iterdir()) == [
+        ".archive.clerk",
+        RECENT,
+    ]
+    assert [filename for _, filename in Catalog(app)] == [
+        "2021-01-04.md",
+        "2021-01-06.md",
+        RECENT,
+    ]
+    with SearchIndex(app) as index:
+        index.rescan()
+        assert len(index.search("hiking")) == 3
+    assert archive_journals(app, 30) == []
+
+
+def test_archive_journals_leaves_busy_journals_loose(app):
+    """Ensure journals that are open, or queued for a deferred hook, aren't packed"""
+    enqueue_job(app, "2021-01-06.md", [("JOURNAL_SAVED", "sign")])
+    with JournalLock(app.temp_directory, "2021-01-04.md"):
+        assert archive_journals(app, 30) == []
+    assert pathlib.Path(app.journal_directory, "2021-01-04.md").exists()
+    assert pathlib.Path(app.journal_directory, "2021-01-06.md").exists()
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [b"", b"CLERKARC", HEADER.pack(b"CLERKARC", 1, 5, HEADER.size)],
+    ids=["empty", "no header", "no index"],
+)
+def test_corrupt_archive_is_reported_and_kept(app, contents, capsys):
+    """Ensure an empty or truncated archive is ignored when reading, but not overwritten"""
+    path = archive_path(app.journal_directory)
+    path.write_bytes(contents)
+    assert len(Catalog(app)) == 3
+    assert "Ignoring a corrupt journal archive" in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        archive_journals(app, 30)
+    assert pathlib.Path(app.journal_directory, "2021-01-04.md").exists()
+    assert path.read_bytes() == contents
+
+
+def test_archive_journals_replaces_archived_copies(app):
+    """Ensure re-archiving a journal edited since it was archived keeps the edits"""
+    archive_journals(app, 30)
+    pathlib.Path(app.journal_directory, "2021-01-04.md").write_text("edited\n")
+    assert archive_journals(app, 30) == ["2021-01-04.md"]
+    with Archive(archive_path(app.journal_directory)) as archive:
+        assert archive.read("2021-01-04.md") == b"edited\n"
+        assert archive.read("2021-01-06.md") == b"hiking on 2021-01-06.md\n"
+
+
+def test_open_journal_extracts_archived_journals(app):
+    """Ensure archived journals open transparently, and are only written back loose if edited"""
+    archive_journals(app, 30)
+    loose = pathlib.Path(app.journal_directory, "2021-01-04.md")
+
+    def edit(*args, **kwargs):
+        """Check the journal was extracted, then edit it"""
+        temporary_copy = pathlib.Path(app.temp_directory, loose.name)
+        assert temporary_copy.read_text() == "hiking on 2021-01-04.md\n"
+        temporary_copy.write_text("edited\n")
+
+    with patch("subprocess.run"):
+        app.open_journal(loose.name)
+    assert not loose.exists()
+    with patch("subprocess.run", side_effect=edit):
+        app.open_journal(loose.name)
+    assert loose.read_text() == "edited\n"
@@ -0,0 +1,124 @@
+"""Tests for the hook result cache"""
+import configparser
+import datetime
+import importlib
+import pathlib
+import pytest
+import tempfile
+from unittest.mock import patch
+
+from clerk.cache import ResultCache
+from clerk.cache import cacheable
+from clerk.extensions import Extension
+from clerk.hooks import run_pipeline
+
+
+CALLS = []
+
+
+def calls():
+    """The callbacks run, as recorded by the copy of this module clerk loaded"""
+    return importlib.import_module("tests.cache_test").CALLS
+
+
+@cacheable
+def title(lines, conf):
+    """A pure plugin that adds a title"""
+    CALLS.append("title")
+    return [f"# {conf.get('title', 'Journal')}\n"] + lines
+
+
+@cacheable(per_day=True)
+def weather(lines, conf):
+    """A plugin whose output depends on the day it runs"""
+    CALLS.append("weather")
+    return lines + ["sunny\n"]
+
+
+def undeclared(lines, conf):
+    """A plugin that hasn't said whether it can be cached"""
+    CALLS.append("undeclared")
+    return lines + ["signed\n"]
+
+
+TITLE = Extension("title", "tests.cache_test:title", "1.0")
+WEATHER = Extension("weather", "tests.cache_test:weather", "1.0")
+UNDECLARED = Extension("undeclared", "tests.cache_test:undeclared", "1.0")
+
+
+@pytest.fixture
+def cache():
+    """Fixture to set up an empty result cache."""
+    calls().clear()
+    with tempfile.TemporaryDirectory() as t:
+        cache = ResultCache(pathlib.Path(t, "cache.sqlite3"))
+        yield cache
+        cache.close()
+
+
+def test_cache_hit_skips_callback(cache):
+    """Ensure a repeated run with the same input is answered from the cache"""
+    first = run_pipeline([TITLE], ["hello\n"], {}, cache)
+    second = run_pipeline([TITLE], ["hello\n"], {}, cache)
+    assert first == second == (["# Journal\n", "hello\n"], True)
+    assert calls() == ["title"]
+
+
+def test_cache_key_covers_lines_config_and_version(cache):
+    """Ensure different input, config or plugin version misses the cache"""
+    run_pipeline([TITLE], ["hello\n"], {}, cache)
+    run_pipeline([TITLE], ["goodbye\n"], {}, cache)
+    got, _ = run_pipeline([TITLE], ["hello\n"], {"title": {"title": "Diary"}}, cache)
+    assert got == ["# Diary\n", "hello\n"]
+    run_pipeline([TITLE._replace(version="1.1")], ["hello\n"], {}, cache)
+    assert calls() == ["title"] * 4
+
+
+def test_cache_is_opt_in(cache):
+    """Ensure only declared (or configured) plugins are cached, and that it can be turned off"""
+    for _ in range(2):
+        run_pipeline([UNDECLARED], [], {}, cache)
+    for _ in range(2):
+        run_pipeline([UNDECLARED], [], {"undeclared": {"hook_cache": "yes"}}, cache)
+    for _ in range(2):
+        run_pipeline([TITLE], [], {"title": {"hook_cache": "no"}}, cache)
+    assert calls() == ["undeclared"] * 3 + ["title"] * 2
+
+
+def test_cache_can_be_turned_off_for_every_plugin(cache):
+    """Ensure `hook_cache = no` in DEFAULT applies to plugins without a section"""
+    config = configparser.ConfigParser()
+    config.read_dict({"DEFAULT": {"hook_cache": "no"}, "weather": {}})
+    for _ in range(2):
+        run_pipeline([TITLE, WEATHER], [], config, cache)
+    assert calls() == ["title", "weather"] * 2
+
+
+def test_per_day_results_expire_with_the_day(cache):
+    """Ensure per_day plugins are only cached for the day they ran"""
+    run_pipeline([WEATHER], [], {}, cache)
+    run_pipeline([WEATHER], [], {}, cache)
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    with patch("datetime.date") as patched_date:
+        patched_date.today.return_value = tomorrow
+        run_pipeline([WEATHER], [], {}, cache)
+    assert calls() == ["weather"] * 2
+
+
+def test_cache_expires_and_evicts_least_recently_used():
+    """Ensure old results expire, and the least recently used go first when full"""
+    with tempfile.TemporaryDirectory() as t:
+        cache = ResultCache(pathlib.Path(t, "cache.sqlite3"), ttl=60, max_bytes=40)
+        with patch("time.time", return_value=1000):
+            cache.put("a", ["a" * 10 + "\n"])
+        with patch("time.time", return_value=1001):
+            cache.put("b", ["b" * 10 + "\n"])
+        with patch("time.time", return_value=1002):
+            assert cache.get("a") == (True, ["a" * 10 + "\n"])
+            cache.put("c", ["c" * 10 + "\n"])  # over 40 bytes; "b" is least recent
+        with patch("time.time", return_value=1003):
+            assert [cache.get(key)[0] for key in "abc"] == [True, False, True]
+        with patch("time.time", return_value=1061):
+            assert cache.get("a") == (False, None)
+            assert cache.get("c")[0]
+        cache.close()
@@ -0,0 +1,69 @@
+"""Tests for clerk's catalog of existing journals"""
+import datetime
+import pathlib
+import pytest
+
+from clerk.catalog import Catalog
+from clerk.catalog import catalog_path
+
+
+@pytest.fixture
+def app(make_app):
+    """Fixture to set up an Application with journals on a few scattered days."""
+    names = ["2021-01-04.md", "2021-01-06.md", "2021-01-11.md", "x.md"]
+    return make_app({name: "hello\n" for name in names})
+
+
+def test_catalog_lists_journals_in_date_order(app):
+    """Ensure only files named after dates are cataloged, oldest first"""
+    got = [entry.filename for entry in Catalog(app)]
+    assert got == ["2021-01-04.md", "2021-01-06.md", "2021-01-11.md"]
+
+
+@pytest.mark.parametrize(
+    "first, last, expected",
+    [
+        ("2021-01-04", "2021-01-06", ["2021-01-04.md", "2021-01-06.md"]),
+        ("2021-01-05", "2021-01-10", ["2021-01-06.md"]),
+        ("2021-01-07", "2021-01-10", []),
+        (
+            "2020-01-01",
+            "2022-01-01",
+            ["2021-01-04.md", "2021-01-06.md", "2021-01-11.md"],
+        ),
+    ],
+)
+def test_catalog_between(first, last, expected, app):
+    """Ensure Catalog.between returns the journals within an inclusive date range"""
+    first_day = datetime.datetime.fromisoformat(first)
+    last_day = datetime.datetime.fromisoformat(last) + datetime.timedelta(hours=12)
+    got = Catalog(app).between(first_day, last_day)
+    assert [entry.filename for entry in got] == expected
+
+
+def test_catalog_previous_and_next(app):
+    """Ensure Catalog.previous and Catalog.next skip days without journals"""
+    catalog = Catalog(app)
+    day = datetime.datetime(2021, 1, 6, 9, 30)
+    assert catalog.previous(day).filename == "2021-01-04.md"
+    assert catalog.next(day).filename == "2021-01-11.md"
+    assert catalog.previous(datetime.datetime(2021, 1, 4)) is None
+    assert catalog.next(datetime.datetime(2021, 1, 11)) is None
+
+
+def test_catalog_is_persisted_and_refreshed(app):
+    """Ensure the catalog is reused until the journal directory changes"""
+    Catalog(app)
+    assert catalog_path(app.temp_directory).exists()
+    assert not Catalog(app).refresh()
+    pathlib.Path(app.journal_directory, "2021-01-05.md").write_text("hello\n")
+    catalog = Catalog(app)
+    assert "2021-01-05.md" in catalog.filenames
+
+
+def test_catalog_without_a_writable_data_directory(app):
+    """Ensure the catalog still works (unsaved) if it can't be stored"""
+    app.temp_directory = pathlib.Path(app.journal_directory, "2021-01-04.md")
+    with Catalog(app) as catalog:
+        assert len(catalog) == 3
+        assert catalog.next(datetime.datetime(2021, 1, 4)).filename == "2021-01-06.md"
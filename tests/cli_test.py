@@ -0,0 +1,26 @@
+"""Tests for the `clerk` command line interface"""
+import pytest
+from unittest.mock import patch
+
+from clerk.cli import main
+
+
+@pytest.fixture
+def app(make_app):
+    """Fixture to set up an Application with a couple of journals."""
+    journals = {"2021-01-04.md": "# Monday\nhiking\n", "2021-01-05.md": "# Tuesday\n"}
+    with patch("clerk.cli.create_application") as patched:
+        patched.return_value = make_app(journals)
+        yield patched.return_value
+
+
+def test_search_prints_matching_lines(app, capsys):
+    """Ensure `clerk search` lists matching journals and lines"""
+    assert main(["search", "hiking"]) == 0
+    assert capsys.readouterr().out == "2021-01-04.md\n    2: hiking\n"
+
+
+def test_search_without_matches_fails(app, capsys):
+    """Ensure `clerk search` exits non-zero when nothing matches"""
+    assert main(["search", "swimming"]) == 1
+    assert capsys.readouterr().out == ""
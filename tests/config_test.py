@@ -7,9 +7,13 @@ from typing import Mapping
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
+import clerk.config
+from clerk.config import HOOK_NAMES
+from clerk.config import ClerkConfig
 from clerk.config import dirs
 from clerk.config import config_file_path
 from clerk.config import get_config
+from clerk.config import hook_plugin_names
 from clerk.config import write_config
 
 
@@ -92,3 +96,39 @@ def test_config_contains_necessary_fields(field):
     """Ensure that the config file contains the necessary fields"""
     config = get_config()
     assert field in config
+
+
+def test_get_config_is_memoized(clerk_config):
+    """Ensure an unchanged config file is only parsed once"""
+    with patch.object(
+        ClerkConfig, "read", autospec=True, side_effect=ConfigParser.read
+    ) as patched_read:
+        first = get_config()
+        second = get_config()
+    patched_read.assert_called_once()
+    assert first is second
+
+
+def test_get_config_reparses_changed_file(clerk_config):
+    """Ensure edits to the config file are picked up"""
+    first = get_config()
+    with open(clerk.config.config_file_path(), "a") as f:
+        f.write("\n[hooks]\nJOURNAL_OPENED =\n    timestamp\n")
+    second = get_config()
+    assert second is not first
+    assert second.hook_table["JOURNAL_OPENED"] == ["timestamp"]
+
+
+def test_write_config_invalidates_memo(clerk_config):
+    """Ensure clerk.config.write_config forgets the memoized config"""
+    first = get_config()
+    with patch("builtins.print"):
+        write_config(first)
+    assert get_config() is not first
+
+
+def test_get_config_precomputes_hook_table(clerk_config):
+    """Ensure the parsed config carries its hook -> plugin names table"""
+    conf = get_config()
+    assert conf.hook_table == {hook_name: [] for hook_name in HOOK_NAMES}
+    assert hook_plugin_names(conf) is conf.hook_table
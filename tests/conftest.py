@@ -0,0 +1,47 @@
+"""Fixtures shared by clerk's tests"""
+import pathlib
+import pytest
+import tempfile
+from typing import Dict
+from typing import Mapping
+from typing import Optional
+
+from clerk.app import Application
+
+
+DEFAULT_CONFIG = {
+    "preferred_editor": "vi",
+    "date_format": "%Y-%m-%d",
+    "file_extension": "md",
+}
+
+
+@pytest.fixture
+def make_app():
+    """Fixture to build Applications over empty, temporary journal and user data directories.
+
+    Call it with the journals to write (filename -> text), any config sections
+    to add (DEFAULT keys are merged with the usual ones) and the extensions
+    plugins are loaded from.
+    """
+    with tempfile.TemporaryDirectory() as journal_dir:
+        with tempfile.TemporaryDirectory() as user_data_dir:
+
+            def make(
+                journals: Optional[Mapping[str, str]] = None,
+                config: Optional[Mapping[str, Dict]] = None,
+                extensions: Optional[Mapping] = None,
+            ) -> Application:
+                """An Application with the given journals, config and extensions"""
+                for filename, text in (journals or {}).items():
+                    path = pathlib.Path(journal_dir, filename)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    path.write_text(text)
+                sections = dict(config or {})
+                defaults = dict(DEFAULT_CONFIG, journal_directory=journal_dir)
+                sections["DEFAULT"] = {**defaults, **sections.get("DEFAULT", {})}
+                return Application(
+                    sections, pathlib.Path(user_data_dir), extensions or {}
+                )
+
+            yield make
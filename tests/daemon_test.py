@@ -0,0 +1,111 @@
+"""Tests for the resident clerk daemon and its `journal` client"""
+import datetime
+import os
+import pathlib
+import pytest
+import socket
+import threading
+from unittest.mock import patch
+
+from clerk.daemon import Daemon
+from clerk.daemon import finish_session
+from clerk.daemon import request
+from clerk.daemon import run_client
+from clerk.daemon import socket_path
+from clerk.extensions import Extension
+from clerk.locks import lock_path
+
+TODAY = f"{datetime.date.today():%Y-%m-%d}.md"
+
+
+def sign(lines, conf):
+    """A plugin that signs journals"""
+    return lines + ["signed\n"]
+
+
+@pytest.fixture
+def app(make_app):
+    """Fixture to set up an application with one JOURNAL_OPENED plugin"""
+    config = {"hooks": {"JOURNAL_OPENED": "\nsign"}}
+    extensions = {"sign": Extension("sign", "tests.daemon_test:sign")}
+    return make_app(config=config, extensions=extensions)
+
+
+@pytest.fixture
+def daemon(app):
+    """Fixture to serve the application from a daemon on a background thread"""
+    with patch("clerk.app.create_application", return_value=app):
+        served = Daemon(app.temp_directory)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        listener.bind(str(socket_path(app.temp_directory)))
+        listener.listen()
+        thread = threading.Thread(target=served.serve, args=(listener,))
+        thread.start()
+        yield served
+        request(socket_path(app.temp_directory), {"command": "stop"})
+        thread.join()
+
+
+def test_client_opens_journals_through_daemon(app, daemon, capsys):
+    """Ensure the daemon prepares and finishes the journal while the client runs the editor"""
+    with patch("subprocess.run") as editor:
+        assert run_client(["today"], app.temp_directory) == 0
+    (command,), _ = editor.call_args
+    assert command == ["vi", str(pathlib.Path(app.temp_directory, TODAY))]
+    assert pathlib.Path(app.journal_directory, TODAY).read_text() == "signed\n"
+    assert "sign ran; changes applied!" in capsys.readouterr().out
+
+
+def test_client_relays_exits(app, daemon, capsys):
+    """Ensure errors the daemon hits (like an already-open journal) exit the client"""
+    pathlib.Path(app.temp_directory, TODAY).touch()
+    with patch("subprocess.run") as editor:
+        assert run_client(["today"], app.temp_directory) == 1
+    editor.assert_not_called()
+    assert "File already open!" in capsys.readouterr().out
+
+
+def test_client_without_daemon(app):
+    """Ensure the client steps aside when no daemon is listening, even if its socket was left behind"""
+    assert run_client([], app.temp_directory) is None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(str(socket_path(app.temp_directory)))
+    assert run_client([], app.temp_directory) is None
+
+
+def test_finish_falls_back_only_when_the_daemon_is_gone(app, capsys):
+    """Ensure a session is finished here if the daemon went away, but not if it's just slow"""
+    session = ["x.md", [0, 0, 0, ""], 0]
+    path = socket_path(app.temp_directory)
+    with patch("clerk.app.create_application", return_value=app):
+        with patch.object(app, "finish_journal") as finish:
+            with patch("clerk.daemon.request", side_effect=socket.timeout("timed out")):
+                finish_session(path, session)
+            finish.assert_not_called()
+            with patch("clerk.daemon.request", side_effect=ConnectionRefusedError):
+                finish_session(path, session)
+            finish.assert_called_once()
+    assert "Lost touch with the clerk daemon" in capsys.readouterr().out
+
+
+def test_prepare_and_finish_wait_for_slow_hooks(app, daemon):
+    """Ensure requests that run hooks aren't cut short by a timeout"""
+    with patch("clerk.daemon.request", wraps=request) as sent, patch("subprocess.run"):
+        assert run_client(["today"], app.temp_directory) == 0
+    kwargs = {c.args[1]["command"]: c.kwargs for c in sent.mock_calls}
+    assert kwargs["prepare"] == kwargs["finish"] == {"timeout": None}
+
+
+def test_lock_goes_with_a_client_that_disappears(app, daemon, capsys):
+    """Ensure a client dying mid-edit doesn't leave its journal locked by the daemon"""
+    path = socket_path(app.temp_directory)
+    response = request(path, {"command": "prepare", "filename": TODAY})
+    assert daemon.sessions and not app.locks
+    os.close(response["lock"])  # the client is killed before it can finish
+    with patch("subprocess.run"):
+        assert run_client(["today"], app.temp_directory) == 0
+    out = capsys.readouterr().out
+    assert "File already open!" not in out
+    assert "was left open by a session that didn't finish" in out
+    assert daemon.sessions == {}
+    assert not lock_path(app.temp_directory, TODAY).exists()
@@ -0,0 +1,77 @@
+"""Tests for edit operations and on-disk documents"""
+import os
+import pathlib
+import pytest
+import tempfile
+
+from clerk.edits import Append
+from clerk.edits import Document
+from clerk.edits import Insert
+from clerk.edits import Prepend
+from clerk.edits import Replace
+from clerk.edits import apply_edits
+
+
+@pytest.fixture
+def journal_file():
+    """Fixture to create a small journal file."""
+    with tempfile.TemporaryDirectory() as d:
+        path = pathlib.Path(d, "2021-01-04.md")
+        path.write_text("# Monday\nhello\n")
+        yield path
+
+
+def test_apply_edits_in_order():
+    """Ensure each edit applies to the result of the previous one"""
+    edits = [
+        Prepend(["---\n"]),
+        Insert(2, ["inserted\n"]),
+        Replace(3, 4, ["replaced\n"]),
+        Append(["bye\n"]),
+    ]
+    got = apply_edits(["# Monday\n", "hello\n"], edits)
+    assert got == ["---\n", "# Monday\n", "inserted\n", "replaced\n", "bye\n"]
+
+
+def test_document_appends_without_rewriting(journal_file):
+    """Ensure appending to an unread document appends to the file in place"""
+    inode = journal_file.stat().st_ino
+    with Document(journal_file) as document:
+        assert document.apply([Append(["bye\n"])])
+        document.save()
+    assert journal_file.read_text() == "# Monday\nhello\nbye\n"
+    assert journal_file.stat().st_ino == inode
+
+
+def test_document_materializes_for_other_edits(journal_file):
+    """Ensure edits other than appends are applied to the document's lines"""
+    with Document(journal_file) as document:
+        document.apply([Append(["bye\n"])])
+        document.apply([Replace(1, 2, ["goodbye\n"])])
+        document.save()
+    assert journal_file.read_text() == "# Monday\ngoodbye\nbye\n"
+
+
+def test_document_streams_through_generators(journal_file):
+    """Ensure streamed output replaces the document, leaving no temporary files"""
+
+    def upper(lines, conf):
+        """Upper-case every line"""
+        for line in lines:
+            yield line.upper()
+
+    with Document(journal_file) as document:
+        assert document.stream(upper, {})
+        document.apply([Append(["bye\n"])])
+        document.save()
+    assert journal_file.read_text() == "# MONDAY\nHELLO\nbye\n"
+    assert os.listdir(journal_file.parent) == [journal_file.name]
+
+
+def test_document_unchanged_by_identical_stream(journal_file):
+    """Ensure a generator that yields the same lines leaves the document unchanged"""
+    with Document(journal_file) as document:
+        assert not document.stream(lambda lines, conf: (line for line in lines), {})
+        assert not document.replace(["# Monday\n", "hello\n"])
+        assert not document.changed
+    assert os.listdir(journal_file.parent) == [journal_file.name]
@@ -0,0 +1,70 @@
+"""Tests for exporting journals to a single document"""
+import datetime
+import json
+import pathlib
+import pytest
+from unittest.mock import patch
+
+from clerk.archive import Archive
+from clerk.archive import archive_journals
+from clerk.archive import archive_path
+from clerk.cli import main
+from clerk.export import export
+from clerk.extensions import Extension
+
+
+def shout(lines, conf):
+    """A plugin that upper-cases journals"""
+    return [line.upper() for line in lines]
+
+
+@pytest.fixture
+def app(make_app):
+    """Fixture to set up an Application with a few journals and a JOURNAL_OPENED plugin."""
+    journals = {f"2021-01-{day:02d}.md": f"<day {day}>\n" for day in range(4, 8)}
+    config = {"hooks": {"JOURNAL_OPENED": "\nshout"}}
+    extensions = {"shout": Extension("shout", "tests.export_test:shout")}
+    return make_app(journals, config, extensions)
+
+
+def test_export_markdown_in_range(app):
+    """Ensure only journals in the range are exported, oldest first"""
+    since, until = datetime.date(2021, 1, 5), datetime.date(2021, 1, 6)
+    assert "".join(export(app, since, until)) == (
+        "# 2021-01-05\n\n<day 5>\n\n# 2021-01-06\n\n<day 6>\n"
+    )
+
+
+def test_export_jsonl_and_html(app):
+    """Ensure JSON Lines and HTML exports encode each journal's text"""
+    lines = "".join(export(app, output_format="jsonl")).splitlines()
+    assert [json.loads(line) for line in lines][0] == {
+        "date": "2021-01-04",
+        "filename": "2021-01-04.md",
+        "text": "<day 4>\n",
+    }
+    page = "".join(export(app, output_format="html"))
+    assert (
+        '<article id="2021-01-07">\n<h2>2021-01-07</h2>\n<pre>&lt;day 7&gt;\n' in page
+    )
+    assert page.endswith("</html>\n")
+
+
+def test_export_transforms_and_reads_archive(app):
+    """Ensure transforms run on archived journals too, without changing them"""
+    archive_journals(app, 1)
+    with Archive(archive_path(app.journal_directory)) as archive:
+        assert "2021-01-04.md" in archive
+    until = datetime.date(2021, 1, 5)
+    chunks = export(app, until=until, hook_name="JOURNAL_OPENED")
+    assert "".join(chunks) == "# 2021-01-04\n\n<DAY 4>\n\n# 2021-01-05\n\n<DAY 5>\n"
+    with Archive(archive_path(app.journal_directory)) as archive:
+        assert archive.read("2021-01-04.md") == b"<day 4>\n"
+
+
+def test_export_command_writes_file(app):
+    """Ensure `clerk export -o` picks the format from the file's extension"""
+    output = pathlib.Path(app.temp_directory, "journal.jsonl")
+    with patch("clerk.cli.create_application", return_value=app):
+        assert main(["export", "--since", "2021-01-07", "-o", str(output)]) == 0
+    assert json.loads(output.read_text())["filename"] == "2021-01-07.md"
@@ -0,0 +1,86 @@
+"""Tests for clerk's plugin registry"""
+import json
+import os
+import pytest
+import sys
+import tempfile
+from unittest.mock import patch
+
+from clerk.extensions import Extension
+from clerk.extensions import environment_fingerprint
+from clerk.extensions import load_extensions
+from clerk.extensions import registry_path
+
+
+HOOKED_CONFIG = {
+    "DEFAULT": {},
+    "hooks": {"JOURNAL_OPENED": "\ntimestamp", "JOURNAL_CLOSED": "\nformatter"},
+}
+
+
+@pytest.fixture
+def user_data_dir():
+    """Fixture to set up an empty user data directory."""
+    with tempfile.TemporaryDirectory() as t:
+        yield t
+
+
+def test_extension_load_resolves_module_attribute():
+    """Ensure clerk.extensions.Extension.load imports the object it points to"""
+    ext = Extension("dumps", "json:dumps")
+    assert ext.load() is json.dumps
+
+
+def test_fingerprint_ignores_the_working_directory():
+    """Ensure starting clerk from a directory that changes doesn't look like an upgrade"""
+    with tempfile.TemporaryDirectory() as t:
+        with patch("sys.path", [t, ""] + sys.path):
+            before = environment_fingerprint()
+            os.utime(t, ns=(0, 1))
+            assert environment_fingerprint() == before
+    assert all(entry for entry, _ in before[1:])
+
+
+@patch("clerk.extensions.scan_entry_points")
+def test_load_extensions_only_resolves_configured_plugins(patched_scan, user_data_dir):
+    """Ensure clerk.extensions.load_extensions skips plugins missing from [hooks]"""
+    patched_scan.return_value = {
+        "timestamp": ("clerk_timestamp:main", "1.0"),
+        "formatter": ("clerk_formatter:main", "1.0"),
+        "unused": ("clerk_unused:main", "1.0"),
+    }
+    got = load_extensions(HOOKED_CONFIG, user_data_dir)
+    assert got == {
+        "timestamp": Extension("timestamp", "clerk_timestamp:main", "1.0"),
+        "formatter": Extension("formatter", "clerk_formatter:main", "1.0"),
+    }
+
+
+@patch("clerk.extensions.scan_entry_points")
+def test_load_extensions_uses_persisted_registry(patched_scan, user_data_dir):
+    """Ensure the installed distributions are only scanned on a cold registry"""
+    patched_scan.return_value = {
+        "timestamp": ("clerk_timestamp:main", "1.0"),
+        "formatter": ("clerk_formatter:main", "1.0"),
+    }
+    load_extensions(HOOKED_CONFIG, user_data_dir)
+    load_extensions(HOOKED_CONFIG, user_data_dir)
+    patched_scan.assert_called_once()
+    assert registry_path(user_data_dir).exists()
+
+
+@patch("clerk.extensions.scan_entry_points")
+def test_load_extensions_rescans_stale_registry(patched_scan, user_data_dir):
+    """Ensure a registry written for another environment gets rebuilt"""
+    patched_scan.return_value = {"timestamp": ("clerk_timestamp:main", "1.0")}
+    load_extensions(HOOKED_CONFIG, user_data_dir)
+    with patch("clerk.extensions.environment_fingerprint", lambda: ["elsewhere"]):
+        load_extensions(HOOKED_CONFIG, user_data_dir)
+    assert patched_scan.call_count == 2
+
+
+@patch("clerk.extensions.scan_entry_points")
+def test_load_extensions_without_hooks_skips_discovery(patched_scan, user_data_dir):
+    """Ensure no plugin discovery happens when no hooks are configured"""
+    assert load_extensions({"DEFAULT": {}}, user_data_dir) == {}
+    patched_scan.assert_not_called()
@@ -0,0 +1,73 @@
+"""Tests for clerk's journal file utilities"""
+import os
+import pathlib
+import pytest
+import tempfile
+
+from clerk.files import atomic_write_lines
+from clerk.files import has_changed
+from clerk.files import take_snapshot
+from clerk.files import write_back
+
+
+@pytest.fixture
+def journal_file():
+    """Fixture to create a small journal file."""
+    with tempfile.TemporaryDirectory() as d:
+        path = pathlib.Path(d, "2021-01-04.md")
+        path.write_text("# Monday\nhello\n")
+        yield path
+
+
+def test_atomic_write_lines_replaces_contents(journal_file):
+    """Ensure clerk.files.atomic_write_lines overwrites the file and leaves no debris"""
+    atomic_write_lines(journal_file, ["# Monday\n", "goodbye\n"])
+    assert journal_file.read_text() == "# Monday\ngoodbye\n"
+    assert os.listdir(journal_file.parent) == [journal_file.name]
+
+
+def test_has_changed_false_when_untouched(journal_file):
+    """Ensure an untouched file is reported unchanged"""
+    snapshot = take_snapshot(journal_file)
+    assert not has_changed(snapshot, journal_file)
+
+
+def test_has_changed_false_when_rewritten_identically(journal_file):
+    """Ensure a file rewritten with the same contents is reported unchanged"""
+    snapshot = take_snapshot(journal_file)
+    atomic_write_lines(journal_file, ["# Monday\n", "hello\n"])
+    os.utime(journal_file, ns=(0, snapshot.mtime_ns + 1))
+    assert not has_changed(snapshot, journal_file)
+
+
+def test_has_changed_true_when_same_size_edit(journal_file):
+    """Ensure an edit that keeps the file size is still detected"""
+    snapshot = take_snapshot(journal_file)
+    journal_file.write_text("# Monday\nhowdy\n")
+    os.utime(journal_file, ns=(0, snapshot.mtime_ns + 1))
+    assert has_changed(snapshot, journal_file)
+
+
+def test_has_changed_true_when_size_differs(journal_file):
+    """Ensure a change in size is detected"""
+    snapshot = take_snapshot(journal_file)
+    journal_file.write_text("# Monday\nhello world\n")
+    assert has_changed(snapshot, journal_file)
+
+
+def test_take_snapshot_reuses_previous_when_untouched(journal_file):
+    """Ensure an untouched file's snapshot is reused rather than rehashed"""
+    snapshot = take_snapshot(journal_file)
+    assert take_snapshot(journal_file, previous=snapshot) is snapshot
+
+
+@pytest.mark.parametrize("move", [True, False])
+def test_write_back_replaces_destination(journal_file, move):
+    """Ensure clerk.files.write_back copies contents over and keeps permissions"""
+    journal_file.chmod(0o600)
+    source = journal_file.with_name("edited.md")
+    source.write_text("# Monday\nedited\n")
+    write_back(source, journal_file, fsync=True, move=move)
+    assert journal_file.read_text() == "# Monday\nedited\n"
+    assert journal_file.stat().st_mode & 0o777 == 0o600
+    assert source.exists() != move
@@ -0,0 +1,85 @@
+"""Tests for handing the terminal over to the editor"""
+import datetime
+import os
+import pathlib
+import pytest
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from clerk.handoff import can_hand_off
+from clerk.locks import lock_path
+
+
+pytestmark = pytest.mark.skipif(not can_hand_off(), reason="needs fork and /bin/sh")
+
+
+def hand_off_to(home: str, editor_script: str):
+    """Run `journal` with a shell script as the editor, returning its pid, the journal and the data directory"""
+    journals = pathlib.Path(home, "journals")
+    journals.mkdir()
+    editor = pathlib.Path(home, "editor")
+    editor.write_text(f"#!/bin/sh\n{editor_script}\n")
+    editor.chmod(0o755)
+    pathlib.Path(home, ".clerkrc").write_text(
+        f"[DEFAULT]\njournal_directory={journals}\npreferred_editor='{editor}'\n"
+        "date_format=%%Y-%%m-%%d\nfile_extension=md\n"
+    )
+    data = pathlib.Path(home, "data", "clerk")
+    data.mkdir(parents=True)
+    env = dict(os.environ, HOME=home, XDG_DATA_HOME=str(data.parent))
+    code = (
+        "import os; print(os.getpid(), flush=True); from clerk.app import main; main()"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=pathlib.Path(__file__).parents[1],
+    )
+    journal = pathlib.Path(journals, f"{datetime.date.today():%Y-%m-%d}.md")
+    deadline = time.monotonic() + 5
+    while lock_path(data, journal.name).exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return result.stdout.strip(), journal, data
+
+
+def test_journal_execs_editor_and_finisher_writes_back():
+    """Ensure `journal` becomes the editor, and the journal is copied back once it exits"""
+    with tempfile.TemporaryDirectory() as home:
+        pid, journal, data = hand_off_to(home, 'echo "edited by $$" >> "$1"')
+        # the editor ran in the process that started as python
+        assert journal.read_text() == f"edited by {pid}\n"
+        assert not pathlib.Path(data, journal.name).exists()
+        assert not lock_path(data, journal.name).exists()
+
+
+def test_finisher_ignores_helpers_the_editor_leaves_running():
+    """Ensure a background process the editor starts doesn't hold up writing back"""
+    with tempfile.TemporaryDirectory() as home:
+        helper = pathlib.Path(home, "helper.pid")
+        script = f'sleep 30 >/dev/null 2>&1 &\necho $! > {helper}\necho edited >> "$1"'
+        try:
+            _, journal, data = hand_off_to(home, script)
+            assert journal.read_text() == "edited\n"
+            assert not lock_path(data, journal.name).exists()
+        finally:
+            os.kill(int(helper.read_text()), signal.SIGTERM)
+
+
+def test_hand_off_only_when_nothing_runs_after_the_editor(make_app):
+    """Ensure journals with JOURNAL_CLOSED plugins (or live sync) wait for the editor"""
+    app = make_app()
+    app.may_hand_off = True
+    session = app.prepare_journal("2021-01-04.md")
+    assert app.can_hand_off(session)
+    app.hooks["JOURNAL_CLOSED"] = ["formatter"]
+    assert not app.can_hand_off(session)
+    app.hooks["JOURNAL_CLOSED"] = []
+    app.live_sync = True
+    assert not app.can_hand_off(session)
+    app.abandon_journal(session)
@@ -0,0 +1,224 @@
+"""Tests for running plugin callbacks over journal documents"""
+import asyncio
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+from unittest.mock import MagicMock
+
+from clerk.edits import Append
+from clerk.edits import Document
+from clerk.edits import Prepend
+from clerk.edits import returns_edits
+from clerk.hooks import run_document
+from clerk.hooks import run_pipeline
+
+
+def make_extension(name: str, callback) -> MagicMock:
+    """Build a stand-in for an installed plugin's entry point"""
+    extension = MagicMock()
+    extension.name = name
+    extension.load.return_value = callback
+    return extension
+
+
+def test_run_pipeline_chains_callbacks_in_order():
+    """Ensure each callback receives the previous callback's output"""
+    first = make_extension("first", lambda lines, conf: lines + ["first\n"])
+    second = make_extension("second", lambda lines, conf: lines + ["second\n"])
+    got, changed = run_pipeline([first, second], ["hello\n"], {})
+    assert got == ["hello\n", "first\n", "second\n"]
+    assert changed
+
+
+def test_run_pipeline_reports_unchanged_document():
+    """Ensure callbacks returning nothing (or the same lines) leave the document unchanged"""
+    noop = make_extension("noop", lambda lines, conf: None)
+    same = make_extension("same", lambda lines, conf: lines)
+    got, changed = run_pipeline([noop, same], ["hello\n"], {})
+    assert got == ["hello\n"]
+    assert not changed
+
+
+def test_run_pipeline_discards_unreturned_in_place_edits():
+    """Ensure a callback mutating its input without returning it makes no changes"""
+    mutate = make_extension("mutate", lambda lines, conf: lines.append("oops\n"))
+    got, changed = run_pipeline([mutate], ["hello\n"], {})
+    assert got == ["hello\n"]
+    assert not changed
+
+
+def test_run_pipeline_loads_each_plugin_once():
+    """Ensure plugin entry points are only resolved once per process"""
+    extension = make_extension("once", lambda lines, conf: None)
+    run_pipeline([extension], [], {})
+    run_pipeline([extension], [], {})
+    extension.load.assert_called_once()
+
+
+def test_run_pipeline_passes_plugin_config():
+    """Ensure callbacks receive their own config section"""
+    callback = MagicMock(return_value=None)
+    extension = make_extension("configured", callback)
+    run_pipeline([extension], [], {"configured": {"greeting": "hi"}})
+    callback.assert_called_once_with([], {"greeting": "hi"})
+
+
+def test_run_pipeline_awaits_async_callbacks():
+    """Ensure async callbacks are detected and awaited"""
+
+    async def greet(lines, conf):
+        """Append a greeting, asynchronously"""
+        return lines + ["hi\n"]
+
+    got, changed = run_pipeline([make_extension("greet", greet)], [], {})
+    assert got == ["hi\n"]
+    assert changed
+
+
+def test_run_pipeline_runs_concurrent_callbacks_together():
+    """Ensure concurrent callbacks overlap and their appended lines merge in configured order"""
+
+    async def weather(lines, conf):
+        """Append the weather after a delay"""
+        await asyncio.sleep(0.2)
+        return lines + ["sunny\n"]
+
+    def fortune(lines, conf):
+        """Append a fortune after a (blocking) delay"""
+        time.sleep(0.2)
+        return lines + ["you will write today\n"]
+
+    config = {
+        "weather": {"hook_concurrent": "yes"},
+        "fortune": {"hook_concurrent": "yes"},
+    }
+    extensions = [
+        make_extension("weather", weather),
+        make_extension("fortune", fortune),
+    ]
+    start = time.perf_counter()
+    got, _ = run_pipeline(extensions, ["# Monday\n"], config)
+    assert time.perf_counter() - start < 0.35
+    assert got == ["# Monday\n", "sunny\n", "you will write today\n"]
+
+
+def test_run_pipeline_reruns_concurrent_callbacks_that_rewrite():
+    """Ensure a concurrent callback that rewrote lines is re-applied to the merged document"""
+    config = {"upper": {"hook_concurrent": "yes"}, "sign": {"hook_concurrent": "yes"}}
+    upper = make_extension(
+        "upper", lambda lines, conf: [line.upper() for line in lines]
+    )
+    sign = make_extension("sign", lambda lines, conf: lines + ["bye\n"])
+    got, _ = run_pipeline([upper, sign], ["hello\n"], config)
+    assert got == ["HELLO\n", "BYE\n"]
+
+
+def test_run_pipeline_skips_callbacks_that_time_out():
+    """Ensure a callback exceeding its hook_timeout makes no changes and doesn't stall the chain"""
+
+    async def slow(lines, conf):
+        """Never finish in time"""
+        await asyncio.sleep(10)
+        return lines + ["too late\n"]
+
+    config = {"slow": {"hook_timeout": "0.05"}}
+    fast = make_extension("fast", lambda lines, conf: lines + ["done\n"])
+    start = time.perf_counter()
+    got, _ = run_pipeline([make_extension("slow", slow), fast], [], config)
+    assert time.perf_counter() - start < 1
+    assert got == ["done\n"]
+
+
+def test_sync_callbacks_that_time_out_dont_hold_up_exit():
+    """Ensure an abandoned synchronous callback doesn't keep the process alive"""
+    code = (
+        "import time\n"
+        "from tests.hooks_test import make_extension\n"
+        "from clerk.hooks import run_pipeline\n"
+        "slow = make_extension('slow', lambda lines, conf: time.sleep(10))\n"
+        "run_pipeline([slow], [], {'slow': {'hook_timeout': '0.1'}})\n"
+    )
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", code],
+        check=True,
+        capture_output=True,
+        cwd=pathlib.Path(__file__).parents[1],
+    )
+    assert time.perf_counter() - start < 5
+
+
+def test_run_pipeline_applies_edits():
+    """Ensure callbacks may return edit operations instead of a new document"""
+    sign = make_extension("sign", lambda lines, conf: [Append(["bye\n"])])
+    title = make_extension("title", lambda lines, conf: [Prepend(["# Monday\n"])])
+    got, changed = run_pipeline([sign, title], ["hello\n"], {})
+    assert got == ["# Monday\n", "hello\n", "bye\n"]
+    assert changed
+
+
+def test_run_pipeline_streams_generators():
+    """Ensure generator callbacks receive an iterator and their output becomes the document"""
+
+    def numbered(lines, conf):
+        """Number every line"""
+        for i, line in enumerate(lines):
+            yield f"{i}: {line}"
+
+    got, changed = run_pipeline([make_extension("numbered", numbered)], ["a\n"], {})
+    assert got == ["0: a\n"]
+    assert changed
+
+
+def test_run_document_gives_edit_callbacks_a_lazy_view():
+    """Ensure `returns_edits` callbacks can append without the journal being read into memory"""
+
+    @returns_edits
+    def sign(lines, conf):
+        """Sign off, if not already signed"""
+        if "bye\n" not in lines:
+            return [Append(["bye\n"])]
+
+    with tempfile.TemporaryDirectory() as d:
+        path = pathlib.Path(d, "2021-01-04.md")
+        path.write_text("hello\n")
+        with Document(path) as document:
+            assert run_document([make_extension("sign", sign)], document, {})
+            assert document._lines is None
+            document.save()
+        assert path.read_text() == "hello\nbye\n"
+
+
+def test_run_document_accepts_lines_from_edit_callbacks():
+    """Ensure a `returns_edits` callback may still return plain lines"""
+
+    @returns_edits
+    def shout(lines, conf):
+        """Upper-case every line"""
+        return [line.upper() for line in lines]
+
+    with tempfile.TemporaryDirectory() as d:
+        path = pathlib.Path(d, "2021-01-04.md")
+        path.write_text("hello\n")
+        with Document(path) as document:
+            assert run_document([make_extension("shout", shout)], document, {})
+            document.save()
+        assert path.read_text() == "HELLO\n"
+
+
+def test_callbacks_may_return_generators():
+    """Ensure a callback returning a generator (or map) works, in memory and on disk"""
+    shout = make_extension(
+        "shout", lambda lines, conf: (line.upper() for line in lines)
+    )
+    got, changed = run_pipeline([shout], ["a\n"], {})
+    assert got == ["A\n"] and changed
+    with tempfile.TemporaryDirectory() as d:
+        path = pathlib.Path(d, "2021-01-04.md")
+        path.write_text("hello\n")
+        with Document(path) as document:
+            assert run_document([shout], document, {})
+            document.save()
+        assert path.read_text() == "HELLO\n"
@@ -0,0 +1,112 @@
+"""Tests for clerk's queue of deferred hooks"""
+import os
+import pathlib
+import pytest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from clerk.jobs import drain
+from clerk.jobs import failed_directory
+from clerk.jobs import pending_jobs
+from clerk.jobs import queue_directory
+
+
+def make_extension(name: str, callback) -> MagicMock:
+    """Build a stand-in for an installed plugin's entry point"""
+    extension = MagicMock()
+    extension.name = name
+    extension.load.return_value = callback
+    return extension
+
+
+@pytest.fixture
+def app(make_app):
+    """Fixture to set up an Application with a deferred JOURNAL_CLOSED plugin."""
+    signature = make_extension("signature", lambda lines, conf: lines + ["-- me\n"])
+    config = {
+        "hooks": {"JOURNAL_CLOSED": "\nsignature"},
+        "signature": {"hook_deferred": "yes"},
+    }
+    return make_app(config=config, extensions={"signature": signature})
+
+
+@patch("clerk.jobs.start_worker")
+@patch("subprocess.run")
+def test_deferred_hook_runs_after_session(patched_run, patched_start_worker, app):
+    """Ensure deferred callbacks are queued by open_journal and applied by the worker"""
+    journal = pathlib.Path(app.journal_directory, "2021-01-04.md")
+    journal.write_text("hello\n")
+    os.chmod(journal, 0o600)
+    app.open_journal(journal.name)
+    assert journal.read_text() == "hello\n"
+    assert len(pending_jobs(app.temp_directory)) == 1
+    patched_start_worker.assert_called_once()
+
+    assert drain(app) == 1
+    assert journal.read_text() == "hello\n-- me\n"
+    assert pending_jobs(app.temp_directory) == []
+    assert journal.stat().st_mode & 0o777 == 0o600
+
+
+@patch("clerk.jobs.start_worker")
+@patch("subprocess.run")
+def test_deferred_hook_never_clobbers_newer_edit(
+    patched_run, patched_start_worker, app
+):
+    """Ensure a job is dropped if its journal changed after it was queued"""
+    journal = pathlib.Path(app.journal_directory, "2021-01-04.md")
+    journal.write_text("hello\n")
+    app.open_journal(journal.name)
+    journal.write_text("hello again\n")
+
+    assert drain(app) == 0
+    assert journal.read_text() == "hello again\n"
+    assert pending_jobs(app.temp_directory) == []
+    assert len(list(failed_directory(app.temp_directory).iterdir())) == 1
+
+
+@patch("clerk.jobs.start_worker")
+@patch("subprocess.run")
+def test_deferred_hook_waits_while_journal_is_open(
+    patched_run, patched_start_worker, app
+):
+    """Ensure a job stays queued while its journal is open in another session"""
+    journal = pathlib.Path(app.journal_directory, "2021-01-04.md")
+    journal.write_text("hello\n")
+    app.open_journal(journal.name)
+    pathlib.Path(app.temp_directory, journal.name).touch()
+
+    assert drain(app) == 0
+    assert len(pending_jobs(app.temp_directory)) == 1
+
+
+@patch("clerk.jobs.start_worker")
+@patch("subprocess.run")
+def test_failing_deferred_hook_is_recorded(patched_run, patched_start_worker, app):
+    """Ensure a job whose callback raises is moved out of the queue with its traceback"""
+
+    def broken(lines, conf):
+        """Fail"""
+        raise RuntimeError("no network")
+
+    app.extensions["signature"].load.return_value = broken
+    journal = pathlib.Path(app.journal_directory, "2021-01-04.md")
+    journal.write_text("hello\n")
+    app.open_journal(journal.name)
+
+    assert drain(app) == 0
+    (failed,) = failed_directory(app.temp_directory).iterdir()
+    assert "no network" in failed.read_text()
+
+
+def test_unreadable_job_is_moved_aside(app):
+    """Ensure a corrupt job file doesn't block the jobs queued after it"""
+    queue = queue_directory(app.temp_directory)
+    queue.mkdir(parents=True)
+    pathlib.Path(queue, "00000000000000000001-1.json").write_text('{"version": 1')
+    pathlib.Path(queue, "00000000000000000002-1.json").write_text("{}")
+    assert drain(app) == 0
+    assert pending_jobs(app.temp_directory) == []
+    failed = sorted(failed_directory(app.temp_directory).iterdir())
+    assert len(failed) == 2
+    assert "unreadable job" in failed[0].read_text()
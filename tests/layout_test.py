@@ -0,0 +1,101 @@
+"""Tests for sharded journal directory layouts"""
+import datetime
+import os
+import pathlib
+import pytest
+from unittest.mock import patch
+
+from clerk.archive import Archive
+from clerk.archive import archive_journals
+from clerk.archive import archive_path
+from clerk.catalog import Catalog
+from clerk.cli import main
+from clerk.layout import migrate_layout
+from clerk.locks import JournalLock
+
+
+@pytest.fixture
+def app(make_app):
+    """Fixture to set up a flat journal directory, with a year/month layout configured."""
+    names = ["2020-12-31.md", "2021-01-04.md", "2021-02-01.md"]
+    journals = {name: f"<{name}>\n" for name in names}
+    journals["notes/2021-01-05.md"] = "hi\n"
+    return make_app(journals, {"DEFAULT": {"layout": "%Y/%m/"}})
+
+
+def test_filenames_follow_the_layout(app):
+    """Ensure journals are named under their shard, and parsed back from it"""
+    day = datetime.datetime(2021, 1, 4)
+    assert app.convert_to_filename(day) == "2021/01/2021-01-04.md"
+    assert app.convert_from_filename("2021/01/2021-01-04.md") == day
+
+
+def test_migrate_layout_moves_journals_into_shards(app):
+    """Ensure migrating moves only journals filed in the previous layout, and resumes"""
+    root = pathlib.Path(app.journal_directory)
+    with JournalLock(app.temp_directory, "2021-02-01.md"):
+        moves = migrate_layout(app)
+    assert {m.source: m.status for m in moves} == {
+        "2020-12-31.md": "moved",
+        "2021-01-04.md": "moved",
+        "2021-02-01.md": "busy",
+    }
+    assert pathlib.Path(root, "2021", "01", "2021-01-04.md").read_text() == (
+        "<2021-01-04.md>\n"
+    )
+    assert pathlib.Path(root, "notes", "2021-01-05.md").exists()
+    # once it's closed, running it again finishes the job
+    assert [m.source for m in migrate_layout(app)] == ["2021-02-01.md"]
+    assert sorted(os.listdir(root)) == ["2020", "2021", "notes"]
+    assert migrate_layout(app) == []
+
+
+def test_catalog_relists_only_changed_shards(app):
+    """Ensure the catalog finds journals in shards, and notices a shard changing"""
+    migrate_layout(app)
+    assert Catalog(app).filenames == [
+        "2020/12/2020-12-31.md",
+        "2021/01/2021-01-04.md",
+        "2021/02/2021-02-01.md",
+    ]
+    shard = pathlib.Path(app.journal_directory, "2021", "01")
+    pathlib.Path(shard, "2021-01-06.md").write_text("hi\n")
+    with patch("clerk.catalog.os.scandir", wraps=os.scandir) as scandir:
+        catalog = Catalog(app)
+    assert [call.args[0] for call in scandir.call_args_list] == [
+        os.path.join(app.journal_directory, "2021/01")
+    ]
+    assert "2021/01/2021-01-06.md" in catalog.filenames
+
+
+def test_open_journal_in_a_shard(app):
+    """Ensure a new journal's shard is created, and it's written back there"""
+    with patch.object(app, "run_editor"):
+        app.open_journal("2022/03/2022-03-02.md")
+    assert pathlib.Path(app.journal_directory, "2022", "03", "2022-03-02.md").exists()
+
+
+def test_migrate_layout_renames_archived_journals(app):
+    """Ensure archived journals are renamed in place, and still found"""
+    app.layout = ""  # archived before the layout was configured
+    archive_journals(app, 1)
+    app.layout = "%Y/%m"
+    moves = migrate_layout(app)
+    assert {m.destination for m in moves} == {
+        "2020/12/2020-12-31.md",
+        "2021/01/2021-01-04.md",
+        "2021/02/2021-02-01.md",
+    }
+    with Archive(archive_path(app.journal_directory)) as archive:
+        assert archive.read("2021/01/2021-01-04.md") == b"<2021-01-04.md>\n"
+    assert len(Catalog(app)) == 3
+
+
+def test_migrate_layout_command(app, capsys):
+    """Ensure `clerk migrate-layout --dry-run` lists the moves without making them"""
+    with patch("clerk.cli.create_application", return_value=app):
+        assert main(["migrate-layout", "--dry-run"]) == 0
+    out = capsys.readouterr().out
+    assert "2021-01-04.md -> 2021/01/2021-01-04.md" in out
+    assert "Would move 3 journals into the layout '%Y/%m'" in out
+    assert pathlib.Path(app.journal_directory, "2021-01-04.md").exists()
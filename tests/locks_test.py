@@ -0,0 +1,53 @@
+"""Tests for the locks marking which journals are open"""
+import json
+import pathlib
+import pytest
+import socket
+import tempfile
+
+from clerk.locks import JournalLock
+from clerk.locks import JournalLocked
+from clerk.locks import is_open
+from clerk.locks import lock_path
+
+
+@pytest.fixture
+def user_data_dir():
+    """Fixture to set up user data directory."""
+    with tempfile.TemporaryDirectory() as t:
+        yield pathlib.Path(t)
+
+
+def test_lock_excludes_other_sessions(user_data_dir):
+    """Ensure a held lock stops the journal being opened again, until it's released"""
+    with JournalLock(user_data_dir, "2021-01-04.md") as lock:
+        assert is_open(user_data_dir, "2021-01-04.md")
+        with pytest.raises(JournalLocked) as e:
+            JournalLock(user_data_dir, "2021-01-04.md").acquire()
+        assert e.value.owner["host"] == socket.gethostname()
+        assert lock.path.exists()
+    assert not lock.path.exists()
+    assert not is_open(user_data_dir, "2021-01-04.md")
+
+
+def test_crashed_session_is_recovered(user_data_dir):
+    """Ensure a temporary copy left behind by a crashed session is moved aside"""
+    temporary_copy = pathlib.Path(user_data_dir, "2021-01-04.md")
+    temporary_copy.write_text("unsaved\n")
+    path = lock_path(user_data_dir, "2021-01-04.md")
+    path.parent.mkdir()
+    path.write_text(json.dumps({"pid": 0, "host": socket.gethostname()}))
+    assert not is_open(user_data_dir, "2021-01-04.md")
+    with JournalLock(user_data_dir, "2021-01-04.md") as lock:
+        assert lock.recovered.read_text() == "unsaved\n"
+        assert lock.recovered.parent.name == "recovered"
+    assert not temporary_copy.exists()
+
+
+def test_temporary_copy_without_lock_is_open(user_data_dir):
+    """Ensure a temporary copy with no lock file (from an older clerk) counts as open"""
+    pathlib.Path(user_data_dir, "2021-01-04.md").write_text("hi\n")
+    assert is_open(user_data_dir, "2021-01-04.md")
+    with pytest.raises(JournalLocked):
+        JournalLock(user_data_dir, "2021-01-04.md").acquire()
+    assert not lock_path(user_data_dir, "2021-01-04.md").exists()
@@ -1,6 +1,7 @@
 """Tests the clerk.parse functions behave as expected"""
 import datetime
 import pytest
+import time
 from unittest.mock import patch
 
 from clerk.parse import parse_english_to_date
@@ -67,3 +68,46 @@ def test_parse_english_to_date_last_next_this(todays_date, english, expected_dat
     _d = datetime.datetime.fromisoformat(expected_date)
     expectation = (_d.year, _d.month, _d.day)
     assert got == expectation
+
+
+@pytest.mark.parametrize(
+    "english, days",
+    [
+        ("1 day ago", -1),
+        ("a week ago", -7),
+        ("two weeks from today", 14),
+        ("twenty-one days ago", -21),
+        ("one hundred and five days from now", 105),
+        ("  Three   DAYS ago ", -3),
+    ],
+)
+def test_parse_many_quantities(english, days):
+    """Ensure clerk.parse.parse_many understands number words, units and spacing"""
+    reference = datetime.datetime(2021, 1, 4, 9, 30)
+    (got,) = parse.parse_many([english], reference)
+    assert got == reference + datetime.timedelta(days=days)
+
+
+@pytest.mark.parametrize(
+    "english", ["", "someday", "days ago", "two fortnights ago", "last funday"]
+)
+def test_parse_english_to_date_rejects_unknown_input(english):
+    """Ensure clerk.parse.parse_english_to_date raises ValueError for unparseable input"""
+    with pytest.raises(ValueError):
+        parse_english_to_date(english)
+
+
+PARSE_MANY_BUDGET_SECONDS = 0.5
+
+
+def test_parse_many_throughput():
+    """Benchmark parse_many over a large batch of expressions sharing one reference date"""
+    phrases = ["today", "yesterday", "last monday", "next friday", "three days ago"]
+    expressions = [f"{n} days ago" for n in range(1000)] + phrases * 2000
+    reference = datetime.datetime(2021, 1, 4)
+    start = time.perf_counter()
+    got = parse.parse_many(expressions, reference)
+    elapsed = time.perf_counter() - start
+    assert len(got) == len(expressions)
+    assert got[999] == reference - datetime.timedelta(days=999)
+    assert elapsed < PARSE_MANY_BUDGET_SECONDS
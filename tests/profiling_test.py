@@ -0,0 +1,106 @@
+"""Tests for clerk's session profiling"""
+import json
+import pathlib
+import pytest
+import tempfile
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from clerk import profiling
+from clerk.edits import Append
+from clerk.edits import Document
+from clerk.edits import returns_edits
+from clerk.hooks import run_document
+from clerk.hooks import run_pipeline
+
+
+@pytest.fixture
+def user_data_dir():
+    """Fixture to set up an empty user data directory."""
+    with tempfile.TemporaryDirectory() as t:
+        yield t
+
+
+def test_span_is_a_no_op_when_not_profiling():
+    """Ensure spans record nothing unless a profile was started"""
+    assert not profiling.is_profiling()
+    with profiling.span("nothing") as details:
+        details["ignored"] = True
+    assert isinstance(profiling.span("nothing"), profiling.NullSpan)
+
+
+@pytest.mark.parametrize("format", ["json", "trace"])
+def test_profile_records_callbacks(format, user_data_dir):
+    """Ensure callbacks are timed, with the lines they changed, and saved in the requested format"""
+    extension = MagicMock()
+    extension.name = "shout"
+    extension.load.return_value = lambda lines, conf: [line.upper() for line in lines]
+    profiling.start(format)
+    run_pipeline([extension], ["a\n", "b\n", "C\n"], {})
+    path = profiling.stop(user_data_dir)
+    with open(path) as f:
+        saved = json.load(f)
+    if format == "trace":
+        (event,) = [e for e in saved["traceEvents"] if e["cat"] == "callback"]
+        assert event["ph"] == "X" and event["name"] == "shout"
+        assert event["args"]["lines_changed"] == 2
+    else:
+        (span,) = [s for s in saved["spans"] if s["category"] == "callback"]
+        assert span["name"] == "shout"
+        assert span["args"]["lines_changed"] == 2
+        assert span["wall_us"] >= 0 and span["cpu_us"] >= 0
+
+
+def test_profile_records_lines_changed_in_documents(user_data_dir):
+    """Ensure callbacks run over on-disk documents record the lines they changed"""
+
+    @returns_edits
+    def sign(lines, conf):
+        """Sign off"""
+        return [Append(["bye\n"])]
+
+    extension = MagicMock()
+    extension.name = "sign"
+    extension.load.return_value = sign
+    path = pathlib.Path(user_data_dir, "2021-01-04.md")
+    path.write_text("hello\n")
+    profiling.start("json")
+    with Document(path) as document:
+        run_document([extension], document, {})
+    with open(profiling.stop(user_data_dir)) as f:
+        saved = json.load(f)
+    (span,) = [s for s in saved["spans"] if s["category"] == "callback"]
+    assert span["args"]["lines_changed"] == 1
+
+
+def test_profile_start_honours_environment():
+    """Ensure CLERK_PROFILE turns profiling on"""
+    with patch.dict("os.environ", {profiling.PROFILE_ENV: "trace"}):
+        profiler = profiling.start()
+    assert profiler.format == "trace"
+    profiling._profiler = None
+    with patch.dict("os.environ", {profiling.PROFILE_ENV: ""}):
+        assert profiling.start() is None
+
+
+def test_regressions_flag_slower_phases(user_data_dir):
+    """Ensure the history highlights phases slower than their median"""
+    for wall_us in [1000, 1100, 900, 5000]:
+        profiling.append_history(
+            user_data_dir, {"started": "", "wall_us": {"timestamp": wall_us}}
+        )
+    (report,) = profiling.regressions(profiling.read_history(user_data_dir))
+    assert report["median_ms"] == 1.0
+    assert report["regressed"]
+
+
+@patch("clerk.app.open_journals", return_value=0)
+def test_journal_profile_flag(patched_open_journals, user_data_dir):
+    """Ensure `journal --profile` strips the flag and saves a profile"""
+    with patch("clerk.app.temp_directory_path", lambda: user_data_dir):
+        with patch("sys.argv", ["journal", "--profile", "yesterday"]):
+            from clerk.app import main
+
+            assert main() == 0
+    patched_open_journals.assert_called_once_with(["yesterday"])
+    assert len(profiling.read_history(user_data_dir)) == 1
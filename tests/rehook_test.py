@@ -0,0 +1,87 @@
+"""Tests for re-running hooks over existing journals"""
+import datetime
+import os
+import pathlib
+import pytest
+from unittest.mock import patch
+
+from clerk.cli import main
+from clerk.extensions import Extension
+from clerk.rehook import rehook
+
+
+def title(lines, conf):
+    """A plugin that adds a title to untitled journals"""
+    if not lines or not lines[0].startswith("#"):
+        return ["# Journal\n"] + lines
+
+
+@pytest.fixture
+def app(make_app):
+    """Fixture to set up an Application with a week of journals and a JOURNAL_OPENED plugin."""
+    journals = {f"2021-01-{day:02d}.md": "hi\n" for day in range(4, 11)}
+    journals["2021-01-10.md"] = "# Sunday\n"
+    config = {"hooks": {"JOURNAL_OPENED": "\ntitle"}}
+    extensions = {"title": Extension("title", "tests.rehook_test:title")}
+    return make_app(journals, config, extensions)
+
+
+def contents(app):
+    """The text of each journal, by filename"""
+    return {
+        path.name: path.read_text()
+        for path in sorted(pathlib.Path(app.journal_directory).iterdir())
+    }
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_rehook_rewrites_journals_in_range(jobs, app):
+    """Ensure only journals in the range are rewritten, in or out of process"""
+    since, until = datetime.date(2021, 1, 6), datetime.date(2021, 1, 10)
+    outcomes = rehook(app, "JOURNAL_OPENED", since, until, jobs=jobs)
+    assert sorted((o.filename, o.status) for o in outcomes) == [
+        ("2021-01-06.md", "changed"),
+        ("2021-01-07.md", "changed"),
+        ("2021-01-08.md", "changed"),
+        ("2021-01-09.md", "changed"),
+        ("2021-01-10.md", "unchanged"),
+    ]
+    got = contents(app)
+    assert got["2021-01-05.md"] == "hi\n"
+    assert got["2021-01-06.md"] == "# Journal\nhi\n"
+    assert got["2021-01-10.md"] == "# Sunday\n"
+
+
+def test_rehook_keeps_journal_permissions(app):
+    """Ensure a rewritten journal keeps its mode"""
+    journal = pathlib.Path(app.journal_directory, "2021-01-04.md")
+    os.chmod(journal, 0o600)
+    rehook(app, "JOURNAL_OPENED", until=datetime.date(2021, 1, 4), jobs=1)
+    assert journal.read_text() == "# Journal\nhi\n"
+    assert journal.stat().st_mode & 0o777 == 0o600
+    assert sorted(os.listdir(app.journal_directory))[0] == "2021-01-04.md"
+
+
+def test_rehook_dry_run_changes_nothing(app):
+    """Ensure a dry run reports what would change without writing"""
+    before = contents(app)
+    outcomes = rehook(app, "JOURNAL_OPENED", dry_run=True, jobs=1)
+    assert [(o.status, o.added, o.removed) for o in outcomes][:1] == [("changed", 1, 0)]
+    assert contents(app) == before
+
+
+def test_rehook_skips_open_journals(app):
+    """Ensure journals open in an editor are left alone"""
+    pathlib.Path(app.temp_directory, "2021-01-04.md").write_text("hi\n")
+    (outcome,) = rehook(app, "JOURNAL_OPENED", until=datetime.date(2021, 1, 4), jobs=1)
+    assert outcome.status == "busy"
+    assert contents(app)["2021-01-04.md"] == "hi\n"
+
+
+def test_rehook_command_summarizes(app, capsys):
+    """Ensure `clerk rehook` reports a summary of what it did"""
+    with patch("clerk.cli.create_application", return_value=app):
+        assert main(["rehook", "JOURNAL_OPENED", "--dry-run", "--jobs", "1"]) == 0
+    out = capsys.readouterr().out
+    assert "2021-01-04.md: +1 -0\n" in out
+    assert "JOURNAL_OPENED: would change 6 of 7 journals (1 unchanged)" in out
@@ -0,0 +1,80 @@
+"""Tests for clerk's full-text search index"""
+import pathlib
+import pytest
+
+from clerk.search import SearchIndex
+from clerk.search import decode_postings
+from clerk.search import encode_postings
+from clerk.search import index_path
+from clerk.search import refresh_entry
+
+
+@pytest.fixture
+def app(make_app):
+    """Fixture to set up an Application with a few journals."""
+    return make_app(
+        {
+            "2021-01-04.md": "# Monday\nwent hiking\nhiking was great\n",
+            "2021-01-05.md": "# Tuesday\nwent hiking with a friend\n",
+            "2021-01-06.md": "# Wednesday\nstayed in\n",
+            "notes.txt": "hiking hiking hiking\n",
+        }
+    )
+
+
+def test_postings_round_trip():
+    """Ensure line numbers survive varint delta encoding"""
+    line_numbers = [0, 1, 5, 127, 128, 300, 70000]
+    assert decode_postings(encode_postings(line_numbers)) == line_numbers
+
+
+def test_search_ranks_matching_journals(app):
+    """Ensure journals mentioning a term more often rank first"""
+    with SearchIndex(app) as index:
+        assert index.rescan() == 3
+        results = index.search("Hiking")
+    assert [r.filename for r in results] == ["2021-01-04.md", "2021-01-05.md"]
+    assert results[0].line_numbers == [1, 2]
+
+
+def test_search_requires_every_term(app):
+    """Ensure only journals containing all query terms are returned"""
+    with SearchIndex(app) as index:
+        index.rescan()
+        results = index.search("hiking friend")
+    assert [r.filename for r in results] == ["2021-01-05.md"]
+
+
+def test_search_by_date_lists_newest_first(app):
+    """Ensure results can be ordered by date instead of rank"""
+    with SearchIndex(app) as index:
+        index.rescan()
+        results = index.search("went", by_date=True)
+    assert [r.filename for r in results] == ["2021-01-05.md", "2021-01-04.md"]
+
+
+def test_rescan_only_reindexes_changed_journals(app):
+    """Ensure a rescan picks up edits and deletions, and skips untouched journals"""
+    with SearchIndex(app) as index:
+        index.rescan()
+        pathlib.Path(app.journal_directory, "2021-01-06.md").write_text("hiking!\n")
+        pathlib.Path(app.journal_directory, "2021-01-05.md").unlink()
+        assert index.rescan() == 1
+        results = index.search("hiking")
+    assert [r.filename for r in results] == ["2021-01-04.md", "2021-01-06.md"]
+
+
+def test_refresh_entry_requires_existing_index(app):
+    """Ensure saving a journal doesn't create an index the user never asked for"""
+    refresh_entry(app, "2021-01-04.md")
+    assert not index_path(app.temp_directory).exists()
+
+
+def test_refresh_entry_updates_existing_index(app):
+    """Ensure saving a journal updates an existing index"""
+    with SearchIndex(app) as index:
+        index.rescan()
+    pathlib.Path(app.journal_directory, "2021-01-06.md").write_text("swimming\n")
+    refresh_entry(app, "2021-01-06.md")
+    with SearchIndex(app) as index:
+        assert [r.filename for r in index.search("swimming")] == ["2021-01-06.md"]
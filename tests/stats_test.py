@@ -0,0 +1,90 @@
+"""Tests for journal statistics"""
+import datetime
+import os
+import pathlib
+import pytest
+from unittest.mock import patch
+
+from clerk.archive import archive_journals
+from clerk.cli import main
+from clerk.stats import StatsCache
+from clerk.stats import Columns
+from clerk.stats import find_streaks
+from clerk.stats import per_month
+from clerk.stats import summarize
+
+
+@pytest.fixture
+def app(make_app):
+    """Fixture to set up an Application with two runs of consecutive journals."""
+    days = ["2021-01-30", "2021-01-31", "2021-02-01", "2021-02-05"]
+    return make_app(
+        {f"{day}.md": "# Today\n\nwent #running, then #Work\n" for day in days}
+    )
+
+
+def test_summarize_counts_words_lines_and_tags():
+    """Ensure headings, anchors and repeated tags are handled"""
+    summary = summarize("# Title\nsee a.html#anchor #Gym #gym\n#todo-list")
+    assert summary.words == 7
+    assert summary.lines == 3
+    assert summary.tags == {"gym": 2, "todo-list": 1}
+
+
+def test_find_streaks():
+    """Ensure the longest and latest runs of consecutive days are found"""
+    assert find_streaks([]) == ((0, 0), 0)
+    assert find_streaks([1, 2, 2, 3, 7, 8]) == ((3, 1), 2)
+
+
+def test_per_month_through_december():
+    """Ensure a range ending in December includes December"""
+    days = [
+        datetime.date(2023, m, d).toordinal() for m, d in [(11, 5), (12, 1), (12, 25)]
+    ]
+    columns = Columns(days, [10, 20, 30], [1, 1, 1])
+    assert per_month(columns) == [("2023-12", 2, 50), ("2023-11", 1, 10)]
+    one_month = Columns(days[1:], [20, 30], [1, 1])
+    assert per_month(one_month) == [("2023-12", 2, 50)]
+
+
+def test_report(app):
+    """Ensure totals, streaks, months and tags are reported"""
+    with StatsCache(app) as cache:
+        assert cache.refresh() == 4
+        report = cache.report(today=datetime.date(2021, 2, 6))
+    assert (report.journals, report.words, report.lines) == (4, 24, 12)
+    assert report.longest_streak == (3, datetime.date(2021, 1, 30))
+    assert report.current_streak == 1
+    assert report.months == [("2021-02", 2, 12), ("2021-01", 2, 12)]
+    assert report.tags == [("running", 4), ("work", 4)]
+    with StatsCache(app) as cache:
+        since = datetime.date(2021, 2, 1)
+        assert cache.report(since).journals == 2
+
+
+def test_refresh_rereads_only_changed_journals(app):
+    """Ensure edited, removed and archived journals are kept up to date"""
+    with StatsCache(app) as cache:
+        cache.refresh()
+        edited = pathlib.Path(app.journal_directory, "2021-02-05.md")
+        edited.write_text("#gym\n")
+        os.utime(edited, ns=(0, 1))
+        os.remove(pathlib.Path(app.journal_directory, "2021-01-30.md"))
+        assert cache.refresh() == 1
+        archive_journals(app, 1)
+        assert cache.refresh() == 0  # archiving keeps each journal's size and mtime
+        report = cache.report()
+    assert report.journals == 3
+    assert report.words == 13
+    assert ("gym", 1) in report.tags
+
+
+def test_stats_command(app, capsys):
+    """Ensure `clerk stats` prints a report, and fails on an empty range"""
+    with patch("clerk.cli.create_application", return_value=app):
+        assert main(["stats", "--jobs", "1"]) == 0
+        assert main(["stats", "--since", "2022-01-01"]) == 1
+    out = capsys.readouterr().out
+    assert "Journals: 4 (2021-01-30 to 2021-02-05)" in out
+    assert "#running" in out
@@ -0,0 +1,53 @@
+"""Tests for noticing saves to an open journal"""
+import contextlib
+import pathlib
+import pytest
+import tempfile
+import threading
+from unittest.mock import patch
+
+from clerk.watch import Watcher
+
+
+@pytest.fixture
+def journal_file():
+    """Fixture to create a small journal file."""
+    with tempfile.TemporaryDirectory() as d:
+        path = pathlib.Path(d, "2021-01-04.md")
+        path.write_text("# Monday\n")
+        yield path
+
+
+def watch_saves(journal_file, interval=1.0):
+    """Start a watcher that signals each save"""
+    saved = threading.Event()
+    watcher = Watcher(journal_file, saved.set, debounce=0.05, interval=interval)
+    return watcher.start(), saved
+
+
+@pytest.mark.parametrize("inotify", [True, False])
+def test_watcher_coalesces_bursts_of_writes(inotify, journal_file):
+    """Ensure a burst of writes produces a single save, with inotify or polling"""
+    polling = patch("clerk.watch.inotify_watch", return_value=None)
+    with contextlib.nullcontext() if inotify else polling:
+        watcher, saved = watch_saves(journal_file, interval=0.02)
+    try:
+        for i in range(5):
+            with open(journal_file, "a") as f:
+                f.write(f"line {i}\n")
+        assert saved.wait(5)
+    finally:
+        watcher.stop()
+    assert watcher.saves == 1
+    assert watcher.error is None
+
+
+def test_watcher_ignores_identical_rewrites(journal_file):
+    """Ensure rewriting a file with the same contents isn't reported as a save"""
+    watcher, saved = watch_saves(journal_file)
+    try:
+        journal_file.write_text("# Monday\n")
+        assert not saved.wait(0.3)
+    finally:
+        watcher.stop()
+    assert watcher.saves == 0